@@ -0,0 +1,237 @@
+import re
+import threading
+import unicodedata
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from CookbookAPI.indexes import VersionedIndex
+
+WORD_PATTERN = re.compile(r'\w+')
+
+indexes = {}
+indexes_lock = threading.Lock()
+
+
+def normalize(text):
+    # Case and accents don't matter for a match, so "Créme" finds "creme".
+    text = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+def max_typos(term):
+    # Short terms would match almost everything with a typo.
+    if len(term) <= 3:
+        return 0
+    if len(term) <= 6:
+        return 1
+    return 2
+
+
+class TrieNode:
+    __slots__ = ('children', 'ids')
+
+    def __init__(self):
+        self.children = {}
+        # The ids of the names with a word ending at this node.
+        self.ids = set()
+
+
+class NameIndex(VersionedIndex):
+    """
+    An in-process trie of the words of every name of a taxonomy model,
+    refreshed every AUTOCOMPLETE_REFRESH_INTERVAL seconds.
+    """
+    def __init__(self, model):
+        super(NameIndex, self).__init__()
+        self.model = model
+        self.version_key = 'autocomplete:{}'.format(model._meta.label_lower)
+        self.clear()
+
+    @property
+    def refresh_interval(self):
+        return settings.AUTOCOMPLETE_REFRESH_INTERVAL
+
+    def complete(self, query, limit):
+        """
+        Returns the ids and names of at most `limit` names whose words start
+        with the words of `query`, allowing a few typos per word. Names with
+        fewer typos, starting with the query and shorter names come first.
+        """
+        terms = WORD_PATTERN.findall(normalize(query))
+        if not terms:
+            return []
+        self.refresh()
+
+        with self.lock:
+            # Exact matches always rank first, so typos are only looked for
+            # when there are not enough of them.
+            results = self.rank(query, terms, limit, fuzzy=False)
+            if len(results) < limit:
+                results = self.rank(query, terms, limit, fuzzy=True)
+            return results
+
+    def rank(self, query, terms, limit, fuzzy):
+        distances = None
+        for term in terms:
+            matches = self.search(term, max(limit * 10, 100), max_typos(term) if fuzzy else 0)
+            if distances is None:
+                distances = matches
+            else:
+                distances = {
+                    pk: distance + matches[pk]
+                    for pk, distance in distances.items()
+                    if pk in matches
+                }
+        prefix = normalize(query).strip()
+        ranked = sorted(
+            distances,
+            key=lambda pk: (
+                distances[pk],
+                not self.normalized[pk].startswith(prefix),
+                len(self.names[pk]),
+                self.names[pk],
+            )
+        )
+        return [(pk, self.names[pk]) for pk in ranked[:limit]]
+
+    def search(self, term, max_candidates, typos):
+        """
+        Returns a dict of the ids with a word starting with `term`, with at
+        most `typos` edits, mapped to the number of edits.
+        """
+        if typos == 0:
+            node = self.root
+            for char in term:
+                node = node.children.get(char)
+                if node is None:
+                    return {}
+            return self.collect([(0, node)], max_candidates)
+
+        # The first character is taken as typed, which is rarely wrong and
+        # keeps the search to a small part of the trie.
+        first = self.root.children.get(term[0])
+        if first is None:
+            return {}
+        length = len(term)
+        # Distances above `typos` don't matter and are capped to `limit`.
+        limit = typos + 1
+        found = []
+        start = [min(value, limit) for value in [1] + list(range(length))]
+        if start[-1] <= typos:
+            found.append((start[-1], 1, first))
+
+        # Walks the trie with one row of the edit distance matrix per node
+        # and skips every branch which can't come within `typos` edits.
+        # Only the cells within `typos` of the diagonal can be that close.
+        stack = [(first, 1, start)]
+        while stack:
+            node, depth, previous = stack.pop()
+            depth += 1
+            low = max(1, depth - typos)
+            high = min(length, depth + typos)
+            for char, child in node.children.items():
+                row = [limit] * (length + 1)
+                row[0] = min(depth, limit)
+                best = row[0]
+                for index in range(low, high + 1):
+                    value = previous[index - 1] + (term[index - 1] != char)
+                    if row[index - 1] + 1 < value:
+                        value = row[index - 1] + 1
+                    if previous[index] + 1 < value:
+                        value = previous[index] + 1
+                    if value > limit:
+                        value = limit
+                    row[index] = value
+                    if value < best:
+                        best = value
+                if row[-1] <= typos:
+                    found.append((row[-1], depth, child))
+                # The minimum of a row never decreases further down, so a
+                # branch is done once its match can't get any closer.
+                if best <= typos and best < row[-1]:
+                    stack.append((child, depth, row))
+
+        found.sort(key=lambda match: (match[0], match[1]))
+        return self.collect([(distance, node) for distance, _, node in found], max_candidates)
+
+    def collect(self, found, max_candidates):
+        # Every word below a matching node starts with a match of the term.
+        # Shorter words are collected first.
+        distances = {}
+        for distance, node in found:
+            level = [node]
+            while level and len(distances) < max_candidates:
+                for current in level:
+                    for pk in current.ids:
+                        distances.setdefault(pk, distance)
+                level = [child for current in level for child in current.children.values()]
+            if len(distances) >= max_candidates:
+                break
+        return distances
+
+    def clear(self):
+        self.root = TrieNode()
+        self.names = {}
+        self.normalized = {}
+
+    def build(self):
+        for pk, name in self.model.objects.values_list('pk', 'name').iterator():
+            self.insert(pk, name)
+
+    def changed(self, names=None, removed=()):
+        """
+        Applies names, a dict of ids to new or changed names, and removed
+        ids once the current transaction commits.
+        """
+        super(NameIndex, self).changed(names or {}, removed)
+
+    def apply(self, names, removed):
+        for pk in removed:
+            self.delete(pk)
+        for pk, name in names.items():
+            self.delete(pk)
+            self.insert(pk, name)
+
+    def insert(self, pk, name):
+        self.names[pk] = name
+        self.normalized[pk] = normalize(name)
+        for word in set(WORD_PATTERN.findall(self.normalized[pk])):
+            node = self.root
+            for char in word:
+                node = node.children.setdefault(char, TrieNode())
+            node.ids.add(pk)
+
+    def delete(self, pk):
+        if self.names.pop(pk, None) is None:
+            return
+        for word in set(WORD_PATTERN.findall(self.normalized.pop(pk))):
+            path = [self.root]
+            for char in word:
+                path.append(path[-1].children[char])
+            path[-1].ids.discard(pk)
+            # Drops the nodes which no longer lead to a word.
+            for char, parent, node in zip(reversed(word), reversed(path[:-1]), reversed(path[1:])):
+                if node.ids or node.children:
+                    break
+                del parent.children[char]
+
+
+def get_index(model):
+    with indexes_lock:
+        if model not in indexes:
+            indexes[model] = NameIndex(model)
+        return indexes[model]
+
+
+def register(model):
+    """
+    Keeps the index of `model` up to date with its saved and deleted
+    objects. Bulk writes have to call NameIndex.changed themselves.
+    """
+    def saved(sender, instance, **kwargs):
+        get_index(sender).changed(names={instance.pk: instance.name})
+
+    def deleted(sender, instance, **kwargs):
+        get_index(sender).changed(removed=[instance.pk])
+
+    post_save.connect(saved, sender=model, weak=False, dispatch_uid='autocomplete-saved')
+    post_delete.connect(deleted, sender=model, weak=False, dispatch_uid='autocomplete-deleted')
@@ -0,0 +1,33 @@
+from functools import wraps
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def condition(validators):
+    """
+    Answers conditional GETs of an APIView handler with 304 Not Modified.
+    `validators(request, *args, **kwargs)` returns the strong ETag, without
+    quotes, and the last modification of the response, or None if the
+    response has none. A matching request doesn't call the handler, so the
+    validators have to be much cheaper to compute than the response.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapped(view, request, *args, **kwargs):
+            validated = validators(request, *args, **kwargs)
+            if validated is None:
+                return handler(view, request, *args, **kwargs)
+
+            etag, last_modified = validated
+            etag = '"{}"'.format(etag)
+            timestamp = int(last_modified.timestamp())
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is None:
+                response = handler(view, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(timestamp)
+            return response
+        return wrapped
+    return decorator
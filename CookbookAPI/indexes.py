@@ -0,0 +1,81 @@
+import time
+import random
+import threading
+from django.core.cache import cache
+from django.db import transaction
+
+
+class VersionedIndex:
+    """
+    The base of an index which every process keeps in memory. Changes of
+    the own process are applied when they are committed. Changes of other
+    processes are noticed through a version in the cache, which is checked
+    at most every `refresh_interval` seconds, and cause a rebuild.
+    Subclasses implement clear, build and apply.
+    """
+    version_key = None
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.built = False
+        self.version = None
+        self.checked = 0
+
+    @property
+    def refresh_interval(self):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def build(self):
+        raise NotImplementedError
+
+    def apply(self, *args):
+        raise NotImplementedError
+
+    def refresh(self):
+        now = time.monotonic()
+        if self.built and now - self.checked < self.refresh_interval:
+            return
+        version = cache.get(self.version_key)
+        with self.lock:
+            self.checked = now
+            if not self.built or version != self.version:
+                self.clear()
+                self.build()
+                self.built = True
+                self.version = version
+
+    def reset(self):
+        with self.lock:
+            self.clear()
+            self.built = False
+            self.version = None
+
+    def changed(self, *args):
+        """
+        Passes `args` to apply once the current transaction commits.
+        """
+        transaction.on_commit(lambda: self.commit(*args))
+
+    def commit(self, *args):
+        version = self.bump_version()
+        with self.lock:
+            if not self.built:
+                # The index is built on the first lookup.
+                return
+            self.apply(*args)
+            if self.version is not None and version == self.version + 1:
+                self.version = version
+            else:
+                # Another process changed the index since the last check.
+                self.checked = 0
+
+    def bump_version(self):
+        # Starts at a random number, so an evicted version doesn't repeat.
+        cache.add(self.version_key, random.randrange(1 << 62), timeout=None)
+        try:
+            return cache.incr(self.version_key)
+        except ValueError:
+            return None
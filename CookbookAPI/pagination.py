@@ -0,0 +1,136 @@
+import base64
+import json
+from django.db.models import Q
+from rest_framework import serializers
+
+# The range of the integer columns of every supported database.
+MIN_INTEGER = -(1 << 63)
+MAX_INTEGER = (1 << 63) - 1
+
+
+class KeysetPagination:
+    """
+    Paginates a queryset by seeking past the last row of the previous page
+    instead of counting rows with OFFSET, so every page costs the same
+    regardless of how deep into the list it is.
+    """
+    paginator_query_args = ['limit', 'cursor']
+    ordering = ('name', 'id')
+    # The types of the ordering fields, which a cursor has to match.
+    ordering_types = (str, int)
+    default_limit = 100
+    max_limit = 1000
+
+    def paginate_queryset(self, queryset, request):
+        """
+        Returns the requested page of `queryset` as a list, together with
+        the cursor pointing to the next page or None on the last page.
+        """
+        limit = self.get_limit(request)
+        position = self.decode_cursor(request.GET.get('cursor'))
+        return self.get_page(queryset, position, limit)
+
+    def get_page(self, queryset, position, limit):
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = queryset.filter(self.seek(position))
+
+        page = list(queryset[:limit + 1])
+        if len(page) <= limit:
+            return page, None
+
+        page = page[:limit]
+        return page, self.encode_cursor(page[-1])
+
+    def iterate_queryset(self, queryset, chunk_size):
+        """
+        Yields `queryset` as consecutive lists of at most `chunk_size` objects.
+        """
+        position = None
+        while True:
+            page, cursor = self.get_page(queryset, position, chunk_size)
+            if page:
+                yield page
+            if cursor is None:
+                return
+            position = self.position(page[-1])
+
+    def get_paginated_data(self, data, next_cursor):
+        return {
+            'next': next_cursor,
+            'results': data,
+        }
+
+    def get_limit(self, request):
+        limit = request.GET.get('limit')
+        if limit is None:
+            return self.default_limit
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise serializers.ValidationError({
+                'limit': ['A valid integer is required.']
+            })
+        if limit < 1:
+            raise serializers.ValidationError({
+                'limit': ['Ensure this value is greater than or equal to 1.']
+            })
+        return min(limit, self.max_limit)
+
+    def seek(self, position):
+        # (a, b) > (x, y)  <=>  a > x OR (a = x AND b > y)
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            step = {
+                '{}__gt'.format(field): position[index]
+            }
+            for previous in range(index):
+                step[self.ordering[previous]] = position[previous]
+            condition |= Q(**step)
+        return condition
+
+    def position(self, instance):
+        return [getattr(instance, field) for field in self.ordering]
+
+    def encode_cursor(self, instance):
+        encoded = json.dumps(self.position(instance)).encode('utf-8')
+        return base64.urlsafe_b64encode(encoded).decode('ascii')
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        except (ValueError, UnicodeError):
+            position = None
+        if not self.valid_position(position):
+            raise serializers.ValidationError({
+                'cursor': ['Invalid cursor.']
+            })
+        return position
+
+    def valid_position(self, position):
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            return False
+        for value, expected in zip(position, self.ordering_types):
+            # A bool is an int to Python, but not to the database.
+            if isinstance(value, bool) or not isinstance(value, expected):
+                return False
+            if expected is int and not MIN_INTEGER <= value <= MAX_INTEGER:
+                return False
+        return True
+
+
+def paginated_serializer(serializer_class):
+    """
+    Creates a serializer describing a single page of `serializer_class`
+    objects, which is used to document paginated responses.
+    """
+    name = serializer_class.__name__.replace('Serializer', 'PageSerializer')
+    return type(name, (serializers.Serializer,), {
+        'next': serializers.CharField(
+            allow_null=True,
+            help_text='The cursor of the next page or null on the last page.'
+        ),
+        'results': serializer_class(many=True),
+    })
@@ -0,0 +1,142 @@
+import uuid
+import hashlib
+import threading
+from collections import Counter
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+HIT = 'HIT'
+MISS = 'MISS'
+# The headers which are stored with a response, to answer conditional GETs.
+VALIDATORS = ('ETag', 'Last-Modified')
+
+# The hits and misses of every cached view of this process.
+counters = Counter()
+counters_lock = threading.Lock()
+
+
+def version_key(model):
+    return 'response-version:{}'.format(model._meta.label_lower)
+
+
+def response_key(request):
+    # The format is negotiated from the Accept header, not the path.
+    identity = '{} {}'.format(request.get_full_path(), request.accepted_renderer.format)
+    return 'response:{}'.format(hashlib.sha256(identity.encode('utf-8')).hexdigest())
+
+
+def bump_versions(*models):
+    """
+    Invalidates the cached responses which depend on any of `models` once
+    the current transaction commits.
+    """
+    def bump():
+        cache.set_many({version_key(model): uuid.uuid4().hex for model in models}, timeout=None)
+    # A response computed before the commit must not be cached as current.
+    transaction.on_commit(bump)
+
+
+def count(view, result):
+    with counters_lock:
+        counters[(view, result)] += 1
+
+
+def statistics():
+    """
+    Returns the hits and misses of the cached views of this process.
+    """
+    with counters_lock:
+        views = {}
+        for (view, result), value in counters.items():
+            views.setdefault(view, {'hits': 0, 'misses': 0})['hits' if result == HIT else 'misses'] += value
+    return {
+        'hits': sum(value['hits'] for value in views.values()),
+        'misses': sum(value['misses'] for value in views.values()),
+        'views': views,
+    }
+
+
+def cache_response(*models):
+    """
+    Caches the successful responses of a GET handler of an APIView until
+    any of `models` changes. The response is stored together with the
+    versions of the models it was computed from, so a hit takes a single
+    cache lookup. Streaming responses are not cached. An ETag or
+    Last-Modified header is stored as well and a hit matching it is
+    answered with 304 Not Modified.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapped(view, request, *args, **kwargs):
+            name = type(view).__name__
+            if connection.in_atomic_block:
+                # The response may contain writes which aren't committed.
+                return handler(view, request, *args, **kwargs)
+
+            key = response_key(request)
+            keys = [version_key(model) for model in models]
+            values = cache.get_many([key] + keys)
+            versions = [values.get(version) for version in keys]
+            cached = values.get(key)
+            if cached is not None and None not in versions and cached[0] == versions:
+                count(name, HIT)
+                _, content, content_type, headers = cached
+                response = get_conditional_response(
+                    request,
+                    etag=headers.get('ETag'),
+                    last_modified=parse_http_date_safe(headers.get('Last-Modified'))
+                )
+                if response is None:
+                    response = HttpResponse(content, content_type=content_type)
+                for header, value in headers.items():
+                    response[header] = value
+                response['X-Cache'] = HIT
+                return response
+
+            count(name, MISS)
+            if None in versions:
+                for version in keys:
+                    cache.add(version, uuid.uuid4().hex, timeout=None)
+                versions = [cache.get(version) for version in keys]
+            response = handler(view, request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                cache.set(
+                    key,
+                    (
+                        versions,
+                        response.content,
+                        response['Content-Type'],
+                        {header: response[header] for header in VALIDATORS if response.has_header(header)}
+                    ),
+                    timeout=settings.RESPONSE_CACHE_TIMEOUT
+                )
+            response['X-Cache'] = MISS
+            return response
+        return wrapped
+    return decorator
+
+
+def track(model):
+    """
+    Invalidates the cached responses depending on `model` when an object
+    of it is saved or deleted or its many to many relations change. Bulk
+    writes have to call bump_versions themselves.
+    """
+    def changed(sender, **kwargs):
+        bump_versions(model)
+
+    def relation_changed(sender, action, **kwargs):
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            bump_versions(model)
+
+    uid = 'response-cache-{}'.format(model._meta.label_lower)
+    post_save.connect(changed, sender=model, weak=False, dispatch_uid=uid)
+    post_delete.connect(changed, sender=model, weak=False, dispatch_uid=uid)
+    for field in model._meta.many_to_many:
+        m2m_changed.connect(relation_changed, sender=field.remote_field.through, weak=False, dispatch_uid=uid)
@@ -1,3 +1,4 @@
+import os
 import config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -29,6 +30,7 @@ INSTALLED_APPS = [
     'ingredients.apps.IngredientsConfig',
     'occasions.apps.OccasionsConfig',
     'recipes.apps.RecipesConfig',
+    'sync.apps.SyncConfig',
 ]
 
 MIDDLEWARE = [
@@ -120,3 +122,77 @@ MEDIA_ROOT  = config.MEDIA_ROOT
 MEDIA_URL = config.MEDIA_URL
 STATIC_ROOT  = config.STATIC_ROOT
 STATIC_URL = config.STATIC_URL
+
+# The messages of the render workers are written to stderr.
+LOGGING = getattr(config, 'LOGGING', {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'recipes': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+})
+
+# The cache is shared between the webserver and the render workers, so the
+# default backend stores it on disk.
+CACHES = getattr(config, 'CACHES', {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'CookbookAPI/cache'),
+    }
+})
+
+# Seconds a response of a list or detail view is cached, unless a write
+# invalidates it before.
+RESPONSE_CACHE_TIMEOUT = getattr(config, 'RESPONSE_CACHE_TIMEOUT', 600)
+
+# Seconds the facet counts of a set of filters are cached, unless a write
+# invalidates them before.
+FACETS_CACHE_TIMEOUT = getattr(config, 'FACETS_CACHE_TIMEOUT', 3600)
+
+# Seconds an autocomplete index is used before it checks for changes made
+# by other processes.
+AUTOCOMPLETE_REFRESH_INTERVAL = getattr(config, 'AUTOCOMPLETE_REFRESH_INTERVAL', 1.0)
+# Seconds the pantry index is used before it checks for changes made by
+# other processes.
+PANTRY_REFRESH_INTERVAL = getattr(config, 'PANTRY_REFRESH_INTERVAL', 1.0)
+# Seconds the similarity index is used before it checks for changes made
+# by other processes.
+SIMILARITY_REFRESH_INTERVAL = getattr(config, 'SIMILARITY_REFRESH_INTERVAL', 1.0)
+
+# Render workers, see `python manage.py renderworker`.
+# The maximum number of pdf renders running at the same time.
+RENDER_WORKER_CONCURRENCY = getattr(config, 'RENDER_WORKER_CONCURRENCY', 2)
+# The number of attempts before a render job is marked as failed.
+RENDER_MAX_ATTEMPTS = getattr(config, 'RENDER_MAX_ATTEMPTS', 5)
+# Seconds to wait before the first retry, doubled for every further attempt.
+RENDER_RETRY_BACKOFF = getattr(config, 'RENDER_RETRY_BACKOFF', 30)
+# Seconds after which a running job is considered abandoned and queued again.
+RENDER_JOB_LEASE = getattr(config, 'RENDER_JOB_LEASE', 15 * 60)
+# 'xvfb-run' starts an X server per render, 'display-pool' keeps one X server
+# per worker running and reuses it.
+RENDER_BACKEND = getattr(config, 'RENDER_BACKEND', 'xvfb-run')
+# Seconds a stopping worker waits for its running renders before it kills them.
+RENDER_SHUTDOWN_TIMEOUT = getattr(config, 'RENDER_SHUTDOWN_TIMEOUT', 30)
+# Seconds after which a single render is killed.
+RENDER_TIMEOUT = getattr(config, 'RENDER_TIMEOUT', 120)
+# The maximum address space in bytes of every process started by a render.
+RENDER_MEMORY_LIMIT = getattr(config, 'RENDER_MEMORY_LIMIT', 2 * 1024 ** 3)
+# Seconds after which the text extraction of a single pdf is killed.
+PDF_TEXT_TIMEOUT = getattr(config, 'PDF_TEXT_TIMEOUT', 60)
+
+# Lets the front proxy send recipe pdfs instead of a Python worker. Either
+# 'X-Accel-Redirect' (nginx) or 'X-Sendfile' (Apache, lighttpd) or None.
+RECIPE_FILE_ACCEL = getattr(config, 'RECIPE_FILE_ACCEL', None)
+# The internal nginx location mapped to MEDIA_ROOT for X-Accel-Redirect.
+RECIPE_FILE_ACCEL_PREFIX = getattr(config, 'RECIPE_FILE_ACCEL_PREFIX', '/protected-media/')
+
+# The PostgreSQL text search configuration of the recipe search, e.g. 'english'.
+SEARCH_CONFIG = getattr(config, 'SEARCH_CONFIG', 'simple')
@@ -0,0 +1,45 @@
+from rest_framework import serializers
+from CookbookAPI.autocomplete import get_index
+from CookbookAPI.responsecache import bump_versions
+from sync.models import Change
+
+# The number of names inserted or looked up per statement.
+BATCH_SIZE = 500
+
+
+class NameListSerializer(serializers.ListField):
+    """
+    Validates the body of a bulk request, a non-empty list of names.
+    """
+    child = serializers.CharField()
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('allow_empty', False)
+        super(NameListSerializer, self).__init__(**kwargs)
+
+
+def get_or_create_names(model, names):
+    """
+    Creates the missing entries of a taxonomy model with a unique `name`
+    and returns a dict which maps every given name to its id. Names which
+    exist already or are created concurrently are skipped by the database.
+    """
+    names = list(dict.fromkeys(names))
+    if not names:
+        return {}
+    model.objects.bulk_create(
+        [model(name=name) for name in names],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+    ids = {}
+    for start in range(0, len(names), BATCH_SIZE):
+        ids.update(
+            model.objects.filter(name__in=names[start:start + BATCH_SIZE]).values_list('name', 'id')
+        )
+    # bulk_create doesn't send post_save. Names which existed already are
+    # synced again, which clients apply like any other upsert.
+    get_index(model).changed(names={pk: name for name, pk in ids.items()})
+    bump_versions(model)
+    Change.objects.record(model, ids.values())
+    return ids
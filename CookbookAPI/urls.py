@@ -6,6 +6,7 @@ from rest_framework import permissions
 from rest_framework.decorators import api_view
 from drf_yasg import openapi
 from drf_yasg.views import get_schema_view
+from CookbookAPI.views import ResponseCacheView
 import config
 
 swagger_info = openapi.Info(
@@ -54,4 +55,6 @@ urlpatterns = [
     path('ingredients/', include('ingredients.urls'), name='ingredients'),
     path('occasions/', include('occasions.urls'), name='occasions'),
     path('recipes/', include('recipes.urls'), name='recipes'),
+    path('sync/', include('sync.urls'), name='sync'),
+    path('cache/', ResponseCacheView.as_view()),
 ] + required_urlpatterns
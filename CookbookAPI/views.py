@@ -0,0 +1,40 @@
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.renderers import JSONRenderer
+from drf_yasg.utils import swagger_auto_schema
+from drf_yasg import openapi
+from rest_framework.views import APIView
+from CookbookAPI.responsecache import statistics
+
+
+class JSONResponse(HttpResponse):
+    def __init__(self, data, **kwargs):
+        content = JSONRenderer().render(data)
+        kwargs['content_type'] = 'application/json'
+        super(JSONResponse, self).__init__(content, **kwargs)
+
+
+class ResponseCacheView(APIView):
+    @csrf_exempt
+    @swagger_auto_schema(
+        operation_description="""
+                              Gets the hits and misses of the response cache, in total and
+                              per view, counted by the process which serves the request.
+                              """,
+        responses={
+            200: openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'hits': openapi.Schema(type=openapi.TYPE_INTEGER),
+                    'misses': openapi.Schema(type=openapi.TYPE_INTEGER),
+                    'views': openapi.Schema(
+                        description='The hits and misses by the name of the view.',
+                        type=openapi.TYPE_OBJECT,
+                    ),
+                },
+            ),
+        },
+        tags=['Cache'],
+    )
+    def get(self, request):
+        return JSONResponse(statistics())
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class CuisinesConfig(AppConfig):
     name = 'cuisines'
+
+    def ready(self):
+        from CookbookAPI.autocomplete import register
+        from CookbookAPI.responsecache import track
+        register(self.get_model('Cuisine'))
+        track(self.get_model('Cuisine'))
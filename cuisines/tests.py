@@ -1,3 +1,28 @@
+import json
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from cuisines.models import Cuisine
 
-# Create your tests here.
+
+class CuisineBulkTests(TestCase):
+    def post(self, body):
+        return self.client.post('/cuisines/bulk/', data=json.dumps(body), content_type='application/json')
+
+    def test_names_are_created_once(self):
+        italian = Cuisine.objects.create(name='Italian')
+        with CaptureQueriesContext(connection) as context:
+            response = self.post(['Italian', 'Greek', 'Thai', 'Greek'])
+        self.assertEqual(response.status_code, 200)
+        # The insert, the lookup of the ids and the change log.
+        self.assertEqual(len(context.captured_queries), 3)
+        names = response.json()
+        self.assertEqual(set(names), {'Italian', 'Greek', 'Thai'})
+        self.assertEqual(names['Italian'], italian.pk)
+        self.assertEqual(Cuisine.objects.count(), 3)
+        self.assertEqual(self.post(['Greek']).json(), {'Greek': names['Greek']})
+
+    def test_body_must_be_a_list_of_names(self):
+        self.assertEqual(self.post({'name': 'Greek'}).status_code, 400)
+        self.assertEqual(self.post([]).status_code, 400)
+        self.assertEqual(self.post(['']).status_code, 400)
@@ -1,7 +1,9 @@
 from django.urls import path
-from cuisines.views import CuisineListView, CuisineDetailView
+from cuisines.views import CuisineListView, CuisineBulkView, CuisineAutocompleteView, CuisineDetailView
 
 urlpatterns = [
     path('', CuisineListView.as_view()),
+    path('bulk/', CuisineBulkView.as_view()),
+    path('autocomplete/', CuisineAutocompleteView.as_view()),
     path('<int:pk>/', CuisineDetailView.as_view()),
 ]
\ No newline at end of file
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class DietsConfig(AppConfig):
     name = 'diets'
+
+    def ready(self):
+        from CookbookAPI.autocomplete import register
+        from CookbookAPI.responsecache import track
+        register(self.get_model('Diet'))
+        track(self.get_model('Diet'))
@@ -1,7 +1,9 @@
 from django.urls import path
-from diets.views import DietListView, DietDetailView
+from diets.views import DietListView, DietBulkView, DietAutocompleteView, DietDetailView
 
 urlpatterns = [
     path('', DietListView.as_view()),
+    path('bulk/', DietBulkView.as_view()),
+    path('autocomplete/', DietAutocompleteView.as_view()),
     path('<int:pk>/', DietDetailView.as_view()),
 ]
\ No newline at end of file
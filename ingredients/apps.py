@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class IngredientsConfig(AppConfig):
     name = 'ingredients'
+
+    def ready(self):
+        from CookbookAPI.autocomplete import register
+        from CookbookAPI.responsecache import track
+        register(self.get_model('Ingredient'))
+        track(self.get_model('Ingredient'))
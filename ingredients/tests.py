@@ -1,3 +1,66 @@
-from django.test import TestCase
+import json
+from unittest import mock
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from CookbookAPI.autocomplete import get_index
+from ingredients.models import Ingredient
 
-# Create your tests here.
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    AUTOCOMPLETE_REFRESH_INTERVAL=60
+)
+class IngredientAutocompleteTests(TestCase):
+    names = ['Tomato', 'Tomato paste', 'Cherry tomatoes', 'Tofu', 'Basil', 'Crème fraîche']
+
+    def setUp(self):
+        self.index = get_index(Ingredient)
+        self.index.reset()
+        self.addCleanup(self.index.reset)
+        with self.captureOnCommitCallbacks(execute=True):
+            for name in self.names:
+                Ingredient.objects.create(name=name)
+
+    def complete(self, query, **params):
+        response = self.client.get('/ingredients/autocomplete/', dict(params, q=query))
+        self.assertEqual(response.status_code, 200)
+        return [result['name'] for result in response.json()['results']]
+
+    def test_prefix_matches(self):
+        self.assertEqual(self.complete('tom'), ['Tomato', 'Tomato paste', 'Cherry tomatoes'])
+        self.assertEqual(self.complete('cherry tom'), ['Cherry tomatoes'])
+        self.assertEqual(self.complete('creme'), ['Crème fraîche'])
+        self.assertEqual(self.complete('to', limit=2), ['Tofu', 'Tomato'])
+
+    def test_typos(self):
+        self.assertEqual(self.complete('tomatp'), ['Tomato', 'Tomato paste', 'Cherry tomatoes'])
+        self.assertEqual(self.complete('bsil'), ['Basil'])
+        self.assertEqual(self.complete('xyz'), [])
+
+    def test_lookups_make_no_queries(self):
+        self.complete('tom')
+        with CaptureQueriesContext(connection) as context:
+            self.complete('bas')
+        self.assertEqual(context.captured_queries, [])
+
+    def test_index_follows_writes(self):
+        self.complete('tom')
+        tofu = Ingredient.objects.get(name='Tofu')
+        with self.captureOnCommitCallbacks(execute=True):
+            tofu.name = 'Tempeh'
+            tofu.save()
+            Ingredient.objects.get(name='Basil').delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/ingredients/bulk/', data=json.dumps(['Bay leaf']), content_type='application/json')
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.complete('te'), ['Tempeh'])
+            self.assertEqual(self.complete('ba'), ['Bay leaf'])
+        self.assertEqual(context.captured_queries, [])
+
+    def test_changes_of_other_processes_rebuild_the_index(self):
+        self.complete('tom')
+        Ingredient.objects.create(name='Tarragon')
+        self.index.bump_version()
+        with mock.patch.object(self.index, 'checked', 0):
+            self.assertEqual(self.complete('tarr'), ['Tarragon'])
@@ -1,7 +1,9 @@
 from django.urls import path
-from ingredients.views import IngredientListView, IngredientDetailView
+from ingredients.views import IngredientListView, IngredientBulkView, IngredientAutocompleteView, IngredientDetailView
 
 urlpatterns = [
     path('', IngredientListView.as_view()),
+    path('bulk/', IngredientBulkView.as_view()),
+    path('autocomplete/', IngredientAutocompleteView.as_view()),
     path('<int:pk>/', IngredientDetailView.as_view()),
 ]
\ No newline at end of file
@@ -4,11 +4,16 @@ from django.db.models import QuerySet
 from rest_framework.renderers import JSONRenderer
 from rest_framework.parsers import JSONParser
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from ingredients.models import Ingredient
 from ingredients.serializers import IngredientSerializer
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from rest_framework.views import APIView
+from CookbookAPI.pagination import KeysetPagination, paginated_serializer
+from CookbookAPI.taxonomy import NameListSerializer, get_or_create_names
+from CookbookAPI.autocomplete import get_index
+from CookbookAPI.responsecache import cache_response
 
 class JSONResponse(HttpResponse):
     def __init__(self, data, **kwargs):
@@ -18,18 +23,33 @@ class JSONResponse(HttpResponse):
 
 
 class IngredientListView(APIView):
+    paginator = KeysetPagination()
+
     @csrf_exempt
     @swagger_auto_schema(
-        operation_description="Gets a list of Ingredient objects.",
+        operation_description="Gets a page of Ingredient objects ordered by name.",
         responses={
-            200: IngredientSerializer(many=True)
+            200: paginated_serializer(IngredientSerializer),
+            400: """
+                The limit or cursor parameter is invalid.
+                """,
         },
         tags=['Ingredient'],
     )
+    @cache_response(Ingredient)
     def get(self, request, *args, **kwargs):
         objects: QuerySet[Ingredient] = Ingredient.objects.all()
-        serializer = IngredientSerializer(objects, many=True)
-        return JSONResponse(serializer.data)
+        try:
+            page, next_cursor = self.paginator.paginate_queryset(objects, request)
+        except ValidationError as error:
+            return JSONResponse(
+                error.detail,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        serializer = IngredientSerializer(page, many=True)
+        return JSONResponse(
+            self.paginator.get_paginated_data(serializer.data, next_cursor)
+        )
 
     @csrf_exempt
     @swagger_auto_schema(
@@ -68,6 +88,105 @@ class IngredientListView(APIView):
         )
 
 
+class IngredientBulkView(APIView):
+    @csrf_exempt
+    @swagger_auto_schema(
+        operation_description="""
+                              Creates every Ingredient of a list of names which doesn't exist yet
+                              and returns the ids of all given names.
+                              """,
+        request_body=openapi.Schema(
+            type=openapi.TYPE_ARRAY,
+            items=openapi.Items(type=openapi.TYPE_STRING),
+        ),
+        responses={
+            200: openapi.Schema(
+                description='Maps every given name to the id of its ingredient.',
+                type=openapi.TYPE_OBJECT,
+                additional_properties=openapi.Schema(type=openapi.TYPE_INTEGER),
+            ),
+            400: """
+                The request body is not a list of names.
+                """,
+        },
+        tags=['Ingredient'],
+    )
+    def post(self, request):
+        data = JSONParser().parse(request)
+        try:
+            names = NameListSerializer().run_validation(data)
+        except ValidationError as error:
+            return JSONResponse(
+                error.detail,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return JSONResponse(get_or_create_names(Ingredient, names))
+
+
+class IngredientAutocompleteView(APIView):
+    default_limit = 10
+    max_limit = 50
+
+    @csrf_exempt
+    @swagger_auto_schema(
+        operation_description="""
+                              Gets the Ingredient objects whose words start with the words of
+                              a query, tolerating a few typos. Exact matches and shorter
+                              names come first.
+                              """,
+        manual_parameters=[
+            openapi.Parameter(
+                name='q',
+                in_=openapi.IN_QUERY,
+                description='The beginning of the name.',
+                type=openapi.TYPE_STRING,
+                required=True
+            ),
+            openapi.Parameter(
+                name='limit',
+                in_=openapi.IN_QUERY,
+                description='The maximum number of results, at most 50.',
+                type=openapi.TYPE_INTEGER
+            ),
+        ],
+        responses={
+            200: openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'results': openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Schema(
+                            type=openapi.TYPE_OBJECT,
+                            properties={
+                                'id': openapi.Schema(type=openapi.TYPE_INTEGER),
+                                'name': openapi.Schema(type=openapi.TYPE_STRING),
+                            },
+                        ),
+                    ),
+                },
+            ),
+            400: """
+                The limit parameter is invalid.
+                """,
+        },
+        tags=['Ingredient'],
+    )
+    def get(self, request):
+        try:
+            limit = int(request.GET.get('limit', self.default_limit))
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= self.max_limit:
+            return JSONResponse(
+                {'limit': ['Ensure this value is between 1 and {}.'.format(self.max_limit)]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        matches = get_index(Ingredient).complete(request.GET.get('q', ''), limit)
+        return JSONResponse({
+            'results': [{'id': pk, 'name': name} for pk, name in matches]
+        })
+
+
 class IngredientDetailView(APIView):
     @csrf_exempt
     @swagger_auto_schema(
@@ -80,6 +199,7 @@ class IngredientDetailView(APIView):
         },
         tags=['Ingredient'],
     )
+    @cache_response(Ingredient)
     def get(self, request, pk):
         try:
             data = Ingredient.objects.get(pk=pk)
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class OccasionsConfig(AppConfig):
     name = 'occasions'
+
+    def ready(self):
+        from CookbookAPI.autocomplete import register
+        from CookbookAPI.responsecache import track
+        register(self.get_model('Occasion'))
+        track(self.get_model('Occasion'))
@@ -1,7 +1,9 @@
 from django.urls import path
-from occasions.views import OccasionListView, OccasionDetailView
+from occasions.views import OccasionListView, OccasionBulkView, OccasionAutocompleteView, OccasionDetailView
 
 urlpatterns = [
     path('', OccasionListView.as_view()),
+    path('bulk/', OccasionBulkView.as_view()),
+    path('autocomplete/', OccasionAutocompleteView.as_view()),
     path('<int:pk>/', OccasionDetailView.as_view()),
 ]
\ No newline at end of file
@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class RecipesConfig(AppConfig):
     name = 'recipes'
+
+    def ready(self):
+        import recipes.signals
+        from CookbookAPI.responsecache import track
+        track(self.get_model('Recipe'))
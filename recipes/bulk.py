@@ -0,0 +1,368 @@
+import json
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from rest_framework import serializers
+from CookbookAPI.responsecache import bump_versions
+from CookbookAPI.taxonomy import get_or_create_names
+from recipes.jobs import enqueue_renders
+from recipes.facets import notify_facets
+from recipes.models import Recipe
+from recipes.pantry import pantry_index
+from recipes.similarity import similarity_index
+from recipes.serializers import RecipeBulkItemSerializer, RecipeSerializer, RecipeTagSerializer
+from sync.models import Change
+
+# The number of rows written per INSERT or UPDATE statement.
+BATCH_SIZE = 500
+
+CREATED = 'created'
+UPDATED = 'updated'
+INVALID = 'invalid'
+
+
+def parse_ndjson(lines):
+    """
+    Returns the payload of every non-empty line, or a ValidationError for
+    lines which are no valid JSON.
+    """
+    payloads = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            payloads.append(json.loads(line))
+        except ValueError:
+            payloads.append(serializers.ValidationError({
+                'non_field_errors': ['Invalid JSON.']
+            }))
+    return payloads
+
+
+def bulk_write(payloads):
+    """
+    Creates or updates a recipe for every payload, matched by name, and
+    returns a result for every payload in the same order. Invalid payloads
+    are reported and skipped, all valid ones are written in one transaction
+    with a constant number of queries per batch.
+    """
+    results = [None] * len(payloads)
+    valid = validate(payloads, results)
+    resolve_relations(valid, results)
+    if not valid:
+        return results
+
+    with transaction.atomic():
+        resolve_names(valid)
+        existing = Recipe.objects.in_bulk(
+            [attrs['name'] for attrs in valid.values()],
+            field_name='name'
+        )
+        recipes = {}
+        created = []
+        updated = []
+        # Recipes whose url changed, only those may need a new render.
+        moved = []
+        for index, attrs in valid.items():
+            recipe = existing.get(attrs['name'])
+            if recipe is None:
+                recipe = Recipe(name=attrs['name'])
+                created.append(recipe)
+                results[index] = {'index': index, 'status': CREATED}
+                apply(recipe, attrs)
+            else:
+                results[index] = {'index': index, 'status': UPDATED}
+                changed = apply(recipe, attrs)
+                if changed:
+                    updated.append(recipe)
+                if 'url' in changed:
+                    moved.append(recipe)
+            recipes[index] = recipe
+
+        created = insert_or_update(created, updated, moved, recipes, valid, results)
+        if any(recipe.pk is None for recipe in created):
+            # Not every database returns the primary keys of inserted rows.
+            pks = Recipe.objects.filter(
+                name__in=[recipe.name for recipe in created]
+            ).values_list('name', 'pk')
+            pks = dict(pks)
+            for recipe in created:
+                recipe.pk = pks[recipe.name]
+        # Only recipes which actually changed are written.
+        now = timezone.now()
+        for recipe in updated:
+            recipe.updated = now
+        update_recipes(updated, ['url', 'note', 'file', 'updated'])
+
+        for field, names_field, model, relation in RecipeSerializer.relations:
+            write_relation(relation, {
+                recipes[index].pk: attrs[field]
+                for index, attrs in valid.items()
+                if attrs.get(field, None)
+            })
+
+        transaction.on_commit(lambda: enqueue_renders(created + moved))
+        # Bulk writes don't send post_save.
+        bump_versions(Recipe)
+        Change.objects.record(Recipe, [recipe.pk for recipe in created + updated])
+
+    for index, recipe in recipes.items():
+        results[index]['id'] = recipe.pk
+    return results
+
+
+def insert_or_update(created, updated, moved, recipes, valid, results):
+    """
+    Inserts the `created` recipes and returns those which were inserted.
+    Recipes with the same name which another request created since they
+    were looked up are updated instead, and added to `updated` and `moved`
+    like the recipes which existed before.
+    """
+    indexes = {attrs['name']: index for index, attrs in valid.items()}
+    while created:
+        try:
+            with transaction.atomic():
+                Recipe.objects.bulk_create(created, batch_size=BATCH_SIZE)
+            return created
+        except IntegrityError:
+            concurrent = Recipe.objects.in_bulk([recipe.name for recipe in created], field_name='name')
+            if not concurrent:
+                raise
+        for name, recipe in concurrent.items():
+            index = indexes[name]
+            recipes[index] = recipe
+            results[index]['status'] = UPDATED
+            changed = apply(recipe, valid[index])
+            if changed:
+                updated.append(recipe)
+            if 'url' in changed:
+                moved.append(recipe)
+        created = [recipe for recipe in created if recipe.name not in concurrent]
+        for recipe in created:
+            # Batches inserted before the conflict were rolled back.
+            recipe.pk = None
+            recipe._state.adding = True
+    return created
+
+
+def validate(payloads, results):
+    serializer = RecipeBulkItemSerializer()
+    valid = {}
+    names = set()
+    for index, payload in enumerate(payloads):
+        try:
+            if isinstance(payload, serializers.ValidationError):
+                raise payload
+            attrs = serializer.run_validation(payload)
+            if attrs['name'] in names:
+                raise serializers.ValidationError({
+                    'name': ['The name appears more than once in this request.']
+                })
+        except serializers.ValidationError as error:
+            results[index] = {'index': index, 'status': INVALID, 'errors': error.detail}
+            continue
+        names.add(attrs['name'])
+        valid[index] = attrs
+    return valid
+
+
+def resolve_relations(valid, results):
+    # One query per relation for the ids referenced by all payloads.
+    for field, names_field, model, relation in RecipeSerializer.relations:
+        ids = {pk for attrs in valid.values() for pk in attrs.get(field, None) or ()}
+        if not ids:
+            continue
+        existing = set(model.objects.filter(pk__in=ids).values_list('pk', flat=True))
+        for index, attrs in list(valid.items()):
+            if not attrs.get(field, None):
+                continue
+            missing = [pk for pk in dict.fromkeys(attrs[field]) if pk not in existing]
+            if missing:
+                results[index] = {
+                    'index': index,
+                    'status': INVALID,
+                    'errors': {
+                        field: [
+                            'Invalid pk "{}" - object does not exist.'.format(pk)
+                            for pk in missing
+                        ]
+                    }
+                }
+                del valid[index]
+            else:
+                attrs[field] = list(dict.fromkeys(attrs[field]))
+
+
+def resolve_names(valid):
+    # Creates the names referenced by all payloads with one insert per relation.
+    for field, names_field, model, relation in RecipeSerializer.relations:
+        names = [name for attrs in valid.values() for name in attrs.get(names_field, None) or ()]
+        if not names:
+            continue
+        ids = get_or_create_names(model, names)
+        for attrs in valid.values():
+            if attrs.get(names_field, None):
+                pks = list(attrs.get(field, None) or []) + [ids[name] for name in attrs[names_field]]
+                attrs[field] = list(dict.fromkeys(pks))
+
+
+def apply(recipe, attrs):
+    """
+    Mirrors RecipeSerializer.update for the scalar fields and returns the
+    names of the fields which changed.
+    """
+    changed = []
+    note = attrs.get('note', recipe.note)
+    if note != recipe.note:
+        recipe.note = note
+        changed.append('note')
+    url = attrs.get('url', None)
+    if url and url != recipe.url:
+        recipe.release_file()
+        recipe.url = url
+        changed += ['url', 'file']
+    return changed
+
+
+def update_recipes(recipes, fields):
+    """
+    Writes `fields` of the given recipes with one UPDATE ... FROM (VALUES
+    ...) per batch. bulk_update would build a CASE expression per field
+    with a branch for every recipe instead, which the database evaluates
+    for every row it updates.
+    """
+    if connection.vendor == 'sqlite' and connection.Database.sqlite_version_info < (3, 33):
+        # UPDATE ... FROM needs SQLite 3.33.
+        Recipe.objects.bulk_update(recipes, fields, batch_size=BATCH_SIZE)
+        return
+    fields = [Recipe._meta.get_field(name) for name in fields]
+    quote = connection.ops.quote_name
+    # VALUES names its columns column1, column2, ... on both databases.
+    assignments = ', '.join(
+        '{} = v.column{}'.format(quote(field.column), position)
+        for position, field in enumerate(fields, start=2)
+    )
+    row = '({})'.format(', '.join(['%s'] * (len(fields) + 1)))
+    with connection.cursor() as cursor:
+        for start in range(0, len(recipes), BATCH_SIZE):
+            batch = recipes[start:start + BATCH_SIZE]
+            cursor.execute(
+                'UPDATE {table} SET {assignments} FROM (VALUES {rows}) AS v '
+                'WHERE {table}.{pk} = v.column1'.format(
+                    table=quote(Recipe._meta.db_table),
+                    assignments=assignments,
+                    rows=', '.join([row] * len(batch)),
+                    pk=quote(Recipe._meta.pk.column),
+                ),
+                [
+                    value
+                    for recipe in batch
+                    for value in [recipe.pk] + [
+                        field.get_db_prep_save(getattr(recipe, field.attname), connection)
+                        for field in fields
+                    ]
+                ]
+            )
+
+
+def write_relation(relation, related_ids):
+    """
+    Replaces the related objects of every recipe in `related_ids` with one
+    DELETE and a batched INSERT into the through table.
+    """
+    if not related_ids:
+        return
+    through, source, target = Recipe.through_fields(relation)
+
+    through.objects.filter(**{'{}__in'.format(source): list(related_ids)}).delete()
+    through.objects.bulk_create(
+        [
+            through(**{source: recipe_id, target: pk})
+            for recipe_id, pks in related_ids.items()
+            for pk in pks
+        ],
+        batch_size=BATCH_SIZE
+    )
+    relation_changed(relation, list(related_ids))
+
+
+def select_recipes(recipe_ids=None, filter=None):
+    """
+    Returns the recipes given by id, or the recipes which are related to
+    any of the ids of every relation in `filter`.
+    """
+    if recipe_ids is not None:
+        return Recipe.objects.filter(pk__in=recipe_ids)
+    recipes = Recipe.objects.all()
+    for relation, ids in filter.items():
+        recipes = recipes.related_to_any(relation, ids)
+    return recipes
+
+
+def attach_tags(relation, ids, recipes):
+    """
+    Adds the related objects with `ids` to every recipe with one batched
+    INSERT into the through table and returns the number of recipes.
+    Existing links are skipped. Renders are not affected.
+    """
+    through, source, target = Recipe.through_fields(relation)
+    recipe_ids = list(recipes.values_list('pk', flat=True))
+    through.objects.bulk_create(
+        [
+            through(**{source: recipe_id, target: pk})
+            for recipe_id in recipe_ids
+            for pk in ids
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+    relation_changed(relation, recipe_ids)
+    return len(recipe_ids)
+
+
+def detach_tags(relation, ids, recipes):
+    """
+    Removes the related objects with `ids` from every recipe with a single
+    DELETE on the through table and returns the number of removed links.
+    """
+    through, source, target = Recipe.through_fields(relation)
+    links = through.objects.filter(**{
+        '{}__in'.format(target): ids,
+        '{}__in'.format(source): recipes.values('pk'),
+    })
+    recipe_ids = list(links.values_list(source, flat=True).distinct())
+    deleted, _ = links.delete()
+    relation_changed(relation, recipe_ids)
+    return deleted
+
+
+def relation_changed(relation, recipe_ids):
+    # Writes to the through tables don't send m2m_changed.
+    for start in range(0, len(recipe_ids), BATCH_SIZE):
+        Recipe.objects.filter(pk__in=recipe_ids[start:start + BATCH_SIZE]).touch()
+    Change.objects.record(Recipe, recipe_ids)
+    if relation == 'ingredients':
+        pantry_index.changed(recipe_ids=recipe_ids)
+    similarity_index.changed(recipe_ids)
+    notify_facets()
+    bump_versions(Recipe)
+
+
+def write_tags(attrs):
+    """
+    Runs a set operation validated by RecipeTagSerializer and returns the
+    number of affected recipes or links.
+    """
+    relation = attrs['relation']
+    model = Recipe._meta.get_field(relation).related_model
+    recipes = select_recipes(attrs.get('recipe_ids', None), attrs.get('filter', None))
+    ids = list(attrs.get('ids', None) or [])
+    names = attrs.get('names', None)
+    with transaction.atomic():
+        if attrs['action'] == RecipeTagSerializer.ADD:
+            if names:
+                ids += get_or_create_names(model, names).values()
+            return {'recipes': attach_tags(relation, list(dict.fromkeys(ids)), recipes)}
+        if names:
+            ids += model.objects.filter(name__in=names).values_list('pk', flat=True)
+        return {'removed': detach_tags(relation, ids, recipes)}
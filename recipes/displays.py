@@ -0,0 +1,145 @@
+import os
+import queue
+import select
+import signal
+import subprocess
+import threading
+from contextlib import contextmanager
+from recipes.processes import child_setup
+
+
+class DisplayError(Exception):
+    pass
+
+
+class Display:
+    """
+    A long running Xvfb server which is reused for many renders.
+    """
+    screen = '640x480x16'
+    startup_timeout = 10
+
+    def __init__(self):
+        self.process = None
+        self.number = None
+        self.renders = 0
+
+    @property
+    def name(self):
+        return ':{}'.format(self.number)
+
+    def start(self):
+        # Xvfb picks a free display number itself and reports it through the pipe.
+        read_fd, write_fd = os.pipe()
+        try:
+            self.process = subprocess.Popen(
+                [
+                    'Xvfb',
+                    '-displayfd', str(write_fd),
+                    '-screen', '0', self.screen,
+                    '-nolisten', 'tcp',
+                ],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                pass_fds=(write_fd,),
+                # Signals for the worker, like a Ctrl-C, don't reach the server.
+                start_new_session=True,
+                preexec_fn=child_setup()
+            )
+            os.close(write_fd)
+            write_fd = None
+
+            ready, _, _ = select.select([read_fd], [], [], self.startup_timeout)
+            output = os.read(read_fd, 32) if ready else b''
+        finally:
+            os.close(read_fd)
+            if write_fd is not None:
+                os.close(write_fd)
+
+        if not output.strip().isdigit():
+            self.stop()
+            raise DisplayError('Xvfb did not report a display number.')
+        self.number = int(output.strip())
+        self.renders = 0
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            os.killpg(self.process.pid, signal.SIGTERM)
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                os.killpg(self.process.pid, signal.SIGKILL)
+                self.process.wait()
+        self.process = None
+        self.number = None
+
+    def is_healthy(self):
+        if self.process is None or self.process.poll() is not None:
+            return False
+        return os.path.exists('/tmp/.X11-unix/X{}'.format(self.number))
+
+
+class DisplayPool:
+    """
+    Hands out a fixed number of persistent displays. A display is checked
+    before every lease and replaced when its server crashed or after it
+    served `max_renders` renders.
+    """
+    def __init__(self, size, max_renders=500):
+        self.size = size
+        self.max_renders = max_renders
+        self.displays = queue.Queue()
+        # Every display of the pool, including the leased ones.
+        self.all = []
+        self.lock = threading.Lock()
+        self.started = False
+
+    def start(self):
+        with self.lock:
+            if self.started:
+                return
+            started = []
+            try:
+                for _ in range(self.size):
+                    display = Display()
+                    display.start()
+                    started.append(display)
+            except Exception:
+                # A retry starts all displays again, none may be left running.
+                for display in started:
+                    display.stop()
+                raise
+            for display in started:
+                self.displays.put(display)
+            self.all = started
+            self.started = True
+
+    @contextmanager
+    def lease(self, timeout=None):
+        self.start()
+        try:
+            display = self.displays.get(timeout=timeout)
+        except queue.Empty:
+            raise DisplayError('No display became available.')
+        try:
+            if not display.is_healthy() or display.renders >= self.max_renders:
+                display.stop()
+                display.start()
+            display.renders += 1
+            yield display
+        finally:
+            with self.lock:
+                if display in self.all:
+                    self.displays.put(display)
+                else:
+                    # The pool was closed during the lease.
+                    display.stop()
+
+    def close(self):
+        with self.lock:
+            for display in self.all:
+                display.stop()
+            self.all = []
+            while not self.displays.empty():
+                self.displays.get()
+            self.started = False
@@ -0,0 +1,132 @@
+import os
+import re
+import hashlib
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date, parse_etags
+from rest_framework import status
+from recipes.models import FileBlob
+from recipes.storage import ContentAddressedStorage
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def file_etag(file):
+    """
+    Returns a strong ETag for a stored file. Content addressed files carry
+    their SHA-256 in the name, older files are hashed once and the digest
+    is kept with their FileBlob.
+    """
+    digest = ContentAddressedStorage.digest(file.name)
+    if not re.match(r'^[0-9a-f]{64}$', digest):
+        digest = FileBlob.objects.digest(file.name, lambda: hash_file(file))
+    return '"{}"'.format(digest)
+
+
+def hash_file(file):
+    sha256 = hashlib.sha256()
+    with file.storage.open(file.name, 'rb') as content:
+        for chunk in iter(lambda: content.read(CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def parse_range(header, size):
+    """
+    Returns the first and last byte of a single `bytes=` range, None for a
+    header that should be ignored, or raises ValueError if the range can't
+    be satisfied.
+    """
+    match = RANGE_PATTERN.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if first == '' and last == '':
+        return None
+    if first == '':
+        # The suffix form requests the last bytes of the file.
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    first = int(first)
+    last = size - 1 if last == '' else min(int(last), size - 1)
+    if first > last or first >= size:
+        raise ValueError(header)
+    return first, last
+
+
+def read_range(path, first, last):
+    with open(path, 'rb') as file:
+        file.seek(first)
+        remaining = last - first + 1
+        while remaining > 0:
+            chunk = file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                return
+            remaining -= len(chunk)
+            yield chunk
+
+
+def file_response(request, file):
+    """
+    Serves a stored file with support for conditional and partial requests.
+    The transfer is delegated to the front proxy when RECIPE_FILE_ACCEL is
+    configured.
+    """
+    path = file.storage.path(file.name)
+    size = os.path.getsize(path)
+    etag = file_etag(file)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(os.path.getmtime(path)),
+        'Accept-Ranges': 'bytes',
+    }
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+        return with_headers(HttpResponse(status=status.HTTP_304_NOT_MODIFIED), headers)
+
+    if settings.RECIPE_FILE_ACCEL == 'X-Accel-Redirect':
+        # nginx serves the file from an internal location, including ranges.
+        response = HttpResponse(content_type='application/pdf')
+        response['X-Accel-Redirect'] = '{}{}'.format(settings.RECIPE_FILE_ACCEL_PREFIX, file.name)
+        return with_headers(response, headers)
+    if settings.RECIPE_FILE_ACCEL == 'X-Sendfile':
+        response = HttpResponse(content_type='application/pdf')
+        response['X-Sendfile'] = path
+        return with_headers(response, headers)
+
+    byte_range = None
+    range_header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    # A range of an outdated representation must not be combined with cached bytes.
+    if range_header and (not if_range or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = 'bytes */{}'.format(size)
+            return with_headers(response, headers)
+
+    if byte_range is None:
+        # Handed to wsgi.file_wrapper, which uses sendfile where available.
+        response = FileResponse(open(path, 'rb'), content_type='application/pdf')
+        return with_headers(response, headers)
+
+    first, last = byte_range
+    response = StreamingHttpResponse(
+        read_range(path, first, last),
+        status=status.HTTP_206_PARTIAL_CONTENT,
+        content_type='application/pdf'
+    )
+    response['Content-Range'] = 'bytes {}-{}/{}'.format(first, last, size)
+    response['Content-Length'] = str(last - first + 1)
+    return with_headers(response, headers)
+
+
+def with_headers(response, headers):
+    for name, value in headers.items():
+        response[name] = value
+    return response
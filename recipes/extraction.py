@@ -0,0 +1,100 @@
+import subprocess
+from django.conf import settings
+from django.db import connection, transaction
+from recipes.models import Recipe, RecipeText
+from recipes.search import get_backend
+from recipes.storage import ContentAddressedStorage
+
+
+class ExtractionError(Exception):
+    pass
+
+
+def extract_text(path):
+    """
+    Returns the text of the pdf at `path`. Raises an ExtractionError if
+    pdftotext fails or exceeds PDF_TEXT_TIMEOUT.
+    """
+    try:
+        result = subprocess.run(
+            ['pdftotext', '-q', '-enc', 'UTF-8', path, '-'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            timeout=settings.PDF_TEXT_TIMEOUT,
+            start_new_session=True
+        )
+    except (OSError, subprocess.TimeoutExpired) as error:
+        raise ExtractionError('Could not extract the text of {}: {}'.format(path, error))
+    if result.returncode != 0:
+        raise ExtractionError('pdftotext exited with {} for {}.'.format(result.returncode, path))
+    # Page breaks are form feeds, which carry no meaning for the search.
+    return result.stdout.decode('utf-8', errors='replace').replace('\f', '\n').strip()
+
+
+def pending_recipes():
+    """
+    Returns the ids of the recipes whose pdf changed since its text was
+    extracted and of the recipes which lost their pdf but still have a text.
+    """
+    pending = []
+    recipes = Recipe.objects.values_list('pk', 'file', 'text__digest').order_by('pk')
+    for pk, name, digest in recipes.iterator():
+        if name:
+            if digest != ContentAddressedStorage.digest(name):
+                pending.append(pk)
+        elif digest is not None:
+            pending.append(pk)
+    return pending
+
+
+def index_recipe_text(recipe_id):
+    """
+    Brings the text of a recipe in line with its current pdf and updates
+    the search index. Files whose digest didn't change are skipped and the
+    text of identical files is copied instead of extracted again.
+    Returns True if the text changed.
+    """
+    recipe = Recipe.objects.get(pk=recipe_id)
+    # Only skips needless work, the text is read again before it is replaced.
+    current = RecipeText.objects.filter(recipe=recipe).first()
+
+    if not recipe.has_file:
+        if current is None:
+            return False
+        with transaction.atomic():
+            Recipe.objects.select_for_update().get(pk=recipe_id)
+            current = RecipeText.objects.select_for_update().filter(recipe_id=recipe_id).first()
+            if current is None:
+                return False
+            current.delete()
+        return True
+
+    digest = ContentAddressedStorage.digest(recipe.file.name)
+    if current is not None and current.digest == digest:
+        return False
+
+    shared = RecipeText.objects.filter(digest=digest).exclude(recipe=recipe).first()
+    if shared is not None:
+        content = shared.content
+    else:
+        content = RecipeText.compress(extract_text(recipe.file.path))
+
+    with transaction.atomic():
+        # The pdf may have been replaced during the extraction.
+        recipe = Recipe.objects.select_for_update().get(pk=recipe_id)
+        if not recipe.file or ContentAddressedStorage.digest(recipe.file.name) != digest:
+            return False
+        # Another extraction may have replaced the text in the meantime. A
+        # contentless index only drops the tokens of the exact text it holds.
+        current = RecipeText.objects.select_for_update().filter(recipe=recipe).first()
+        if current is not None and current.digest == digest:
+            return False
+        text = RecipeText(recipe=recipe, digest=digest, content=content)
+        text.save()
+        get_backend(connection).index_text(
+            connection,
+            recipe.pk,
+            current.text if current is not None else None,
+            text.text
+        )
+    return True
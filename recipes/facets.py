@@ -0,0 +1,64 @@
+import uuid
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from recipes.filters import RELATIONS, filter_recipes, filter_signature
+from recipes.models import Recipe
+
+VERSION_KEY = 'facets-version'
+
+
+def facets_version():
+    """
+    Returns a token which changes whenever a write may change the counts.
+    It is part of the key of every cached result, so a write invalidates
+    all of them at once.
+    """
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def notify_facets():
+    def notify():
+        cache.set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+    # A result computed before the commit must not be cached as current.
+    transaction.on_commit(notify)
+
+
+def count_facets(params):
+    """
+    Returns the number of recipes matching the filters of the query
+    `params` for every related object of every relation, with one query
+    per relation. Results are cached per set of filters until the next
+    write. Raises a ValidationError for malformed filters.
+    """
+    recipes = filter_recipes(Recipe.objects.all(), params)
+    signature = filter_signature(params)
+    key = 'facets:{}:{}'.format(facets_version(), hashlib.sha256(signature.encode('utf-8')).hexdigest())
+    facets = cache.get(key)
+    if facets is None:
+        facets = {
+            relation: count_relation(relation, recipes if signature else None)
+            for relation in RELATIONS
+        }
+        cache.set(key, facets, timeout=settings.FACETS_CACHE_TIMEOUT)
+    return facets
+
+
+def count_relation(relation, recipes=None):
+    """
+    Returns the id, name and number of recipes of the related objects of
+    `recipes`, or of all recipes, the most frequent first.
+    """
+    through, source, target = Recipe.through_fields(relation)
+    name = '{}__name'.format(Recipe._meta.get_field(relation).m2m_reverse_field_name())
+    links = through.objects.all()
+    if recipes is not None:
+        links = links.filter(**{'{}__in'.format(source): recipes.values('pk')})
+    rows = links.values_list(target, name).annotate(count=Count(source)).order_by('-count', name)
+    return [{'id': pk, 'name': name, 'count': count} for pk, name, count in rows]
@@ -0,0 +1,88 @@
+import datetime
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import serializers
+from CookbookAPI.pagination import MAX_INTEGER, MIN_INTEGER
+
+RELATIONS = ('cuisines', 'diets', 'ingredients', 'occasions')
+# Appended to a relation for recipes linked to all instead of any of the ids.
+ALL_SUFFIX = '_all'
+# The filters of the creation time with their lookups.
+CREATED_FILTERS = (('created_after', 'created__gte'), ('created_before', 'created__lt'))
+
+
+def filter_recipes(queryset, params):
+    """
+    Applies the filters of the query `params` to a recipe queryset. Every
+    filter adds a condition to the same query. Raises a ValidationError
+    for malformed values.
+    """
+    errors = {}
+    for relation in RELATIONS:
+        for arg, method in ((relation, 'related_to_any'), (relation + ALL_SUFFIX, 'related_to_all')):
+            value = params.get(arg)
+            if value is None:
+                continue
+            try:
+                ids = parse_ids(value)
+            except ValueError:
+                errors[arg] = ['A comma separated list of ids is required.']
+                continue
+            queryset = getattr(queryset, method)(relation, ids)
+
+    for arg, lookup in CREATED_FILTERS:
+        value = params.get(arg)
+        if value is None:
+            continue
+        moment = parse_moment(value)
+        if moment is None:
+            errors[arg] = ['A valid ISO 8601 date or date time is required.']
+            continue
+        queryset = queryset.filter(**{lookup: moment})
+
+    if errors:
+        raise serializers.ValidationError(errors)
+    return queryset
+
+
+def filter_signature(params):
+    """
+    Returns a string which is equal for query `params` with the same
+    filters, regardless of other parameters and of the order of the ids.
+    Expects `params` which filter_recipes accepted.
+    """
+    parts = []
+    for relation in RELATIONS:
+        for arg in (relation, relation + ALL_SUFFIX):
+            value = params.get(arg)
+            if value is not None:
+                parts.append('{}={}'.format(arg, ','.join(map(str, sorted(set(parse_ids(value)))))))
+    for arg, lookup in CREATED_FILTERS:
+        value = params.get(arg)
+        if value is not None:
+            parts.append('{}={}'.format(arg, parse_moment(value).isoformat()))
+    return '&'.join(parts)
+
+
+def parse_ids(value):
+    ids = [int(pk) for pk in value.split(',') if pk.strip()]
+    # Larger ids don't fit the integer columns and overflow in the driver.
+    if not ids or not all(MIN_INTEGER <= pk <= MAX_INTEGER for pk in ids):
+        raise ValueError(value)
+    return ids
+
+
+def parse_moment(value):
+    # Dates refer to midnight, date times without an offset to the current time zone.
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            date = parse_date(value)
+            if date is None:
+                return None
+            moment = datetime.datetime.combine(date, datetime.time())
+    except ValueError:
+        return None
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
@@ -0,0 +1,310 @@
+import time
+import uuid
+import logging
+import threading
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from recipes.models import RenderJob
+from recipes.rendering import RenderCancelled, render_fingerprint, render_recipe
+from recipes.extraction import index_recipe_text
+
+logger = logging.getLogger(__name__)
+
+
+# Seconds between two checks of the status version while a client waits.
+STATUS_POLL_INTERVAL = 0.25
+
+
+# Recipes share their status versions in this many buckets, which bounds the
+# number of cache writes when many jobs change at once.
+STATUS_BUCKETS = 64
+
+
+def status_key(recipe_id):
+    return 'render-status:{}'.format(int(recipe_id) % STATUS_BUCKETS)
+
+
+def status_version(recipe_id):
+    """
+    Returns a token which changes whenever a render job of the recipe, or
+    of another recipe in the same bucket, changes its state. It is kept in
+    the cache, so waiting clients can watch it without querying the database.
+    """
+    version = cache.get(status_key(recipe_id))
+    if version is None:
+        cache.add(status_key(recipe_id), uuid.uuid4().hex, timeout=None)
+        version = cache.get(status_key(recipe_id))
+    return version
+
+
+def notify_status(*recipe_ids):
+    def notify():
+        cache.set_many(
+            {key: uuid.uuid4().hex for key in set(map(status_key, recipe_ids))},
+            timeout=None
+        )
+    # Waiting clients must not read the state before it is committed.
+    transaction.on_commit(notify)
+
+
+def wait_for_status(recipe_id, since, timeout):
+    """
+    Blocks until the status version of the recipe differs from `since` or
+    `timeout` seconds passed, and returns the current version.
+    """
+    deadline = time.monotonic() + timeout
+    version = status_version(recipe_id)
+    while version == since and time.monotonic() < deadline:
+        time.sleep(STATUS_POLL_INTERVAL)
+        version = status_version(recipe_id)
+    return version
+
+
+def needs_render(recipe):
+    if recipe.url is None or recipe.url == "":
+        return False
+    return recipe.render_fingerprint != render_fingerprint(recipe.url) or not recipe.has_file
+
+
+def enqueue_render(recipe, force=False):
+    """
+    Queues a pdf render for the given recipe unless its file already matches
+    the current url, or `force` is set. A job that is still waiting for a
+    worker is reused, so repeated edits only cause a single render.
+    """
+    if recipe.url is None or recipe.url == "":
+        return None
+    if not force and not needs_render(recipe):
+        return None
+
+    notify_status(recipe.pk)
+
+    # A render of an outdated url is stopped by its worker.
+    RenderJob.objects.filter(
+        recipe=recipe,
+        status=RenderJob.RUNNING
+    ).exclude(
+        url=recipe.url
+    ).update(
+        status=RenderJob.CANCELLED,
+        finished=timezone.now()
+    )
+
+    job = RenderJob.objects.filter(
+        recipe=recipe,
+        status=RenderJob.QUEUED
+    ).first()
+    if job is not None:
+        if job.url != recipe.url:
+            job.url = recipe.url
+            job.save(update_fields=['url'])
+        return job
+
+    return RenderJob.objects.create(recipe=recipe, url=recipe.url)
+
+
+def enqueue_renders(recipes):
+    """
+    Queues renders for many recipes at once, following the same rules as
+    `enqueue_render` but with a constant number of queries.
+    """
+    recipes = {recipe.pk: recipe for recipe in recipes if needs_render(recipe)}
+    if not recipes:
+        return []
+
+    notify_status(*recipes)
+
+    cancelled = []
+    queued = {}
+    for job in RenderJob.objects.filter(
+        recipe_id__in=recipes,
+        status__in=(RenderJob.QUEUED, RenderJob.RUNNING)
+    ):
+        url = recipes[job.recipe_id].url
+        if job.status == RenderJob.RUNNING and job.url != url:
+            cancelled.append(job.pk)
+        elif job.status == RenderJob.QUEUED:
+            job.url = url
+            queued[job.recipe_id] = job
+
+    RenderJob.objects.filter(pk__in=cancelled).update(
+        status=RenderJob.CANCELLED,
+        finished=timezone.now()
+    )
+    RenderJob.objects.bulk_update(queued.values(), ['url'])
+    created = RenderJob.objects.bulk_create([
+        RenderJob(recipe_id=pk, url=recipe.url)
+        for pk, recipe in recipes.items()
+        if pk not in queued
+    ])
+    return list(queued.values()) + created
+
+
+def claim_job():
+    """
+    Marks the next due job as running and returns it, or None if there is
+    nothing to do. The conditional update makes sure that only one worker
+    can claim a job, even across processes.
+    """
+    now = timezone.now()
+    candidates = RenderJob.objects.filter(
+        status=RenderJob.QUEUED,
+        run_after__lte=now
+    ).values_list('pk', flat=True)[:10]
+
+    for pk in candidates:
+        claimed = RenderJob.objects.filter(
+            pk=pk,
+            status=RenderJob.QUEUED
+        ).update(
+            status=RenderJob.RUNNING,
+            started=now,
+            finished=None,
+            attempts=F('attempts') + 1
+        )
+        if claimed:
+            job = RenderJob.objects.get(pk=pk)
+            notify_status(job.recipe_id)
+            return job
+    return None
+
+
+def requeue_stale_jobs():
+    """
+    Puts jobs back into the queue which are still marked as running although
+    their worker must have died, e.g. because the process was restarted.
+    Jobs which used all their attempts are marked as failed instead, so a
+    job which crashes its worker isn't retried forever.
+    """
+    deadline = timezone.now() - timedelta(seconds=settings.RENDER_JOB_LEASE)
+    stale = RenderJob.objects.filter(
+        status=RenderJob.RUNNING,
+        started__lt=deadline
+    )
+    recipe_ids = set(stale.values_list('recipe_id', flat=True))
+    stale.filter(attempts__gte=settings.RENDER_MAX_ATTEMPTS).update(
+        status=RenderJob.FAILED,
+        finished=timezone.now(),
+        error='The worker stopped during the last attempt without finishing it.'
+    )
+    requeued = stale.update(status=RenderJob.QUEUED)
+    notify_status(*recipe_ids)
+    return requeued
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=settings.RENDER_RETRY_BACKOFF * 2 ** (attempts - 1))
+
+
+def is_cancelled(job):
+    return RenderJob.objects.filter(pk=job.pk, status=RenderJob.CANCELLED).exists()
+
+
+def run_job(job):
+    changes = {}
+    try:
+        render_recipe(job.recipe_id, job.url, is_cancelled=lambda: is_cancelled(job))
+    except RenderCancelled:
+        logger.warning('Render job %s was cancelled.', job.pk)
+        changes['status'] = RenderJob.CANCELLED
+        changes['finished'] = timezone.now()
+    except Exception:
+        changes['error'] = traceback.format_exc()
+        if job.attempts >= settings.RENDER_MAX_ATTEMPTS:
+            changes['status'] = RenderJob.FAILED
+            changes['finished'] = timezone.now()
+        else:
+            changes['status'] = RenderJob.QUEUED
+            changes['run_after'] = timezone.now() + retry_delay(job.attempts)
+        logger.exception('Render job %s failed (attempt %s).', job.pk, job.attempts)
+    else:
+        changes['status'] = RenderJob.DONE
+        changes['error'] = ""
+        changes['finished'] = timezone.now()
+
+    # A job that was cancelled in the meantime keeps its state.
+    RenderJob.objects.filter(
+        pk=job.pk,
+        status=RenderJob.RUNNING
+    ).update(**changes)
+    notify_status(job.recipe_id)
+    job.refresh_from_db()
+
+    if changes['status'] == RenderJob.DONE:
+        extract_text_of(job.recipe_id)
+    return job
+
+
+def extract_text_of(recipe_id):
+    # The render succeeded regardless of whether its text can be indexed.
+    try:
+        index_recipe_text(recipe_id)
+    except Exception:
+        logger.exception('Could not index the text of recipe %s.', recipe_id)
+
+
+class RenderWorkerPool:
+    """
+    Runs render jobs on a fixed number of threads, which caps the number of
+    concurrent xvfb and wkhtmltopdf processes.
+    """
+    def __init__(self, concurrency, poll_interval=1.0, requeue_interval=60.0, shutdown_timeout=30.0):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        # Seconds between two checks for jobs abandoned by other workers.
+        self.requeue_interval = requeue_interval
+        # Seconds to wait for the running jobs once the pool stops.
+        self.shutdown_timeout = shutdown_timeout
+        self.stopping = threading.Event()
+
+    def run(self, drain=False):
+        """
+        Blocks until `stop` is called, or until the queue is empty when
+        `drain` is set. Running jobs get `shutdown_timeout` seconds to
+        finish, afterwards they are abandoned and queued again as stale jobs.
+        """
+        requeue_stale_jobs()
+        requeued = time.monotonic()
+        threads = [
+            threading.Thread(target=self.work, args=(drain,), daemon=True)
+            for _ in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            while not self.stopping.wait(self.poll_interval):
+                if not any(thread.is_alive() for thread in threads):
+                    break
+                # Workers of other processes may die while this one runs.
+                if time.monotonic() - requeued >= self.requeue_interval:
+                    close_old_connections()
+                    requeue_stale_jobs()
+                    requeued = time.monotonic()
+        finally:
+            self.stop()
+            deadline = time.monotonic() + self.shutdown_timeout
+            for thread in threads:
+                thread.join(max(deadline - time.monotonic(), 0))
+            connections.close_all()
+
+    def stop(self):
+        self.stopping.set()
+
+    def work(self, drain):
+        try:
+            while not self.stopping.is_set():
+                close_old_connections()
+                job = claim_job()
+                if job is not None:
+                    run_job(job)
+                elif drain:
+                    return
+                else:
+                    self.stopping.wait(self.poll_interval)
+        finally:
+            connections.close_all()
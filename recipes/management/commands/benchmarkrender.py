@@ -0,0 +1,73 @@
+import os
+import time
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from recipes.displays import DisplayPool
+from recipes.rendering import run_download
+
+FIXTURE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    'benchmarks',
+    'recipe.html'
+)
+
+
+class Command(BaseCommand):
+    help = 'Compares the render throughput of xvfb-run with the persistent display pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--renders',
+            type=int,
+            default=20,
+            help='The number of pdfs rendered by every backend.'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=2,
+            help='The number of renders running at the same time.'
+        )
+
+    def handle(self, *args, **options):
+        url = 'file://{}'.format(FIXTURE)
+        renders = options['renders']
+        concurrency = options['concurrency']
+
+        elapsed = self.benchmark(url, renders, concurrency, lambda render: render(None))
+        self.report('xvfb-run', renders, elapsed)
+
+        pool = DisplayPool(size=concurrency)
+        pool.start()
+        try:
+            def with_display(render):
+                with pool.lease() as display:
+                    render(display)
+
+            elapsed = self.benchmark(url, renders, concurrency, with_display)
+            self.report('display-pool', renders, elapsed)
+        finally:
+            pool.close()
+
+    def benchmark(self, url, renders, concurrency, run):
+        with tempfile.TemporaryDirectory() as directory:
+            def render(index):
+                path = os.path.join(directory, 'recipe-{}.pdf'.format(index))
+                run(lambda display: run_download(url, path, display=display))
+                if not os.path.exists(path):
+                    raise RuntimeError('Render {} did not create a pdf.'.format(index))
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                list(executor.map(render, range(renders)))
+            return time.perf_counter() - started
+
+    def report(self, backend, renders, elapsed):
+        self.stdout.write('{:<14} {:>4} renders in {:>7.2f}s  {:>6.2f} renders/s  {:>7.0f}ms/render'.format(
+            backend,
+            renders,
+            elapsed,
+            renders / elapsed,
+            elapsed * 1000 / renders
+        ))
@@ -0,0 +1,100 @@
+import time
+import heapq
+import random
+from django.core.management.base import BaseCommand
+from recipes.filters import RELATIONS
+from recipes.similarity import SimilarityIndex, jaccard, token
+
+
+class Command(BaseCommand):
+    help = 'Compares the similar recipe lookup of the LSH index with a brute-force Jaccard scan.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes',
+            type=int,
+            default=100000,
+            help='The number of generated recipes.'
+        )
+        parser.add_argument(
+            '--queries',
+            type=int,
+            default=200,
+            help='The number of lookups of the index.'
+        )
+        parser.add_argument(
+            '--scans',
+            type=int,
+            default=20,
+            help='The number of these lookups repeated as brute-force scans.'
+        )
+        parser.add_argument(
+            '-k',
+            type=int,
+            default=10,
+            help='The number of similar recipes per lookup.'
+        )
+
+    def handle(self, *args, **options):
+        generator = random.Random(0)
+        catalog = {
+            pk: self.generate(generator)
+            for pk in range(1, options['recipes'] + 1)
+        }
+        k = options['k']
+
+        index = SimilarityIndex()
+        started = time.perf_counter()
+        for pk, tokens in catalog.items():
+            index.update(pk, tokens)
+        self.stdout.write('Built the index of {} recipes in {:.2f}s.'.format(
+            len(catalog),
+            time.perf_counter() - started
+        ))
+
+        queries = generator.sample(sorted(catalog), min(options['queries'], len(catalog)))
+        durations = []
+        found = {}
+        for pk in queries:
+            started = time.perf_counter()
+            found[pk] = index.nearest(pk, k)
+            durations.append(time.perf_counter() - started)
+        self.report('lsh', durations)
+
+        durations = []
+        recall = []
+        for pk in queries[:options['scans']]:
+            started = time.perf_counter()
+            tokens = catalog[pk]
+            exact = heapq.nlargest(
+                k,
+                (jaccard(tokens, other) for other_pk, other in catalog.items() if other_pk != pk)
+            )
+            durations.append(time.perf_counter() - started)
+            # Ties at the k-th similarity are interchangeable.
+            if exact:
+                recall.append(sum(1 for _, similarity in found[pk] if similarity >= exact[-1]) / len(exact))
+        self.report('brute-force', durations)
+        if recall:
+            self.stdout.write('Recall of the index: {:.2f}'.format(sum(recall) / len(recall)))
+
+    @staticmethod
+    def generate(generator):
+        # A cuisine, a diet, one or two occasions and a few ingredients, of
+        # which some are as common as salt and most are rare.
+        ids = {
+            'cuisines': [generator.randrange(30)],
+            'diets': [generator.randrange(10)],
+            'ingredients': [int(generator.paretovariate(1.2)) % 3000 for _ in range(generator.randint(5, 15))],
+            'occasions': [generator.randrange(20) for _ in range(generator.randint(1, 2))],
+        }
+        return frozenset(token(relation, pk) for relation in RELATIONS for pk in ids[relation])
+
+    def report(self, method, durations):
+        durations = sorted(durations)
+        self.stdout.write('{:<12} {:>5} lookups  {:>9.1f}us mean  {:>9.1f}us p99'.format(
+            method,
+            len(durations),
+            sum(durations) * 1e6 / len(durations),
+            durations[min(len(durations) - 1, int(len(durations) * 0.99))] * 1e6
+        ))
@@ -0,0 +1,37 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from recipes.extraction import ExtractionError, index_recipe_text, pending_recipes
+
+
+class Command(BaseCommand):
+    help = 'Extracts and indexes the text of every pdf which changed since its last extraction.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.RENDER_WORKER_CONCURRENCY,
+            help='The number of pdfs extracted at the same time.'
+        )
+
+    def handle(self, *args, **options):
+        recipe_ids = pending_recipes()
+        self.stdout.write('Extracting the text of {} recipes.'.format(len(recipe_ids)))
+        with ThreadPoolExecutor(max_workers=max(options['workers'], 1)) as executor:
+            results = list(executor.map(self.extract, recipe_ids))
+        self.stdout.write('Indexed {} recipes, {} failed.'.format(
+            results.count(True),
+            results.count(None)
+        ))
+
+    def extract(self, recipe_id):
+        # Every thread uses a database connection of its own.
+        try:
+            return index_recipe_text(recipe_id)
+        except ExtractionError as error:
+            self.stderr.write(str(error))
+            return None
+        finally:
+            connections.close_all()
@@ -0,0 +1,53 @@
+import signal
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipes.jobs import RenderWorkerPool
+from recipes.rendering import close_display_pool, kill_renders
+
+
+class Command(BaseCommand):
+    help = 'Runs the workers which render the pdf exports of queued recipes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=settings.RENDER_WORKER_CONCURRENCY,
+            help='The maximum number of renders running at the same time.'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Seconds to wait before checking an empty queue again.'
+        )
+        parser.add_argument(
+            '--drain',
+            action='store_true',
+            help='Exit as soon as no job is due instead of waiting for new jobs.'
+        )
+        parser.add_argument(
+            '--shutdown-timeout',
+            type=float,
+            default=settings.RENDER_SHUTDOWN_TIMEOUT,
+            help='Seconds to wait for running renders when the workers are stopped.'
+        )
+
+    def handle(self, *args, **options):
+        pool = RenderWorkerPool(
+            concurrency=options['concurrency'],
+            poll_interval=options['poll_interval'],
+            shutdown_timeout=options['shutdown_timeout']
+        )
+        # A SIGTERM, e.g. from the service manager, stops the workers like a Ctrl-C.
+        signal.signal(signal.SIGTERM, lambda signum, frame: pool.stop())
+        self.stdout.write('Starting {} render workers.'.format(pool.concurrency))
+        try:
+            pool.run(drain=options['drain'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            # Renders which outlasted the shutdown timeout.
+            kill_renders()
+            close_display_pool()
+        self.stdout.write('Render workers stopped.')
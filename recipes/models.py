@@ -1,22 +1,98 @@
 import os
-from django.db import models
+import zlib
+from django.db import models, transaction
+from django.db.models import F
+from django.urls import reverse
+from django.utils import timezone
 from cuisines.models import Cuisine
 from diets.models import Diet
 from ingredients.models import Ingredient
 from occasions.models import Occasion
+from recipes.storage import ContentAddressedStorage
+
+
+class RecipeQuerySet(models.QuerySet):
+    def with_relations(self):
+        # Loads all four relations with one query each instead of four
+        # additional queries for every recipe in the result.
+        return self.prefetch_related(
+            'cuisines',
+            'diets',
+            'ingredients',
+            'occasions'
+        )
+
+    def related_to_any(self, relation, ids):
+        """
+        Filters recipes linked to at least one of `ids` through `relation`
+        with a correlated EXISTS on the through table.
+        """
+        through, source, target = Recipe.through_fields(relation)
+        return self.filter(models.Exists(
+            through.objects.filter(**{
+                source: models.OuterRef('pk'),
+                '{}__in'.format(target): ids,
+            })
+        ))
+
+    def related_to_all(self, relation, ids):
+        """
+        Filters recipes linked to every one of `ids` through `relation`,
+        grouping the matching through rows by recipe.
+        """
+        ids = set(ids)
+        through, source, target = Recipe.through_fields(relation)
+        matches = through.objects.filter(**{
+            '{}__in'.format(target): ids
+        }).values(source).annotate(
+            matches=models.Count(target)
+        ).filter(matches=len(ids)).values(source)
+        return self.filter(pk__in=matches)
+
+    def touch(self):
+        # Marks the recipes as updated for writes which don't save them.
+        return self.update(updated=timezone.now())
+
+    def versions(self):
+        """
+        Returns the latest update of the recipes together with the sum and
+        the latest update of the table versions, or None if there are no
+        recipes. Every part is a subquery which reads a single index entry
+        or the few table versions, so the query is cheap at any size.
+        """
+        tables = TableVersion.objects.order_by()
+        return Recipe.objects.order_by().annotate(
+            latest=models.Subquery(self.order_by('-updated').values('updated')[:1]),
+            version=models.Subquery(tables.values(
+                total=models.Func(F('version'), function='SUM', output_field=models.BigIntegerField())
+            )),
+            changed=models.Subquery(tables.values(
+                newest=models.Func(F('updated'), function='MAX', output_field=models.DateTimeField())
+            )),
+        ).values_list('latest', 'version', 'changed').first()
 
 
 class Recipe(models.Model):
     name = models.TextField(unique=True)
     created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
     url = models.URLField(blank=True, null=True, default="")
     note = models.TextField(blank=True, null=True, default="")
-    file = models.FileField(blank=True, null=True)
+    file = models.FileField(
+        blank=True,
+        null=True,
+        upload_to='recipes',
+        storage=ContentAddressedStorage()
+    )
+    # Identifies the url and render options the current file was created with.
+    render_fingerprint = models.CharField(max_length=64, blank=True, default="")
+
+    cuisines = models.ManyToManyField(Cuisine, blank=True, default=[], through='RecipeCuisine')
+    diets = models.ManyToManyField(Diet, blank=True, default=[], through='RecipeDiet')
+    ingredients = models.ManyToManyField(Ingredient, blank=True, default=[], through='RecipeIngredient')
+    occasions = models.ManyToManyField(Occasion, blank=True, default=[], through='RecipeOccasion')
 
-    cuisines = models.ManyToManyField(Cuisine, blank=True, default=[])
-    diets = models.ManyToManyField(Diet, blank=True, default=[])
-    ingredients = models.ManyToManyField(Ingredient, blank=True, default=[])
-    occasions = models.ManyToManyField(Occasion, blank=True, default=[])
+    objects = RecipeQuerySet.as_manager()
 
     @property
     def file_url(self):
@@ -24,15 +100,227 @@ class Recipe(models.Model):
 
     @property
     def get_file_url(self):
-        if self.file and hasattr(self.file, 'url'):
-            return self.file.url
+        if self.file:
+            return reverse('recipe-file', args=(self.pk,))
         else:
             return None
 
+    @property
+    def has_file(self):
+        return bool(self.file) and self.file.storage.exists(self.file.name)
+
     @property
     def file_name(self):
         return os.path.basename(self.file.name)
 
+    @staticmethod
+    def through_fields(relation):
+        """
+        Returns the through model of a relation with the names of its
+        recipe and related id columns.
+        """
+        field = Recipe._meta.get_field(relation)
+        return (
+            field.remote_field.through,
+            '{}_id'.format(field.m2m_field_name()),
+            '{}_id'.format(field.m2m_reverse_field_name()),
+        )
+
+    def release_file(self):
+        """
+        Detaches the pdf from the recipe. The file itself is deleted as soon
+        as no other recipe refers to it.
+        """
+        if self.file:
+            FileBlob.objects.release(self.file.name, self.file.storage)
+            self.file = None
+
     class Meta:
         ordering = ('name',)
         db_table = 'Recipe'
+        indexes = [
+            models.Index(fields=('created',), name='Recipe_created_idx'),
+            models.Index(fields=('updated',), name='Recipe_updated_idx'),
+        ]
+
+
+# The through tables keep the names and columns of the tables Django
+# creates for a plain ManyToManyField. The unique pair serves lookups by
+# recipe and the reversed index serves filters by the related object
+# without reading the table itself.
+
+class RecipeCuisine(models.Model):
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, db_index=False)
+    cuisine = models.ForeignKey(Cuisine, on_delete=models.CASCADE, db_index=False)
+
+    class Meta:
+        db_table = 'Recipe_cuisines'
+        unique_together = (('recipe', 'cuisine'),)
+        indexes = [
+            models.Index(fields=('cuisine', 'recipe'), name='Recipe_cuisine_recipe_idx'),
+        ]
+
+
+class RecipeDiet(models.Model):
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, db_index=False)
+    diet = models.ForeignKey(Diet, on_delete=models.CASCADE, db_index=False)
+
+    class Meta:
+        db_table = 'Recipe_diets'
+        unique_together = (('recipe', 'diet'),)
+        indexes = [
+            models.Index(fields=('diet', 'recipe'), name='Recipe_diet_recipe_idx'),
+        ]
+
+
+class RecipeIngredient(models.Model):
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, db_index=False)
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE, db_index=False)
+
+    class Meta:
+        db_table = 'Recipe_ingredients'
+        unique_together = (('recipe', 'ingredient'),)
+        indexes = [
+            models.Index(fields=('ingredient', 'recipe'), name='Recipe_ingredient_recipe_idx'),
+        ]
+
+
+class RecipeOccasion(models.Model):
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, db_index=False)
+    occasion = models.ForeignKey(Occasion, on_delete=models.CASCADE, db_index=False)
+
+    class Meta:
+        db_table = 'Recipe_occasions'
+        unique_together = (('recipe', 'occasion'),)
+        indexes = [
+            models.Index(fields=('occasion', 'recipe'), name='Recipe_occasion_recipe_idx'),
+        ]
+
+
+class RenderJob(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+        (CANCELLED, 'Cancelled'),
+    )
+    FINAL_STATES = (DONE, FAILED, CANCELLED)
+
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='render_jobs')
+    url = models.URLField()
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(blank=True, null=True)
+    finished = models.DateTimeField(blank=True, null=True)
+    error = models.TextField(blank=True, default="")
+
+    class Meta:
+        ordering = ('run_after', 'id')
+        db_table = 'RenderJob'
+        indexes = [
+            models.Index(fields=('status', 'run_after')),
+        ]
+
+
+class FileBlobManager(models.Manager):
+    def acquire(self, name):
+        """
+        Registers another reference to the stored file `name`.
+        """
+        with transaction.atomic():
+            blob, created = self.select_for_update().get_or_create(name=name)
+            self.filter(pk=blob.pk).update(references=F('references') + 1)
+
+    def release(self, name, storage):
+        """
+        Removes a reference to the stored file `name` and deletes the file
+        together with its last reference.
+        """
+        with transaction.atomic():
+            blob = self.select_for_update().filter(name=name).first()
+            if blob is not None and blob.references > 1:
+                self.filter(pk=blob.pk).update(references=F('references') - 1)
+                return
+            if blob is not None:
+                blob.delete()
+            # Files stored before blobs were counted belong to a single recipe.
+            transaction.on_commit(lambda: storage.delete(name))
+
+    def digest(self, name, hash_file):
+        """
+        Returns the SHA-256 of the stored file `name`, which is computed by
+        `hash_file` only the first time.
+        """
+        digest = self.filter(name=name).exclude(digest="").values_list('digest', flat=True).first()
+        if digest is None:
+            digest = hash_file()
+            self.update_or_create(name=name, defaults={'digest': digest})
+        return digest
+
+
+class FileBlob(models.Model):
+    """
+    Counts the recipes sharing a content addressed file. `digest` caches
+    the SHA-256 of files whose name isn't their digest.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    references = models.PositiveIntegerField(default=0)
+    digest = models.CharField(max_length=64, blank=True, default="")
+
+    objects = FileBlobManager()
+
+    class Meta:
+        db_table = 'FileBlob'
+
+
+class RecipeText(models.Model):
+    """
+    The text of the pdf of a recipe, compressed with zlib. `digest` is the
+    SHA-256 of the pdf the text was extracted from.
+    """
+    recipe = models.OneToOneField(Recipe, primary_key=True, on_delete=models.CASCADE, related_name='text')
+    digest = models.CharField(max_length=64, db_index=True)
+    content = models.BinaryField()
+
+    @property
+    def text(self):
+        return zlib.decompress(self.content).decode('utf-8')
+
+    @staticmethod
+    def compress(text):
+        return zlib.compress(text.encode('utf-8'), 9)
+
+    class Meta:
+        db_table = 'RecipeText'
+
+
+class TableVersion(models.Model):
+    """
+    A counter of the writes to a table, which are not visible in the
+    updated field of a recipe: deleted recipes and saved or deleted
+    cuisines, diets, ingredients and occasions.
+    """
+    table = models.CharField(max_length=64, primary_key=True)
+    version = models.BigIntegerField(default=0)
+    updated = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def bump(cls, table):
+        changes = {'version': F('version') + 1, 'updated': timezone.now()}
+        if cls.objects.filter(table=table).update(**changes):
+            return
+        _, created = cls.objects.get_or_create(table=table, defaults={'version': 1})
+        if not created:
+            # Another transaction created the row first.
+            cls.objects.filter(table=table).update(**changes)
+
+    class Meta:
+        db_table = 'TableVersion'
@@ -0,0 +1,185 @@
+import re
+from django.conf import settings
+from CookbookAPI.indexes import VersionedIndex
+from recipes.models import Recipe
+
+# The number of recipes whose ingredients are loaded per query.
+BATCH_SIZE = 500
+
+ONE_PATTERN = re.compile('1')
+
+
+def bitmask(slots, length):
+    # Setting bits in a byte array is much faster than shifting an int per bit.
+    data = bytearray((length + 7) // 8)
+    for slot in slots:
+        data[slot >> 3] |= 1 << (slot & 7)
+    return int.from_bytes(data, 'little')
+
+
+def set_bits(mask):
+    # Yields the positions of the set bits of `mask`, the lowest first.
+    for match in ONE_PATTERN.finditer(bin(mask)[:1:-1]):
+        yield match.start()
+
+
+class PantryIndex(VersionedIndex):
+    """
+    The ingredients of every recipe as bitsets, refreshed every
+    PANTRY_REFRESH_INTERVAL seconds. Every recipe with ingredients has a
+    slot, a bit position, and every ingredient a bitset of the slots of its
+    recipes, so a pantry is matched against the whole catalog with a few
+    operations on large ints instead of one per recipe.
+    The bitsets need one bit per recipe and ingredient. The slot of a
+    recipe which lost all its ingredients is reused by the next recipe.
+    """
+    version_key = 'pantry'
+
+    @property
+    def refresh_interval(self):
+        return settings.PANTRY_REFRESH_INTERVAL
+
+    def __init__(self):
+        super(PantryIndex, self).__init__()
+        self.clear()
+
+    def clear(self):
+        self.slots = {}
+        self.recipe_ids = []
+        # Slots which no recipe uses, their bits are cleared everywhere.
+        self.free = []
+        self.ingredients = {}
+        # The slots of the recipes of every ingredient.
+        self.columns = {}
+        # The slots of the recipes by their number of ingredients.
+        self.sizes = {}
+
+    def build(self):
+        through, source, target = Recipe.through_fields('ingredients')
+        links = {}
+        for recipe_id, ingredient_id in through.objects.values_list(source, target).iterator():
+            links.setdefault(recipe_id, set()).add(ingredient_id)
+
+        columns = {}
+        sizes = {}
+        for recipe_id in sorted(links):
+            slot = len(self.recipe_ids)
+            self.slots[recipe_id] = slot
+            self.recipe_ids.append(recipe_id)
+            self.ingredients[recipe_id] = frozenset(links[recipe_id])
+            for ingredient_id in links[recipe_id]:
+                columns.setdefault(ingredient_id, []).append(slot)
+            sizes.setdefault(len(links[recipe_id]), []).append(slot)
+        length = len(self.recipe_ids)
+        self.columns = {pk: bitmask(slots, length) for pk, slots in columns.items()}
+        self.sizes = {size: bitmask(slots, length) for size, slots in sizes.items()}
+
+    def changed(self, recipe_ids=(), ingredient_ids=()):
+        """
+        Reloads the ingredients of the recipes with `recipe_ids` and of the
+        recipes linked to the ingredients with `ingredient_ids` once the
+        current transaction commits.
+        """
+        super(PantryIndex, self).changed(list(recipe_ids), list(ingredient_ids))
+
+    def apply(self, recipe_ids, ingredient_ids):
+        recipe_ids = set(recipe_ids)
+        for ingredient_id in ingredient_ids:
+            for slot in set_bits(self.columns.get(ingredient_id, 0)):
+                recipe_ids.add(self.recipe_ids[slot])
+        recipe_ids = sorted(recipe_ids)
+
+        through, source, target = Recipe.through_fields('ingredients')
+        links = {pk: set() for pk in recipe_ids}
+        for start in range(0, len(recipe_ids), BATCH_SIZE):
+            rows = through.objects.filter(**{
+                '{}__in'.format(source): recipe_ids[start:start + BATCH_SIZE]
+            }).values_list(source, target)
+            for recipe_id, ingredient_id in rows:
+                links[recipe_id].add(ingredient_id)
+        for recipe_id in recipe_ids:
+            self.update(recipe_id, frozenset(links[recipe_id]))
+
+    def update(self, recipe_id, ingredients):
+        old = self.ingredients.pop(recipe_id, frozenset())
+        if ingredients:
+            self.ingredients[recipe_id] = ingredients
+        if old == ingredients:
+            return
+        if recipe_id not in self.slots:
+            if self.free:
+                slot = self.free.pop()
+                self.recipe_ids[slot] = recipe_id
+            else:
+                slot = len(self.recipe_ids)
+                self.recipe_ids.append(recipe_id)
+            self.slots[recipe_id] = slot
+        bit = 1 << self.slots[recipe_id]
+
+        for ingredient_id in old - ingredients:
+            self.columns[ingredient_id] &= ~bit
+            if not self.columns[ingredient_id]:
+                del self.columns[ingredient_id]
+        for ingredient_id in ingredients - old:
+            self.columns[ingredient_id] = self.columns.get(ingredient_id, 0) | bit
+        if old:
+            self.sizes[len(old)] &= ~bit
+            if not self.sizes[len(old)]:
+                del self.sizes[len(old)]
+        if ingredients:
+            self.sizes[len(ingredients)] = self.sizes.get(len(ingredients), 0) | bit
+        else:
+            slot = self.slots.pop(recipe_id)
+            self.recipe_ids[slot] = None
+            self.free.append(slot)
+
+    def match(self, ingredient_ids, limit, max_missing=None):
+        """
+        Returns the id and the number of covered and missing ingredients of
+        at most `limit` recipes which use any of `ingredient_ids`. Recipes
+        covering most ingredients come first, then those missing fewest.
+        Recipes with equal counts are in no particular order.
+        """
+        self.refresh()
+
+        with self.lock:
+            columns = [self.columns[pk] for pk in set(ingredient_ids) if pk in self.columns]
+            # Adds the columns into a binary counter for every slot at once,
+            # the n-th plane holds the n-th bit of every count.
+            planes = []
+            for column in columns:
+                carry = column
+                for index, plane in enumerate(planes):
+                    planes[index] = plane ^ carry
+                    carry &= plane
+                    if not carry:
+                        break
+                if carry:
+                    planes.append(carry)
+            matched = 0
+            for plane in planes:
+                matched |= plane
+
+            results = []
+            for covered in range(len(columns), 0, -1):
+                if covered >> len(planes):
+                    # No count has that many bits.
+                    continue
+                group = matched
+                for index, plane in enumerate(planes):
+                    group &= plane if covered >> index & 1 else ~plane
+                if not group:
+                    continue
+                for size in sorted(self.sizes):
+                    if size < covered:
+                        continue
+                    if max_missing is not None and size - covered > max_missing:
+                        break
+                    for slot in set_bits(group & self.sizes[size]):
+                        results.append((self.recipe_ids[slot], covered, size - covered))
+                        if len(results) == limit:
+                            return results
+            return results
+
+
+pantry_index = PantryIndex()
@@ -0,0 +1,34 @@
+import os
+import ctypes
+import signal
+import resource
+
+
+# From <linux/prctl.h>.
+PR_SET_PDEATHSIG = 1
+
+try:
+    prctl = ctypes.CDLL(None, use_errno=True).prctl
+except (OSError, AttributeError):
+    # Only Linux has prctl, elsewhere children are stopped on shutdown only.
+    prctl = None
+
+
+def child_setup(memory_limit=None):
+    """
+    Returns a `preexec_fn` which kills the child together with the thread
+    that started it, and limits the address space of the child and of all
+    processes it starts to `memory_limit` bytes. It runs between fork and
+    exec, so it only calls into the C library.
+    """
+    parent = os.getpid()
+
+    def setup():
+        if prctl is not None:
+            prctl(PR_SET_PDEATHSIG, signal.SIGKILL)
+            # The parent may have died before the signal was requested.
+            if os.getppid() != parent:
+                os._exit(1)
+        if memory_limit:
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    return setup
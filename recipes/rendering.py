@@ -0,0 +1,202 @@
+import os
+import signal
+import logging
+import hashlib
+import asyncio
+import tempfile
+import threading
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from recipes.models import FileBlob, Recipe
+from recipes.displays import DisplayPool
+from recipes.processes import child_setup
+
+logger = logging.getLogger(__name__)
+
+
+# Changing the options invalidates the fingerprint of every rendered file.
+RENDER_OPTIONS = ('--zoom', '1.0', '--load-error-handling', 'ignore')
+# Seconds between two checks whether a running render was cancelled.
+CANCEL_POLL_INTERVAL = 1.0
+
+# Starts a new X server for every render.
+XVFB_RUN_BACKEND = 'xvfb-run'
+# Renders on one of RENDER_WORKER_CONCURRENCY long running X servers.
+DISPLAY_POOL_BACKEND = 'display-pool'
+
+display_pool = None
+display_pool_lock = threading.Lock()
+
+# The running render processes, which are killed when the worker stops.
+render_processes = set()
+render_processes_lock = threading.Lock()
+
+
+class RenderError(Exception):
+    pass
+
+
+class RenderCancelled(RenderError):
+    pass
+
+
+def render_fingerprint(url):
+    """
+    Returns a digest of everything that influences the rendered pdf, which
+    is used to skip renders that would produce the same file again.
+    """
+    content = '\n'.join((url,) + RENDER_OPTIONS)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def render_recipe(recipe_id, url, is_cancelled=None):
+    """
+    Downloads a pdf export of `url` and attaches it to the recipe, as long as
+    the recipe still points to that url. `is_cancelled` is polled while the
+    render is running and aborts it once it returns True.
+    Raises a RenderError if no pdf could be created.
+    """
+    instance = Recipe.objects.get(pk=recipe_id)
+
+    with tempfile.TemporaryDirectory() as directory:
+        local_file_path = os.path.join(directory, 'recipe-{}.pdf'.format(instance.id))
+        if settings.RENDER_BACKEND == DISPLAY_POOL_BACKEND:
+            with get_display_pool().lease() as display:
+                run_download(url, local_file_path, is_cancelled, display)
+        else:
+            run_download(url, local_file_path, is_cancelled)
+
+        # Set the loaded file to the instance.
+        try:
+            with open(local_file_path, 'rb') as file:
+                attach_file(instance, url, File(file, name=os.path.basename(file.name)))
+        except FileNotFoundError:
+            raise RenderError('Could not find file {}'.format(local_file_path))
+
+
+def attach_file(instance, url, file):
+    field = Recipe._meta.get_field('file')
+    with transaction.atomic():
+        instance = Recipe.objects.select_for_update().get(pk=instance.pk)
+        if instance.url != url:
+            raise RenderCancelled('The url of recipe {} changed.'.format(instance.id))
+
+        # Identical pdfs are stored once and shared between recipes.
+        name = field.storage.save(field.generate_filename(instance, file.name), file)
+        FileBlob.objects.acquire(name)
+        # The last reference might have been released since the file was saved.
+        if not field.storage.exists(name):
+            field.storage.save(name, file)
+
+        if instance.file.name == name:
+            # The recipe already held a reference to the same file.
+            FileBlob.objects.release(name, field.storage)
+        else:
+            instance.release_file()
+            instance.file = name
+        instance.render_fingerprint = render_fingerprint(url)
+        instance.save(update_fields=['file', 'render_fingerprint', 'updated'])
+        logger.info('Did save instance with file %s', instance.file)
+
+
+def get_display_pool():
+    global display_pool
+    with display_pool_lock:
+        if display_pool is None:
+            display_pool = DisplayPool(size=settings.RENDER_WORKER_CONCURRENCY)
+        return display_pool
+
+
+def close_display_pool():
+    global display_pool
+    with display_pool_lock:
+        if display_pool is not None:
+            display_pool.close()
+            display_pool = None
+
+
+def kill_renders():
+    with render_processes_lock:
+        for process in render_processes:
+            kill_process_group(process)
+
+
+def run_download(url, local_file_path, is_cancelled=None, display=None):
+    """
+    Runs `download_file` on a new event loop. The loop is paused every
+    CANCEL_POLL_INTERVAL seconds to call `is_cancelled` on the calling
+    thread, so it can use the database connection of that thread.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        task = loop.create_task(download_file(url, local_file_path, display))
+        while True:
+            done, _ = loop.run_until_complete(asyncio.wait({task}, timeout=CANCEL_POLL_INTERVAL))
+            if done:
+                return task.result()
+            if is_cancelled is not None and is_cancelled():
+                task.cancel()
+                try:
+                    loop.run_until_complete(task)
+                except asyncio.CancelledError:
+                    pass
+                raise RenderCancelled('Rendering {} was cancelled.'.format(url))
+    finally:
+        loop.close()
+
+
+async def download_file(url, local_file_path, display=None):
+    """
+    Renders `url` into `local_file_path`, either on the given display or on
+    a new X server. The render is killed together with all of its child
+    processes when it exceeds RENDER_TIMEOUT, when it is cancelled or when
+    the worker stops.
+    """
+    # Load a file for the new URL
+    command = ('wkhtmltopdf',) + RENDER_OPTIONS + (url, local_file_path)
+    environment = None
+    if display is None:
+        command = ('xvfb-run', '-a', '-s', '-screen 0 640x480x16') + command
+    else:
+        environment = dict(os.environ, DISPLAY=display.name)
+
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        env=environment,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL,
+        # A session of its own allows killing xvfb, X and wkhtmltopdf at once.
+        start_new_session=True,
+        # The memory limit applies to every process started by the render.
+        preexec_fn=child_setup(settings.RENDER_MEMORY_LIMIT)
+    )
+    with render_processes_lock:
+        render_processes.add(process)
+    try:
+        try:
+            await asyncio.wait_for(process.wait(), timeout=settings.RENDER_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise RenderError('Rendering {} timed out.'.format(url))
+    except BaseException:
+        kill_process_group(process)
+        await process.wait()
+        remove_file(local_file_path)
+        raise
+    finally:
+        with render_processes_lock:
+            render_processes.discard(process)
+
+
+def kill_process_group(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,310 @@
+import re
+import html
+from django.conf import settings
+from django.db.models import Q
+from recipes.models import Recipe, RecipeText
+
+# Surround the matched terms of a snippet before it is escaped.
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+# The number of words of a snippet.
+SNIPPET_WORDS = 12
+# Matches in the name count this much more than matches in the note.
+NAME_WEIGHT = 10.0
+# Matches in the text of the pdf count this much of matches in the note.
+TEXT_WEIGHT = 0.5
+
+TERM_PATTERN = re.compile(r'\w+')
+
+
+def parse_terms(query):
+    """
+    Returns the words of a search query. Operators of the database's
+    query syntax are dropped, so every query is valid.
+    """
+    return TERM_PATTERN.findall(query)
+
+
+def highlight(snippet):
+    # The snippet contains user text, so only the highlight is markup.
+    return html.escape(snippet or '').replace(
+        HIGHLIGHT_START, '<mark>'
+    ).replace(
+        HIGHLIGHT_END, '</mark>'
+    )
+
+
+class SQLiteSearchBackend:
+    """
+    An FTS5 index over the name and note of every recipe. The index reads
+    its content from the Recipe table and is updated by triggers, so every
+    write path keeps it in sync, including bulk writes.
+    The text of the pdfs is indexed by a second, contentless FTS5 table,
+    since it is only stored compressed.
+    """
+    table = 'RecipeSearch'
+    text_table = 'RecipeTextSearch'
+
+    def install(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = %s", [self.table])
+            exists = cursor.fetchone() is not None
+            if not exists:
+                cursor.execute(
+                    'CREATE VIRTUAL TABLE "{table}" USING fts5('
+                    'name, note, content="Recipe", content_rowid="id", '
+                    'tokenize="unicode61 remove_diacritics 2", prefix="2 3")'.format(table=self.table)
+                )
+            # Rebuilding the Recipe table during a migration drops its triggers.
+            cursor.execute(
+                'CREATE TRIGGER IF NOT EXISTS "{table}_insert" AFTER INSERT ON "Recipe" BEGIN '
+                'INSERT INTO "{table}" (rowid, name, note) VALUES (new.id, new.name, new.note); '
+                'END'.format(table=self.table)
+            )
+            cursor.execute(
+                'CREATE TRIGGER IF NOT EXISTS "{table}_delete" AFTER DELETE ON "Recipe" BEGIN '
+                'INSERT INTO "{table}" ("{table}", rowid, name, note) VALUES (\'delete\', old.id, old.name, old.note); '
+                'END'.format(table=self.table)
+            )
+            cursor.execute(
+                'CREATE TRIGGER IF NOT EXISTS "{table}_update" AFTER UPDATE OF name, note ON "Recipe" BEGIN '
+                'INSERT INTO "{table}" ("{table}", rowid, name, note) VALUES (\'delete\', old.id, old.name, old.note); '
+                'INSERT INTO "{table}" (rowid, name, note) VALUES (new.id, new.name, new.note); '
+                'END'.format(table=self.table)
+            )
+            if not exists:
+                cursor.execute('INSERT INTO "{table}" ("{table}") VALUES (\'rebuild\')'.format(table=self.table))
+
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = %s", [self.text_table])
+            if cursor.fetchone() is None:
+                cursor.execute(
+                    'CREATE VIRTUAL TABLE "{table}" USING fts5('
+                    'text, content="", tokenize="unicode61 remove_diacritics 2", prefix="2 3")'.format(
+                        table=self.text_table
+                    )
+                )
+                for recipe_id, content in RecipeText.objects.using(connection.alias).values_list('recipe', 'content'):
+                    self.index_text(connection, recipe_id, None, RecipeText(content=content).text)
+
+    def index_text(self, connection, recipe_id, old_text, text):
+        # A contentless table can only remove the tokens of the exact old text.
+        self.remove_text(connection, recipe_id, old_text)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO "{table}" (rowid, text) VALUES (%s, %s)'.format(table=self.text_table),
+                [recipe_id, text]
+            )
+
+    def remove_text(self, connection, recipe_id, old_text):
+        if old_text is None:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO "{table}" ("{table}", rowid, text) VALUES (\'delete\', %s, %s)'.format(
+                    table=self.text_table
+                ),
+                [recipe_id, old_text]
+            )
+
+    def search(self, connection, terms, limit):
+        # Every term must match, the last one may be the beginning of a word.
+        match = ' '.join('"{}"'.format(term) for term in terms) + '*'
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT id, SUM(score) AS total, MAX(snippet) FROM ('
+                'SELECT rowid AS id, -bm25("{table}", %s, 1.0) AS score, '
+                'snippet("{table}", -1, %s, %s, %s, %s) AS snippet '
+                'FROM "{table}" WHERE "{table}" MATCH %s '
+                'UNION ALL '
+                'SELECT rowid, -bm25("{text_table}") * %s, NULL '
+                'FROM "{text_table}" WHERE "{text_table}" MATCH %s'
+                ') GROUP BY id ORDER BY total DESC, id LIMIT %s'.format(
+                    table=self.table,
+                    text_table=self.text_table
+                ),
+                [
+                    NAME_WEIGHT, HIGHLIGHT_START, HIGHLIGHT_END, '…', SNIPPET_WORDS, match,
+                    TEXT_WEIGHT, match,
+                    limit
+                ]
+            )
+            return cursor.fetchall()
+
+
+class PostgreSQLSearchBackend:
+    """
+    A weighted tsvector column of the Recipe table, generated from the name
+    and note on every write and indexed with GIN. Requires PostgreSQL 12.
+    The text of the pdfs is only stored compressed, so its tsvector column
+    is written together with the text.
+    PostgreSQL has no BM25, the results are ranked by cover density instead.
+    """
+    column = 'search'
+    index = 'Recipe_search_idx'
+    text_index = 'RecipeText_search_idx'
+
+    def install(self, connection):
+        config = self.config()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'ALTER TABLE "Recipe" ADD COLUMN IF NOT EXISTS "{column}" tsvector '
+                'GENERATED ALWAYS AS ('
+                'setweight(to_tsvector(\'{config}\'::regconfig, coalesce("name", \'\')), \'A\') || '
+                'setweight(to_tsvector(\'{config}\'::regconfig, coalesce("note", \'\')), \'B\')'
+                ') STORED'.format(column=self.column, config=config)
+            )
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS "{index}" ON "Recipe" USING GIN ("{column}")'.format(
+                    index=self.index,
+                    column=self.column
+                )
+            )
+            cursor.execute(
+                'ALTER TABLE "RecipeText" ADD COLUMN IF NOT EXISTS "{column}" tsvector'.format(column=self.column)
+            )
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS "{index}" ON "RecipeText" USING GIN ("{column}")'.format(
+                    index=self.text_index,
+                    column=self.column
+                )
+            )
+
+    def index_text(self, connection, recipe_id, old_text, text):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'UPDATE "RecipeText" SET "{column}" = to_tsvector(%s::regconfig, %s) '
+                'WHERE "recipe_id" = %s'.format(column=self.column),
+                [self.config(), text, recipe_id]
+            )
+
+    def remove_text(self, connection, recipe_id, old_text):
+        # The tsvector is removed together with its row.
+        pass
+
+    def search(self, connection, terms, limit):
+        config = self.config()
+        query = ' & '.join(terms) + ':*'
+        # The weights of the labels D, C, B and A, where A marks the name.
+        weights = '{{{0}, {0}, {0}, 1.0}}'.format(1.0 / NAME_WEIGHT)
+        options = 'StartSel={}, StopSel={}, MaxWords={}, MinWords={}'.format(
+            HIGHLIGHT_START,
+            HIGHLIGHT_END,
+            SNIPPET_WORDS,
+            SNIPPET_WORDS // 2
+        )
+        with connection.cursor() as cursor:
+            # Headlines are expensive, so only the best matches of the name
+            # and note get one.
+            cursor.execute(
+                'SELECT matches.id, matches.score, '
+                'CASE WHEN "Recipe"."{column}" @@ query THEN '
+                'ts_headline(%s::regconfig, concat_ws(\' \', "Recipe"."name", "Recipe"."note"), query, %s) '
+                'END '
+                'FROM ('
+                'SELECT id, SUM(score) AS score FROM ('
+                'SELECT "Recipe"."id", ts_rank_cd(%s::float4[], "Recipe"."{column}", query) AS score '
+                'FROM "Recipe", to_tsquery(%s::regconfig, %s) query '
+                'WHERE "Recipe"."{column}" @@ query '
+                'UNION ALL '
+                'SELECT "RecipeText"."recipe_id", ts_rank_cd("RecipeText"."{column}", query) * %s '
+                'FROM "RecipeText", to_tsquery(%s::regconfig, %s) query '
+                'WHERE "RecipeText"."{column}" @@ query'
+                ') scores GROUP BY id ORDER BY score DESC, id LIMIT %s'
+                ') matches JOIN "Recipe" ON "Recipe"."id" = matches.id, to_tsquery(%s::regconfig, %s) query '
+                'ORDER BY matches.score DESC, matches.id'.format(column=self.column),
+                [
+                    config, options,
+                    weights, config, query,
+                    TEXT_WEIGHT, config, query,
+                    limit,
+                    config, query
+                ]
+            )
+            return cursor.fetchall()
+
+    @staticmethod
+    def config():
+        config = settings.SEARCH_CONFIG
+        if not re.match(r'^\w+$', config):
+            raise ValueError('Invalid text search configuration {}.'.format(config))
+        return config
+
+
+class LikeSearchBackend:
+    """
+    Scans the name and note of every recipe on databases without a
+    supported full-text index.
+    """
+    def install(self, connection):
+        pass
+
+    def index_text(self, connection, recipe_id, old_text, text):
+        pass
+
+    def remove_text(self, connection, recipe_id, old_text):
+        pass
+
+    def search(self, connection, terms, limit):
+        # The text of the pdfs is compressed and can't be scanned.
+        condition = Q()
+        for term in terms:
+            condition &= Q(name__icontains=term) | Q(note__icontains=term)
+        return [
+            (pk, None, None)
+            for pk in Recipe.objects.using(connection.alias).filter(condition).values_list('pk', flat=True)[:limit]
+        ]
+
+
+def get_backend(connection):
+    if connection.vendor == 'sqlite':
+        return SQLiteSearchBackend()
+    if connection.vendor == 'postgresql':
+        return PostgreSQLSearchBackend()
+    return LikeSearchBackend()
+
+
+def search_recipes(connection, query, limit):
+    """
+    Returns the id, score and highlighted snippet of the best matches of
+    `query`, the best match first.
+    """
+    terms = parse_terms(query)
+    if not terms:
+        return []
+    matches = get_backend(connection).search(connection, terms, limit)
+
+    # Recipes which only matched by the text of their pdf get a snippet of it.
+    texts = RecipeText.objects.using(connection.alias).in_bulk(
+        [pk for pk, score, snippet in matches if snippet is None]
+    )
+    results = []
+    for pk, score, snippet in matches:
+        if pk in texts:
+            snippet = text_snippet(texts[pk].text, terms)
+        results.append((pk, score, highlight(snippet) if snippet is not None else None))
+    return results
+
+
+def text_snippet(text, terms):
+    """
+    Returns SNIPPET_WORDS words of `text` around the first word which
+    starts with one of `terms`, with every such word highlighted.
+    """
+    words = text.split()
+    prefixes = tuple(term.lower() for term in terms)
+
+    def matches(word):
+        return any(part.lower().startswith(prefixes) for part in TERM_PATTERN.findall(word))
+
+    first = next((index for index, word in enumerate(words) if matches(word)), 0)
+    start = max(first - SNIPPET_WORDS // 2, 0)
+    window = words[start:start + SNIPPET_WORDS]
+    snippet = ' '.join(
+        HIGHLIGHT_START + word + HIGHLIGHT_END if matches(word) else word
+        for word in window
+    )
+    if start > 0:
+        snippet = '…' + snippet
+    if start + SNIPPET_WORDS < len(words):
+        snippet += '…'
+    return snippet
@@ -1,8 +1,10 @@
-import os
+from typing import Optional
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
-from CookbookAPI import settings
-from django.core.files import File
-from recipes.models import Recipe
+from recipes.models import Recipe, RenderJob
+from recipes.jobs import enqueue_render
+from CookbookAPI.taxonomy import get_or_create_names
 from cuisines.serializers import CuisineSerializer
 from cuisines.models import Cuisine
 from diets.serializers import DietSerializer
@@ -11,9 +13,6 @@ from ingredients.serializers import IngredientSerializer
 from ingredients.models import Ingredient
 from occasions.serializers import OccasionSerializer
 from occasions.models import Occasion
-import subprocess
-import threading
-import asyncio
 
 
 class RecipeSerializer(serializers.ModelSerializer):
@@ -26,10 +25,24 @@ class RecipeSerializer(serializers.ModelSerializer):
     ingredients = IngredientSerializer(many=True, default=[])
     occasions = OccasionSerializer(many=True, default=[])
 
-    cuisine_ids = serializers.ListField(write_only=True, required=False)
-    diet_ids = serializers.ListField(write_only=True, required=False)
-    ingredient_ids = serializers.ListField(write_only=True, required=False)
-    occasion_ids = serializers.ListField(write_only=True, required=False)
+    cuisine_ids = serializers.ListField(child=serializers.IntegerField(), write_only=True, required=False)
+    diet_ids = serializers.ListField(child=serializers.IntegerField(), write_only=True, required=False)
+    ingredient_ids = serializers.ListField(child=serializers.IntegerField(), write_only=True, required=False)
+    occasion_ids = serializers.ListField(child=serializers.IntegerField(), write_only=True, required=False)
+
+    # Names which don't exist yet are created together with the recipe.
+    cuisine_names = serializers.ListField(child=serializers.CharField(), write_only=True, required=False)
+    diet_names = serializers.ListField(child=serializers.CharField(), write_only=True, required=False)
+    ingredient_names = serializers.ListField(child=serializers.CharField(), write_only=True, required=False)
+    occasion_names = serializers.ListField(child=serializers.CharField(), write_only=True, required=False)
+
+    # The write only id and name fields with the model they refer to and the relation they update.
+    relations = (
+        ('cuisine_ids', 'cuisine_names', Cuisine, 'cuisines'),
+        ('diet_ids', 'diet_names', Diet, 'diets'),
+        ('ingredient_ids', 'ingredient_names', Ingredient, 'ingredients'),
+        ('occasion_ids', 'occasion_names', Occasion, 'occasions'),
+    )
 
     class Meta:
         model = Recipe
@@ -47,7 +60,11 @@ class RecipeSerializer(serializers.ModelSerializer):
             'cuisine_ids',
             'diet_ids',
             'ingredient_ids',
-            'occasion_ids'
+            'occasion_ids',
+            'cuisine_names',
+            'diet_names',
+            'ingredient_names',
+            'occasion_names'
         )
         extra_kwargs = {
             'file_url': {
@@ -67,131 +84,151 @@ class RecipeSerializer(serializers.ModelSerializer):
             },
         }
 
+    def validate(self, attrs):
+        # Resolves the ids of every relation with a single query and reports
+        # all unknown ids at once.
+        errors = {}
+        for field, names_field, model, relation in self.relations:
+            ids = attrs.get(field, None)
+            if not ids:
+                continue
+            objects = model.objects.in_bulk(set(ids))
+            missing = [pk for pk in dict.fromkeys(ids) if pk not in objects]
+            if missing:
+                errors[field] = [
+                    'Invalid pk "{}" - object does not exist.'.format(pk)
+                    for pk in missing
+                ]
+            else:
+                attrs[field] = [objects[pk] for pk in dict.fromkeys(ids)]
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
+
     def create(self, validated_data):
-        instance = Recipe.objects.create(
-            name=validated_data.get('name')
-        )
-        try:
-            self.update(instance=instance, validated_data=validated_data)
-        except Cuisine.DoesNotExist:
-            instance.delete()
-        except Diet.DoesNotExist:
-            instance.delete()
-        except Ingredient.DoesNotExist:
-            instance.delete()
-        except Occasion.DoesNotExist:
-            instance.delete()
-        return instance
+        return self.update(instance=Recipe(), validated_data=validated_data)
 
     def update(self, instance, validated_data):
-        instance.name = validated_data.get('name', instance.name)
-        instance.note = validated_data.get('note', instance.note)
-
-        # Update URL related data
-        if validated_data.get('url', None):
-            # Check if there's already a file object present that needs deletion from disk
-            # delete()
-            if instance.get_file_url is not None and validated_data.get('url', None) is not instance.get_file_url:
-                # Create a path for deletion
-                file_path = '{}{}'.format(settings.MEDIA_ROOT, instance.file_name)
-                # Delete if still exists
-                if os.path.exists(file_path):
-                    print('Deleting {}.'.format(file_path))
-                    os.remove(file_path)
-                else:
-                    print('File not found at {}.'.format(file_path))
-                # Delete file reference from database
-                instance.file.delete()
-
-        # Update Cuisines
-        if validated_data.get('cuisine_ids', None):
-            cuisines = []
-            for cuisine_id in validated_data.get('cuisine_ids', None):
-                cuisines.append(Cuisine.objects.get(pk=cuisine_id))
-            instance.cuisines.set(cuisines)
-
-        # Update Diets
-        if validated_data.get('diet_ids', None):
-            diets = []
-            for diet_id in validated_data.get('diet_ids', None):
-                diets.append(Diet.objects.get(pk=diet_id))
-            instance.diets.set(diets)
-
-        # Update Ingredients
-        if validated_data.get('ingredient_ids', None):
-            ingredients = []
-            for ingredient_id in validated_data.get('ingredient_ids', None):
-                ingredients.append(Ingredient.objects.get(pk=ingredient_id))
-            instance.ingredients.set(ingredients)
-
-        # Update Occasions
-        if validated_data.get('occasion_ids', None):
-            occasions = []
-            for occasion_id in validated_data.get('occasion_ids', None):
-                occasions.append(Occasion.objects.get(pk=occasion_id))
-            instance.occasions.set(occasions)
-
-        instance.save()
-
-        # Initialise the thread
-        t = threading.Thread(
-            target=self.threaded_loading,
-            args=(instance.id,)
-        )
-        t.start()
+        with transaction.atomic():
+            instance.name = validated_data.get('name', instance.name)
+            instance.note = validated_data.get('note', instance.note)
+
+            # Update URL related data
+            url = validated_data.get('url', None)
+            if url and url != instance.url:
+                # The export of the previous url no longer belongs to the recipe.
+                instance.release_file()
+                instance.url = url
+
+            instance.save()
+
+            # Update Cuisines, Diets, Ingredients and Occasions
+            for field, names_field, model, relation in self.relations:
+                related = list(validated_data.get(field, None) or [])
+                names = validated_data.get(names_field, None)
+                if names:
+                    related += get_or_create_names(model, names).values()
+                if related:
+                    getattr(instance, relation).set(related)
+
+            # Rolled back writes must not cause a render.
+            transaction.on_commit(lambda: enqueue_render(instance))
 
         return instance
 
-    def threaded_loading(self, recipe_id):
-        instance = Recipe.objects.get(pk=recipe_id)
-        if instance.url is not None and instance.url != "":
-            # The file path for the output file
-            media_root = settings.MEDIA_ROOT
-            if media_root.endswith('/'):
-                media_root = media_root[:-1]
-            local_file_path = "{}/recipe-{}.pdf".format(
-                media_root,
-                instance.id
-            )
-
-            # Get a run loop and wait for it's execution
-            try:
-                loop = asyncio.get_event_loop()
-            except RuntimeError:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-            print('Spawned run loop')
-            loop.run_until_complete(
-                self.download_file(
-                    url=str(instance.url),
-                    local_file_path=local_file_path
-                )
-            )
-            loop.close()
-
-            # Set the loaded file to the instance.
-            try:
-                with open(local_file_path, 'rb') as file:
-                    print('Did open file at {}'.format(local_file_path))
-                    pdf_export = File(file, name=os.path.basename(file.name))
-                    instance.file = pdf_export
-
-                    pdf_export.closed
-                    file.closed
-
-                    instance.save()
-                    print('Did save instance with file {}'.format(instance.file))
-
-            except FileNotFoundError:
-                print('Could not find file '.format(local_file_path))
-
-    async def download_file(self, url, local_file_path):
-        # Load a file for the new URL
-        cmd = "{} {} {} {}".format(
-            'xvfb-run -a -s "-screen 0 640x480x16"',
-            'wkhtmltopdf --zoom 1.0 --load-error-handling ignore',
-            url,
-            local_file_path
+
+class RecipeBulkItemSerializer(RecipeSerializer):
+    """
+    Validates a single item of a bulk write. Existing names update the
+    recipe instead of failing, and the ids of all items are resolved by
+    the bulk write at once.
+    """
+    class Meta(RecipeSerializer.Meta):
+        extra_kwargs = dict(
+            RecipeSerializer.Meta.extra_kwargs,
+            name={
+                'validators': []
+            }
+        )
+
+    def validate(self, attrs):
+        return attrs
+
+
+class RecipeTagSerializer(serializers.Serializer):
+    """
+    Validates a set operation which adds taxonomy entries to or removes
+    them from many recipes. The recipes are either given by id or
+    selected by a filter of related ids.
+    """
+    ADD = 'add'
+    REMOVE = 'remove'
+
+    relation = serializers.ChoiceField(choices=[relation for _, _, _, relation in RecipeSerializer.relations])
+    action = serializers.ChoiceField(choices=[ADD, REMOVE])
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    names = serializers.ListField(child=serializers.CharField(), required=False)
+    recipe_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    filter = serializers.DictField(
+        child=serializers.ListField(child=serializers.IntegerField(), allow_empty=False),
+        required=False
+    )
+
+    def validate(self, attrs):
+        if not attrs.get('ids', None) and not attrs.get('names', None):
+            raise serializers.ValidationError({
+                'ids': ['Either ids or names are required.']
+            })
+        if ('recipe_ids' in attrs) == ('filter' in attrs):
+            raise serializers.ValidationError({
+                'recipe_ids': ['Either recipe_ids or filter is required.']
+            })
+
+        models = {relation: model for _, _, model, relation in RecipeSerializer.relations}
+        unknown = [key for key in attrs.get('filter', {}) if key not in models]
+        if unknown:
+            raise serializers.ValidationError({
+                'filter': ['"{}" is not a relation.'.format(key) for key in unknown]
+            })
+
+        errors = {}
+        for field, model in (('ids', models[attrs['relation']]), ('recipe_ids', Recipe)):
+            ids = set(attrs.get(field, None) or ())
+            existing = set(model.objects.filter(pk__in=ids).values_list('pk', flat=True))
+            missing = [pk for pk in dict.fromkeys(attrs.get(field, None) or ()) if pk not in existing]
+            if missing:
+                errors[field] = [
+                    'Invalid pk "{}" - object does not exist.'.format(pk)
+                    for pk in missing
+                ]
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
+
+
+class RenderJobSerializer(serializers.ModelSerializer):
+    queued_seconds = serializers.SerializerMethodField()
+    running_seconds = serializers.SerializerMethodField()
+
+    class Meta:
+        model = RenderJob
+        fields = (
+            'id',
+            'url',
+            'status',
+            'attempts',
+            'created',
+            'started',
+            'finished',
+            'queued_seconds',
+            'running_seconds',
         )
+        read_only_fields = fields
+
+    def get_queued_seconds(self, job) -> float:
+        return ((job.started or timezone.now()) - job.created).total_seconds()
 
-        subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE).wait()
+    def get_running_seconds(self, job) -> Optional[float]:
+        if job.started is None:
+            return None
+        return ((job.finished or timezone.now()) - job.started).total_seconds()
@@ -0,0 +1,132 @@
+from django.db import connections
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_delete
+from django.dispatch import receiver
+from ingredients.models import Ingredient
+from recipes.facets import notify_facets
+from recipes.filters import RELATIONS
+from recipes.models import Recipe, RecipeText, TableVersion
+from recipes.pantry import pantry_index
+from recipes.search import get_backend
+from recipes.similarity import similarity_index
+from sync.models import Change
+
+
+@receiver(post_delete, sender=Recipe)
+def release_recipe_file(sender, instance, **kwargs):
+    instance.release_file()
+
+
+@receiver(post_migrate)
+def install_search_index(sender, using, **kwargs):
+    # The index is maintained by the database, which needs to be set up once.
+    if sender.name == 'recipes':
+        connection = connections[using]
+        get_backend(connection).install(connection)
+
+
+@receiver(post_delete, sender=RecipeText)
+def remove_recipe_text(sender, instance, using, **kwargs):
+    connection = connections[using]
+    get_backend(connection).remove_text(connection, instance.pk, instance.text)
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def update_pantry_index(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        pantry_index.changed(recipe_ids=[instance.pk])
+    elif action == 'post_clear':
+        pantry_index.changed(ingredient_ids=[instance.pk])
+    else:
+        pantry_index.changed(recipe_ids=pk_set)
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_from_pantry_index(sender, instance, **kwargs):
+    pantry_index.changed(recipe_ids=[instance.pk])
+
+
+@receiver(post_delete, sender=Ingredient)
+def remove_ingredient_from_pantry_index(sender, instance, **kwargs):
+    pantry_index.changed(ingredient_ids=[instance.pk])
+
+
+# The relation of Recipe to every related model.
+RELATED_MODELS = {Recipe._meta.get_field(relation).related_model: relation for relation in RELATIONS}
+
+
+def linked_recipes(related):
+    through, source, target = Recipe.through_fields(RELATED_MODELS[type(related)])
+    return list(through.objects.filter(**{target: related.pk}).values_list(source, flat=True))
+
+
+def update_similarity_index(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            similarity_index.changed([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        similarity_index.changed(pk_set)
+    elif action == 'pre_clear':
+        # The recipes are only known before they are cleared.
+        similarity_index.changed(linked_recipes(instance))
+
+
+def remove_related_from_similarity_index(sender, instance, **kwargs):
+    # The links are deleted with the related object.
+    similarity_index.changed(linked_recipes(instance))
+
+
+for model, relation in RELATED_MODELS.items():
+    m2m_changed.connect(update_similarity_index, sender=Recipe._meta.get_field(relation).remote_field.through)
+    pre_delete.connect(remove_related_from_similarity_index, sender=model)
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_from_similarity_index(sender, instance, **kwargs):
+    similarity_index.changed([instance.pk])
+
+
+def invalidate_facets_on_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        notify_facets()
+
+
+def invalidate_facets(sender, **kwargs):
+    # Renamed and deleted related objects change the facets as well.
+    notify_facets()
+
+
+for model, relation in RELATED_MODELS.items():
+    m2m_changed.connect(invalidate_facets_on_change, sender=Recipe._meta.get_field(relation).remote_field.through)
+    post_save.connect(invalidate_facets, sender=model)
+    post_delete.connect(invalidate_facets, sender=model)
+post_delete.connect(invalidate_facets, sender=Recipe)
+
+
+def touch_recipes(sender, instance, action, reverse, pk_set, **kwargs):
+    # Changed relations change the recipe as it is served and synced.
+    if not reverse:
+        if action not in ('post_add', 'post_remove', 'post_clear'):
+            return
+        recipe_ids = [instance.pk]
+    elif action in ('post_add', 'post_remove'):
+        recipe_ids = list(pk_set)
+    elif action == 'pre_clear':
+        recipe_ids = linked_recipes(instance)
+    else:
+        return
+    Recipe.objects.filter(pk__in=recipe_ids).touch()
+    Change.objects.record(Recipe, recipe_ids)
+
+
+def bump_table_version(sender, **kwargs):
+    TableVersion.bump(sender._meta.db_table)
+
+
+for model, relation in RELATED_MODELS.items():
+    m2m_changed.connect(touch_recipes, sender=Recipe._meta.get_field(relation).remote_field.through)
+    post_save.connect(bump_table_version, sender=model)
+    post_delete.connect(bump_table_version, sender=model)
+# Deleted recipes don't leave an update behind.
+post_delete.connect(bump_table_version, sender=Recipe)
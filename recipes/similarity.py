@@ -0,0 +1,160 @@
+import heapq
+import random
+import itertools
+from django.conf import settings
+from CookbookAPI.indexes import VersionedIndex
+from recipes.filters import RELATIONS
+from recipes.models import Recipe
+
+# A signature has BANDS * ROWS hashes. Recipes share a bucket if all rows
+# of a band are equal, which is likely from a Jaccard similarity of about
+# (1 / BANDS) ** (1 / ROWS), 0.5 here, on.
+BANDS = 16
+ROWS = 4
+# A Mersenne prime larger than every token.
+PRIME = (1 << 61) - 1
+# The most candidates compared to a recipe. Recipes with very common
+# relations share crowded buckets, of which only a part is compared.
+MAX_CANDIDATES = 200
+# The number of recipes whose relations are loaded per query.
+BATCH_SIZE = 500
+
+
+def token(relation, pk):
+    # Ids of different relations must not be equal tokens.
+    return pk * len(RELATIONS) + RELATIONS.index(relation)
+
+
+def jaccard(tokens, other):
+    shared = len(tokens & other)
+    return shared / (len(tokens) + len(other) - shared)
+
+
+class SimilarityIndex(VersionedIndex):
+    """
+    MinHash signatures of the cuisines, diets, ingredients and occasions of
+    every recipe, bucketed by LSH and refreshed every
+    SIMILARITY_REFRESH_INTERVAL seconds. Only recipes sharing a bucket are
+    compared, by the exact Jaccard similarity of their relations.
+    """
+    version_key = 'similarity'
+
+    @property
+    def refresh_interval(self):
+        return settings.SIMILARITY_REFRESH_INTERVAL
+
+    def __init__(self):
+        super(SimilarityIndex, self).__init__()
+        # Fixed, so every process computes the same signatures.
+        generator = random.Random(0)
+        self.coefficients = [
+            (generator.randrange(1, PRIME), generator.randrange(PRIME))
+            for _ in range(BANDS * ROWS)
+        ]
+        self.clear()
+
+    def clear(self):
+        self.tokens = {}
+        # The recipes of every band of their signatures. The signatures are
+        # computed again on updates instead of being kept.
+        self.buckets = {}
+        # The hashes of every token, there are much fewer tokens than recipes.
+        self.hashes = {}
+
+    def build(self):
+        for recipe_id, tokens in self.load().items():
+            self.update(recipe_id, tokens)
+
+    def load(self, recipe_ids=None):
+        """
+        Returns the tokens of the recipes with `recipe_ids`, or of all
+        recipes, with a query per relation and batch.
+        """
+        tokens = {pk: set() for pk in recipe_ids or ()}
+        batches = [None] if recipe_ids is None else [
+            recipe_ids[start:start + BATCH_SIZE]
+            for start in range(0, len(recipe_ids), BATCH_SIZE)
+        ]
+        for relation in RELATIONS:
+            through, source, target = Recipe.through_fields(relation)
+            for batch in batches:
+                rows = through.objects.values_list(source, target)
+                if batch is not None:
+                    rows = rows.filter(**{'{}__in'.format(source): batch})
+                for recipe_id, pk in rows.iterator():
+                    tokens.setdefault(recipe_id, set()).add(token(relation, pk))
+        return {pk: frozenset(values) for pk, values in tokens.items()}
+
+    def changed(self, recipe_ids):
+        """
+        Reloads the relations of the recipes with `recipe_ids` once the
+        current transaction commits.
+        """
+        super(SimilarityIndex, self).changed(list(recipe_ids))
+
+    def apply(self, recipe_ids):
+        for recipe_id, tokens in self.load(sorted(set(recipe_ids))).items():
+            self.update(recipe_id, tokens)
+
+    def update(self, recipe_id, tokens):
+        old = self.tokens.pop(recipe_id, None)
+        if old == tokens:
+            self.tokens[recipe_id] = tokens
+            return
+        if old is not None:
+            for key in self.band_keys(old):
+                bucket = self.buckets[key]
+                bucket.remove(recipe_id)
+                if not bucket:
+                    del self.buckets[key]
+        if not tokens:
+            return
+        self.tokens[recipe_id] = tokens
+        for key in self.band_keys(tokens):
+            # Most buckets hold a single recipe, lists are smaller than sets.
+            self.buckets.setdefault(key, []).append(recipe_id)
+
+    def band_keys(self, tokens):
+        # The minimum of every hash function over all tokens is the signature.
+        signature = tuple(map(min, zip(*(self.token_hashes(token) for token in tokens))))
+        return [hash((band, signature[band * ROWS:(band + 1) * ROWS])) for band in range(BANDS)]
+
+    def token_hashes(self, token):
+        hashes = self.hashes.get(token)
+        if hashes is None:
+            hashes = tuple((a * token + b) % PRIME for a, b in self.coefficients)
+            self.hashes[token] = hashes
+        return hashes
+
+    def similar(self, recipe_id, k):
+        """
+        Returns the id and Jaccard similarity of at most `k` recipes which
+        are most similar to the recipe with `recipe_id`, the most similar
+        first. Recipes below the threshold of the bands are rarely found.
+        """
+        self.refresh()
+        with self.lock:
+            return self.nearest(recipe_id, k)
+
+    def nearest(self, recipe_id, k):
+        tokens = self.tokens.get(recipe_id)
+        if tokens is None:
+            return []
+        # Small buckets are the most specific, so they are read first.
+        buckets = sorted((self.buckets[key] for key in self.band_keys(tokens)), key=len)
+        candidates = set()
+        for bucket in buckets:
+            candidates.update(itertools.islice(bucket, MAX_CANDIDATES - len(candidates)))
+            if len(candidates) >= MAX_CANDIDATES:
+                break
+        candidates.discard(recipe_id)
+        return [
+            (pk, -similarity)
+            for similarity, pk in heapq.nsmallest(
+                k,
+                ((-jaccard(tokens, self.tokens[pk]), pk) for pk in candidates)
+            )
+        ]
+
+
+similarity_index = SimilarityIndex()
@@ -0,0 +1,59 @@
+import os
+import hashlib
+import tempfile
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores every file under the SHA-256 digest of its content, sharded into
+    two levels of sub directories, e.g. `recipes/ab/cd/abcd…ef.pdf`.
+    Saving content which is already stored returns the name of the existing
+    file instead of writing another copy.
+    """
+    temporary_directory = 'tmp'
+
+    def _save(self, name, content):
+        directory, file_name = os.path.split(name)
+        extension = os.path.splitext(file_name)[1]
+
+        # Hash while writing, so the content is only read once.
+        temporary_root = self.path(self.temporary_directory)
+        os.makedirs(temporary_root, exist_ok=True)
+        descriptor, temporary_path = tempfile.mkstemp(dir=temporary_root)
+        try:
+            digest = hashlib.sha256()
+            with os.fdopen(descriptor, 'wb') as file:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    file.write(chunk)
+
+            name = os.path.join(directory, self.shard(digest.hexdigest() + extension))
+            path = self.path(name)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(temporary_path, self.file_permissions_mode)
+                os.replace(temporary_path, path)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+        return name.replace('\\', '/')
+
+    def get_available_name(self, name, max_length=None):
+        # Equal names mean equal content, so an existing file is never a conflict.
+        return name
+
+    @staticmethod
+    def shard(file_name):
+        return os.path.join(file_name[:2], file_name[2:4], file_name)
+
+    @staticmethod
+    def digest(name):
+        """
+        Returns the SHA-256 digest of a file stored under `name`.
+        """
+        return os.path.splitext(os.path.basename(name))[0]
@@ -1,3 +1,1232 @@
-from django.test import TestCase
+import os
+import json
+import time
+import base64
+import datetime
+import hashlib
+import asyncio
+import tempfile
+import threading
+from unittest import mock, skipUnless
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from cuisines.models import Cuisine
+from diets.models import Diet
+from ingredients.models import Ingredient
+from occasions.models import Occasion
+from recipes.jobs import STATUS_BUCKETS, RenderWorkerPool, claim_job, enqueue_render, requeue_stale_jobs, run_job
+from recipes.models import FileBlob, Recipe, RecipeText, RenderJob
+from recipes.serializers import RecipeSerializer
+from recipes.filters import filter_recipes
+from recipes.extraction import index_recipe_text, pending_recipes
+from recipes.pantry import pantry_index
+from recipes.similarity import similarity_index
+from recipes.displays import DisplayError, DisplayPool
+from recipes.rendering import (
+    RenderCancelled, RenderError, attach_file, download_file, render_fingerprint, run_download
+)
 
-# Create your tests here.
+
+def create_recipes(count, offset=0):
+    cuisine = Cuisine.objects.get_or_create(name='Italian')[0]
+    diet = Diet.objects.get_or_create(name='Vegetarian')[0]
+    ingredients = [
+        Ingredient.objects.get_or_create(name='Tomato')[0],
+        Ingredient.objects.get_or_create(name='Basil')[0],
+    ]
+    occasion = Occasion.objects.get_or_create(name='Dinner')[0]
+
+    recipes = []
+    for index in range(offset, offset + count):
+        recipe = Recipe.objects.create(name='Recipe {}'.format(index))
+        recipe.cuisines.set([cuisine])
+        recipe.diets.set([diet])
+        recipe.ingredients.set(ingredients)
+        recipe.occasions.set([occasion])
+        recipes.append(recipe)
+    return recipes
+
+
+class RecipeQueryCountTests(TestCase):
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_list_query_count_is_constant(self):
+        create_recipes(2)
+        few = self.count_queries('/recipes/')
+        create_recipes(20, offset=2)
+        many = self.count_queries('/recipes/')
+        self.assertEqual(few, many)
+        # The ETag, the recipes and one query per prefetched relation.
+        self.assertEqual(many, 6)
+
+    def test_detail_query_count(self):
+        recipe = create_recipes(1)[0]
+        self.assertEqual(self.count_queries('/recipes/{}/'.format(recipe.pk)), 6)
+
+
+class RecipePaginationTests(TestCase):
+    def test_pages_follow_cursor(self):
+        create_recipes(5)
+        names = []
+        url = '/recipes/?limit=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertLessEqual(len(data['results']), 2)
+            names += [recipe['name'] for recipe in data['results']]
+            url = '/recipes/?limit=2&cursor={}'.format(data['next']) if data['next'] else None
+        self.assertEqual(names, sorted('Recipe {}'.format(index) for index in range(5)))
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/recipes/?cursor=invalid')
+        self.assertEqual(response.status_code, 400)
+
+    def test_malformed_cursor(self):
+        create_recipes(2)
+        positions = [['a', 'x'], [None, None], ['a', True], [1, 1], ['a', 1.5], ['a', 1 << 63], {'name': 'a'}]
+        for position in positions:
+            cursor = base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii')
+            response = self.client.get('/recipes/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 400, position)
+            self.assertEqual(response.json(), {'cursor': ['Invalid cursor.']})
+        cursor = base64.urlsafe_b64encode(json.dumps(['Recipe 0', 1]).encode('utf-8')).decode('ascii')
+        self.assertEqual(self.client.get('/recipes/', {'cursor': cursor}).status_code, 200)
+
+
+class RecipeFilterTests(TestCase):
+    def setUp(self):
+        self.italian = Cuisine.objects.create(name='Italian')
+        self.greek = Cuisine.objects.create(name='Greek')
+        self.pizza = Recipe.objects.create(name='Pizza')
+        self.pizza.cuisines.set([self.italian])
+        self.salad = Recipe.objects.create(name='Salad')
+        self.salad.cuisines.set([self.italian, self.greek])
+        self.soup = Recipe.objects.create(name='Soup')
+
+    def names(self, query):
+        response = self.client.get('/recipes/?' + query)
+        self.assertEqual(response.status_code, 200)
+        return [recipe['name'] for recipe in response.json()['results']]
+
+    def test_any_and_all_of(self):
+        ids = '{},{}'.format(self.italian.pk, self.greek.pk)
+        self.assertEqual(self.names('cuisines=' + ids), ['Pizza', 'Salad'])
+        self.assertEqual(self.names('cuisines_all=' + ids), ['Salad'])
+        self.assertEqual(self.names('cuisines_all={}'.format(self.italian.pk)), ['Pizza', 'Salad'])
+        self.assertEqual(self.names('cuisines={}&diets=1'.format(self.italian.pk)), [])
+
+    def test_created_range(self):
+        Recipe.objects.filter(pk=self.pizza.pk).update(created=datetime.datetime(2020, 5, 1, tzinfo=datetime.timezone.utc))
+        self.assertEqual(self.names('created_before=2021-01-01'), ['Pizza'])
+        self.assertEqual(self.names('created_after=2021-01-01T00:00:00Z'), ['Salad', 'Soup'])
+
+    def test_filters_are_one_query(self):
+        with CaptureQueriesContext(connection) as context:
+            self.names('cuisines={}&cuisines_all={}&created_after=2020-01-01'.format(self.italian.pk, self.greek.pk))
+        # One query for the ETag, one for the recipes and one per prefetched relation.
+        self.assertEqual(len(context.captured_queries), 6)
+        self.assertIn('EXISTS', context.captured_queries[1]['sql'])
+        self.assertIn('HAVING', context.captured_queries[1]['sql'])
+
+    def test_invalid_filters(self):
+        response = self.client.get('/recipes/?cuisines=a&created_after=yesterday')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'cuisines', 'created_after'})
+
+    def test_ids_out_of_range(self):
+        too_large = str(1 << 63)
+        for path, arg in (('/recipes/', 'cuisines'), ('/recipes/facets/', 'diets_all'), ('/recipes/pantry-match/', 'ingredients')):
+            response = self.client.get(path, {arg: '1,' + too_large})
+            self.assertEqual(response.status_code, 400, path)
+            self.assertEqual(set(response.json()), {arg})
+            self.assertEqual(self.client.get(path, {arg: str((1 << 63) - 1)}).status_code, 200, path)
+
+    @skipUnless(connection.vendor == 'sqlite', 'The plans are specific to SQLite.')
+    def test_plans_use_indexes(self):
+        plan = filter_recipes(Recipe.objects.all(), {'ingredients': '1,2'}).explain()
+        self.assertRegex(plan, r'SEARCH U0 USING COVERING INDEX \S+ \(recipe_id=\? AND ingredient_id=\?\)')
+        plan = filter_recipes(Recipe.objects.all(), {'ingredients_all': '1,2'}).explain()
+        self.assertIn('SEARCH U0 USING COVERING INDEX Recipe_ingredient_recipe_idx (ingredient_id=?)', plan)
+        plan = filter_recipes(Recipe.objects.all(), {'created_after': '2020-01-01', 'created_before': '2021-01-01'}).explain()
+        self.assertIn('SEARCH Recipe USING INDEX Recipe_created_idx (created>? AND created<?)', plan)
+
+
+class RecipeStreamingTests(TestCase):
+    def test_stream_json_array(self):
+        create_recipes(3)
+        response = self.client.get('/recipes/?stream=1')
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([recipe['name'] for recipe in data], ['Recipe 0', 'Recipe 1', 'Recipe 2'])
+
+    def test_stream_ndjson(self):
+        create_recipes(3)
+        response = self.client.get('/recipes/', HTTP_ACCEPT='application/x-ndjson')
+        lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual([json.loads(line)['name'] for line in lines], ['Recipe 0', 'Recipe 1', 'Recipe 2'])
+
+    def test_stream_empty_catalog(self):
+        response = self.client.get('/recipes/?stream=1')
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), [])
+
+
+class RenderJobTests(TestCase):
+    def setUp(self):
+        self.recipe = Recipe.objects.create(name='Pizza', url='https://example.com/pizza')
+
+    def test_enqueue_reuses_waiting_job(self):
+        first = enqueue_render(self.recipe)
+        second = enqueue_render(self.recipe)
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(RenderJob.objects.count(), 1)
+
+    def test_failed_job_is_retried_with_backoff(self):
+        enqueue_render(self.recipe)
+        job = claim_job()
+        self.assertEqual(job.status, RenderJob.RUNNING)
+        self.assertIsNone(claim_job())
+
+        with mock.patch('recipes.jobs.render_recipe', side_effect=RenderError('failed')):
+            job = run_job(job)
+        self.assertEqual(job.status, RenderJob.QUEUED)
+        self.assertGreater(job.run_after, job.started)
+        self.assertIsNone(claim_job())
+
+    @override_settings(RENDER_JOB_LEASE=60, RENDER_MAX_ATTEMPTS=2)
+    def test_stale_jobs_are_requeued_until_out_of_attempts(self):
+        enqueue_render(self.recipe)
+        job = claim_job()
+        self.assertEqual(requeue_stale_jobs(), 0)
+        started = timezone.now() - datetime.timedelta(seconds=120)
+        RenderJob.objects.filter(pk=job.pk).update(started=started)
+        self.assertEqual(requeue_stale_jobs(), 1)
+
+        job = claim_job()
+        self.assertEqual(job.attempts, 2)
+        RenderJob.objects.filter(pk=job.pk).update(started=started)
+        self.assertEqual(requeue_stale_jobs(), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, RenderJob.FAILED)
+        self.assertIsNotNone(job.finished)
+        self.assertIn('worker stopped', job.error)
+
+    def test_pool_requeues_stale_jobs_while_running(self):
+        pool = RenderWorkerPool(concurrency=1, poll_interval=0.01, requeue_interval=0)
+        with mock.patch('recipes.jobs.requeue_stale_jobs') as requeue, \
+                mock.patch('recipes.jobs.close_old_connections'), \
+                mock.patch('recipes.jobs.connections'), \
+                mock.patch.object(pool, 'work', lambda drain: time.sleep(0.1)):
+            pool.run()
+        self.assertGreater(requeue.call_count, 2)
+
+    def test_stopped_pool_waits_for_running_jobs(self):
+        pool = RenderWorkerPool(concurrency=2, poll_interval=0.01, shutdown_timeout=5)
+        finished = []
+
+        def work(drain):
+            pool.stopping.wait()
+            time.sleep(0.05)
+            finished.append(drain)
+
+        with mock.patch('recipes.jobs.requeue_stale_jobs'), \
+                mock.patch('recipes.jobs.connections'), \
+                mock.patch.object(pool, 'work', work):
+            threading.Timer(0.05, pool.stop).start()
+            pool.run()
+        self.assertEqual(finished, [False, False])
+
+    def test_successful_job(self):
+        enqueue_render(self.recipe)
+        with mock.patch('recipes.jobs.render_recipe') as render_recipe:
+            job = run_job(claim_job())
+        self.assertEqual(render_recipe.call_args.args, (self.recipe.pk, self.recipe.url))
+        self.assertEqual(job.status, RenderJob.DONE)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class DisplayPoolTests(TestCase):
+    def test_failed_start_stops_started_displays(self):
+        starts = [None, None, DisplayError('Xvfb did not report a display number.')]
+        with mock.patch('recipes.displays.Display.start', side_effect=starts), \
+                mock.patch('recipes.displays.Display.stop', autospec=True) as stop:
+            pool = DisplayPool(3)
+            with self.assertRaises(DisplayError):
+                pool.start()
+        self.assertEqual(stop.call_count, 2)
+        self.assertFalse(pool.started)
+        self.assertTrue(pool.displays.empty())
+
+        with mock.patch('recipes.displays.Display.start'):
+            pool.start()
+        self.assertEqual(pool.displays.qsize(), 3)
+
+    def test_close_stops_leased_displays(self):
+        with mock.patch('recipes.displays.Display.start'), \
+                mock.patch('recipes.displays.Display.is_healthy', return_value=True), \
+                mock.patch('recipes.displays.Display.stop', autospec=True) as stop:
+            pool = DisplayPool(2)
+            with pool.lease() as display:
+                pool.close()
+                self.assertEqual(stop.call_count, 2)
+            self.assertEqual(stop.call_args.args, (display,))
+            self.assertEqual(stop.call_count, 3)
+        self.assertTrue(pool.displays.empty())
+
+
+class RenderFingerprintTests(TestCase):
+    def setUp(self):
+        self.recipe = Recipe.objects.create(
+            name='Pizza',
+            url='https://example.com/pizza',
+            render_fingerprint=render_fingerprint('https://example.com/pizza')
+        )
+        self.recipe.file.save('pizza.pdf', ContentFile(b'%PDF'))
+
+    def patch(self, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.patch(
+                '/recipes/{}/'.format(self.recipe.pk),
+                data=json.dumps(data),
+                content_type='application/json'
+            )
+
+    def test_unchanged_url_is_not_rendered(self):
+        response = self.patch({'note': 'Needs more basil.'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(RenderJob.objects.exists())
+
+    def test_changed_url_is_rendered(self):
+        response = self.patch({'url': 'https://example.com/margherita'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(RenderJob.objects.get().url, 'https://example.com/margherita')
+
+    def test_missing_file_is_rendered(self):
+        self.recipe.file.storage.delete(self.recipe.file.name)
+        self.patch({'note': 'Needs more basil.'})
+        self.assertTrue(RenderJob.objects.exists())
+
+    def test_forced_render(self):
+        response = self.client.post('/recipes/{}/render/'.format(self.recipe.pk))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], RenderJob.QUEUED)
+
+
+class RenderCancellationTests(TestCase):
+    def test_new_url_cancels_running_render(self):
+        recipe = Recipe.objects.create(name='Pizza', url='https://example.com/pizza')
+        enqueue_render(recipe)
+        running = claim_job()
+
+        recipe.url = 'https://example.com/margherita'
+        recipe.save()
+        queued = enqueue_render(recipe)
+
+        running.refresh_from_db()
+        self.assertEqual(running.status, RenderJob.CANCELLED)
+        self.assertEqual(queued.status, RenderJob.QUEUED)
+
+        with mock.patch('recipes.jobs.render_recipe', side_effect=RenderCancelled()):
+            self.assertEqual(run_job(running).status, RenderJob.CANCELLED)
+
+    def fake_render(self, directory, script):
+        # Stands in for xvfb-run, the output path is the last argument.
+        path = os.path.join(directory, 'xvfb-run')
+        with open(path, 'w') as file:
+            file.write('#!/bin/sh\n' + script)
+        os.chmod(path, 0o755)
+        return mock.patch.dict(os.environ, {'PATH': '{}:{}'.format(directory, os.environ.get('PATH', ''))})
+
+    def test_timeout_kills_render(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with self.fake_render(directory, 'sleep 30\n'), self.settings(RENDER_TIMEOUT=0.5):
+                with self.assertRaises(RenderError):
+                    asyncio.run(download_file('https://example.com', os.path.join(directory, 'out.pdf')))
+
+    def test_cancellation_is_checked_on_the_calling_thread(self):
+        threads = []
+
+        def is_cancelled():
+            threads.append(threading.current_thread())
+            return True
+
+        with tempfile.TemporaryDirectory() as directory:
+            with self.fake_render(directory, 'sleep 30\n'), \
+                    mock.patch('recipes.rendering.CANCEL_POLL_INTERVAL', 0.05):
+                with self.assertRaises(RenderCancelled):
+                    run_download('https://example.com', os.path.join(directory, 'out.pdf'), is_cancelled)
+        self.assertEqual(threads, [threading.current_thread()])
+
+    def test_memory_limit_applies_to_render(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'out.pdf')
+            script = 'for last; do :; done\nulimit -v > "$last"\n'
+            with self.fake_render(directory, script), self.settings(RENDER_MEMORY_LIMIT=1024 ** 3):
+                run_download('https://example.com', path)
+            with open(path) as file:
+                self.assertEqual(file.read().strip(), str(1024 ** 2))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ContentAddressedStorageTests(TestCase):
+    def test_identical_files_are_stored_once(self):
+        first = Recipe.objects.create(name='Pizza', url='https://example.com/pizza')
+        second = Recipe.objects.create(name='Pizza Napoletana', url='https://example.com/pizza')
+        attach_file(first, first.url, ContentFile(b'%PDF-1.4 pizza', name='recipe-1.pdf'))
+        attach_file(second, second.url, ContentFile(b'%PDF-1.4 pizza', name='recipe-2.pdf'))
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertRegex(first.file.name, r'^recipes/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.pdf$')
+        self.assertEqual(FileBlob.objects.get(name=first.file.name).references, 2)
+
+        storage = first.file.storage
+        name = first.file.name
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(FileBlob.objects.exists())
+
+    def test_rerender_with_same_content_keeps_reference_count(self):
+        recipe = Recipe.objects.create(name='Pizza', url='https://example.com/pizza')
+        attach_file(recipe, recipe.url, ContentFile(b'%PDF-1.4 pizza', name='recipe.pdf'))
+        attach_file(recipe, recipe.url, ContentFile(b'%PDF-1.4 pizza', name='recipe.pdf'))
+        recipe.refresh_from_db()
+        self.assertEqual(FileBlob.objects.get(name=recipe.file.name).references, 1)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class RenderStatusTests(TestCase):
+    def setUp(self):
+        self.recipe = Recipe.objects.create(name='Pizza', url='https://example.com/pizza')
+        self.url = '/recipes/{}/render/'.format(self.recipe.pk)
+
+    def test_status_without_job(self):
+        data = self.client.get(self.url).json()
+        self.assertIsNone(data['job'])
+        self.assertTrue(data['version'])
+
+    def test_wait_returns_after_timeout_without_change(self):
+        version = self.client.get(self.url).json()['version']
+        data = self.client.get(self.url, {'since': version, 'wait': 0.3}).json()
+        self.assertEqual(data['version'], version)
+
+    def test_version_changes_with_job_state(self):
+        version = self.client.get(self.url).json()['version']
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue_render(self.recipe)
+        data = self.client.get(self.url, {'since': version, 'wait': 5}).json()
+        self.assertNotEqual(data['version'], version)
+        self.assertEqual(data['job']['status'], RenderJob.QUEUED)
+
+    def test_wait_ignores_changes_of_other_recipes(self):
+        # Shares the status version with the recipe.
+        other = Recipe.objects.create(
+            pk=self.recipe.pk + STATUS_BUCKETS,
+            name='Pasta',
+            url='https://example.com/pasta'
+        )
+        version = self.client.get(self.url).json()['version']
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue_render(other)
+        started = time.monotonic()
+        data = self.client.get(self.url, {'since': version, 'wait': 0.5}).json()
+        self.assertGreaterEqual(time.monotonic() - started, 0.5)
+        self.assertEqual(data['version'], version)
+        self.assertIsNone(data['job'])
+
+    def test_event_stream_ends_with_final_state(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            job = enqueue_render(self.recipe)
+        RenderJob.objects.filter(pk=job.pk).update(status=RenderJob.DONE)
+        response = self.client.get(self.url, HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = b''.join(response.streaming_content).decode('utf-8')
+        self.assertIn('"status":"done"', events)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class RecipeFileTests(TestCase):
+    content = b'%PDF-1.4 ' + bytes(range(256)) * 4
+
+    def setUp(self):
+        self.recipe = Recipe.objects.create(name='Pizza', url='https://example.com/pizza')
+        attach_file(self.recipe, self.recipe.url, ContentFile(self.content, name='recipe.pdf'))
+        self.recipe.refresh_from_db()
+        self.url = '/recipes/{}/file/'.format(self.recipe.pk)
+
+    def test_file_url(self):
+        data = self.client.get('/recipes/{}/'.format(self.recipe.pk)).json()
+        self.assertEqual(data['file_url'], self.url)
+
+    def test_full_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['ETag'], '"{}"'.format(hashlib.sha256(self.content).hexdigest()))
+
+    def test_files_stored_by_name_are_hashed_once(self):
+        name = FileSystemStorage().save('recipes/old.pdf', ContentFile(self.content))
+        Recipe.objects.filter(pk=self.recipe.pk).update(file=name)
+        etag = '"{}"'.format(hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(self.client.get(self.url)['ETag'], etag)
+        self.assertEqual(FileBlob.objects.get(name=name).digest, etag.strip('"'))
+        with mock.patch('recipes.downloads.hash_file') as hash_file:
+            self.assertEqual(self.client.get(self.url)['ETag'], etag)
+        hash_file.assert_not_called()
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/{}'.format(len(self.content)))
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-5:])
+
+    def test_if_range_with_outdated_etag_returns_full_file(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"outdated"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100000-')
+        self.assertEqual(response.status_code, 416)
+
+    @override_settings(RECIPE_FILE_ACCEL='X-Accel-Redirect')
+    def test_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(
+            response['X-Accel-Redirect'],
+            '/protected-media/{}'.format(self.recipe.file.name)
+        )
+
+
+class RecipeWriteTests(TestCase):
+    def test_taxonomy_ids_are_resolved_in_one_query_per_relation(self):
+        ingredients = [Ingredient.objects.create(name='Ingredient {}'.format(index)) for index in range(40)]
+        payload = {
+            'name': 'Minestrone',
+            'ingredient_ids': [ingredient.pk for ingredient in ingredients],
+        }
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post('/recipes/', data=json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['ingredients']), 40)
+        lookups = [query['sql'] for query in context.captured_queries if 'FROM "Ingredient"' in query['sql']]
+        # One lookup of the ids, one by set() and one for the response.
+        self.assertEqual(len(lookups), 3)
+        self.assertFalse([sql for sql in lookups if 'WHERE "Ingredient"."id" = ' in sql])
+
+    def test_unknown_ids_are_reported_together(self):
+        cuisine = Cuisine.objects.create(name='Italian')
+        payload = {
+            'name': 'Minestrone',
+            'cuisine_ids': [cuisine.pk, 998, 999],
+            'diet_ids': [997],
+        }
+        response = self.client.post('/recipes/', data=json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.json()['cuisine_ids']), 2)
+        self.assertEqual(len(response.json()['diet_ids']), 1)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_taxonomy_names_are_created_in_one_batch(self):
+        Ingredient.objects.create(name='Ingredient 0')
+        payload = {
+            'name': 'Minestrone',
+            'ingredient_names': ['Ingredient {}'.format(index) for index in range(30)],
+        }
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post('/recipes/', data=json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['ingredients']), 30)
+        self.assertEqual(Ingredient.objects.count(), 30)
+        self.assertLess(len(context.captured_queries), 20)
+
+
+class AtomicRecipeWriteTests(TestCase):
+    def test_render_is_enqueued_after_commit(self):
+        payload = {'name': 'Pizza', 'url': 'https://example.com/pizza'}
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/recipes/', data=json.dumps(payload), content_type='application/json')
+            self.assertEqual(response.status_code, 201)
+            self.assertFalse(RenderJob.objects.exists())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(RenderJob.objects.get().url, 'https://example.com/pizza')
+
+    def test_failed_write_is_rolled_back(self):
+        recipe = Recipe.objects.create(name='Pizza')
+        cuisine = Cuisine.objects.create(name='Italian')
+        serializer = RecipeSerializer(recipe, data={'note': 'Crispy', 'url': 'https://example.com/pizza'}, partial=True)
+        self.assertTrue(serializer.is_valid())
+        with mock.patch.object(Recipe.cuisines.related_manager_cls, 'set', side_effect=RuntimeError), \
+                self.captureOnCommitCallbacks() as callbacks:
+            serializer.validated_data['cuisine_ids'] = [cuisine]
+            with self.assertRaises(RuntimeError):
+                serializer.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.note, '')
+        self.assertEqual(callbacks, [])
+
+
+class RecipeBulkTests(TestCase):
+    def post(self, body, content_type='application/json'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/recipes/bulk/', data=body, content_type=content_type)
+
+    def test_bulk_create_and_update(self):
+        cuisine = Cuisine.objects.create(name='Italian')
+        Recipe.objects.create(name='Pizza', note='Old')
+        payload = [
+            {'name': 'Pizza', 'note': 'New', 'cuisine_ids': [cuisine.pk]},
+            {'name': 'Pasta', 'url': 'https://example.com/pasta', 'cuisine_ids': [cuisine.pk]},
+            {'name': 'Risotto', 'cuisine_ids': [999]},
+            {'note': 'No name'},
+        ]
+        response = self.post(json.dumps(payload))
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], ['updated', 'created', 'invalid', 'invalid'])
+        self.assertIn('cuisine_ids', results[2]['errors'])
+        self.assertIn('name', results[3]['errors'])
+
+        self.assertEqual(Recipe.objects.get(name='Pizza').note, 'New')
+        pasta = Recipe.objects.get(pk=results[1]['id'])
+        self.assertEqual(list(pasta.cuisines.all()), [cuisine])
+        self.assertFalse(Recipe.objects.filter(name='Risotto').exists())
+        self.assertEqual(RenderJob.objects.get().recipe, pasta)
+
+    def test_concurrently_created_names_are_updated(self):
+        in_bulk = Recipe.objects.in_bulk
+
+        def create_concurrently(*args, **kwargs):
+            existing = in_bulk(*args, **kwargs)
+            if not Recipe.objects.filter(name='Pasta').exists():
+                # Another request creates the recipe after it was looked up.
+                Recipe.objects.create(name='Pasta', note='Concurrent')
+            return existing
+
+        payload = [{'name': 'Pasta', 'note': 'Bulk'}, {'name': 'Salad'}]
+        with mock.patch.object(Recipe.objects, 'in_bulk', side_effect=create_concurrently):
+            response = self.post(json.dumps(payload))
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], ['updated', 'created'])
+        pasta = Recipe.objects.get(name='Pasta')
+        self.assertEqual(results[0]['id'], pasta.pk)
+        self.assertEqual(pasta.note, 'Bulk')
+        self.assertEqual(results[1]['id'], Recipe.objects.get(name='Salad').pk)
+
+    def test_query_count_does_not_grow_with_items(self):
+        ingredient = Ingredient.objects.create(name='Tomato')
+
+        def count(names):
+            payload = '\n'.join(
+                json.dumps({'name': name, 'ingredient_ids': [ingredient.pk]})
+                for name in names
+            )
+            with CaptureQueriesContext(connection) as context:
+                response = self.post(payload, content_type='application/x-ndjson')
+            self.assertEqual(response.status_code, 200)
+            return len(context.captured_queries)
+
+        few = count(['Recipe {}'.format(index) for index in range(2)])
+        many = count(['Recipe {}'.format(index) for index in range(2, 102)])
+        self.assertEqual(few, many)
+        self.assertEqual(Recipe.objects.filter(ingredients=ingredient).count(), 102)
+
+    def test_update_query_count_does_not_grow_with_items(self):
+        recipes = Recipe.objects.bulk_create([
+            Recipe(name='Recipe {}'.format(index), note='Old', url='https://example.com/{}'.format(index))
+            for index in range(102)
+        ])
+
+        def count(recipes):
+            payload = '\n'.join(
+                json.dumps({'name': recipe.name, 'note': 'New', 'url': recipe.url})
+                for recipe in recipes
+            )
+            with mock.patch('recipes.bulk.enqueue_renders') as enqueue_renders, \
+                    CaptureQueriesContext(connection) as context:
+                response = self.post(payload, content_type='application/x-ndjson')
+            self.assertEqual(response.status_code, 200)
+            # Only the notes changed, no render is needed.
+            self.assertEqual(enqueue_renders.call_args.args, ([],))
+            updates = [query for query in context.captured_queries if query['sql'].startswith('UPDATE "Recipe"')]
+            self.assertEqual(len(updates), 1)
+            return len(context.captured_queries)
+
+        self.assertEqual(count(recipes[:2]), count(recipes[2:]))
+        self.assertEqual(Recipe.objects.filter(note='New').count(), 102)
+        self.assertGreater(Recipe.objects.get(pk=recipes[0].pk).updated, recipes[0].updated)
+        # Unchanged recipes aren't written at all.
+        with CaptureQueriesContext(connection) as context:
+            self.post('\n'.join(json.dumps({'name': recipe.name, 'note': 'New'}) for recipe in recipes),
+                      content_type='application/x-ndjson')
+        self.assertFalse([query for query in context.captured_queries if query['sql'].startswith('UPDATE')])
+
+    def test_taxonomy_names(self):
+        diet = Diet.objects.create(name='Vegan')
+        payload = [
+            {'name': 'Pizza', 'diet_ids': [diet.pk], 'diet_names': ['Vegan', 'Vegetarian']},
+            {'name': 'Pasta', 'diet_names': ['Vegetarian']},
+        ]
+        results = self.post(json.dumps(payload)).json()['results']
+        self.assertEqual(Diet.objects.count(), 2)
+        pizza = Recipe.objects.get(pk=results[0]['id'])
+        self.assertEqual([diet.name for diet in pizza.diets.all()], ['Vegan', 'Vegetarian'])
+        pasta = Recipe.objects.get(pk=results[1]['id'])
+        self.assertEqual([diet.name for diet in pasta.diets.all()], ['Vegetarian'])
+
+    def test_body_must_be_a_list(self):
+        response = self.post(json.dumps({'name': 'Pizza'}))
+        self.assertEqual(response.status_code, 400)
+
+
+class RecipeTagTests(TestCase):
+    def post(self, payload):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/recipes/tags/', data=json.dumps(payload), content_type='application/json')
+
+    def test_add_to_many_recipes(self):
+        recipes = create_recipes(20)
+        vegan = Diet.objects.create(name='Vegan')
+        with CaptureQueriesContext(connection) as context:
+            response = self.post({
+                'relation': 'diets',
+                'action': 'add',
+                'ids': [vegan.pk],
+                'names': ['Vegetarian'],
+                'recipe_ids': [recipe.pk for recipe in recipes],
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'recipes': 20})
+        self.assertEqual(Recipe.objects.filter(diets=vegan).count(), 20)
+        self.assertEqual(Recipe.objects.filter(diets__name='Vegetarian').count(), 20)
+        inserts = [query['sql'] for query in context.captured_queries if query['sql'].startswith('INSERT') and 'INTO "Recipe_diets"' in query['sql']]
+        self.assertEqual(len(inserts), 1)
+        self.assertFalse(RenderJob.objects.exists())
+
+    def test_remove_from_filtered_recipes(self):
+        create_recipes(3)
+        other = Recipe.objects.create(name='Salad')
+        tomato = Ingredient.objects.get(name='Tomato')
+        other.ingredients.set([tomato])
+        with CaptureQueriesContext(connection) as context:
+            response = self.post({
+                'relation': 'ingredients',
+                'action': 'remove',
+                'names': ['Tomato'],
+                'filter': {'cuisines': [Cuisine.objects.get(name='Italian').pk]},
+            })
+        self.assertEqual(response.json(), {'removed': 3})
+        deletes = [query['sql'] for query in context.captured_queries if query['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 1)
+        self.assertEqual(list(Recipe.objects.filter(ingredients=tomato)), [other])
+        self.assertEqual(Recipe.objects.filter(ingredients__name='Basil').count(), 3)
+
+    def test_invalid_operation(self):
+        response = self.post({'relation': 'diets', 'action': 'add', 'ids': [999], 'recipe_ids': [998]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'ids', 'recipe_ids'})
+        response = self.post({'relation': 'tags', 'action': 'add', 'ids': [1], 'recipe_ids': [1]})
+        self.assertIn('relation', response.json())
+        response = self.post({'relation': 'diets', 'action': 'add', 'ids': [1]})
+        self.assertIn('recipe_ids', response.json())
+
+
+class RecipeSearchTests(TestCase):
+    def search(self, query, **params):
+        response = self.client.get('/recipes/search/', data=dict(params, q=query))
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_ranks_name_above_note(self):
+        Recipe.objects.create(name='Pasta', note='With tomato sauce')
+        Recipe.objects.create(name='Tomato soup', note='Creamy')
+        Recipe.objects.create(name='Salad', note='Green')
+        results = self.search('tomato')
+        self.assertEqual([result['name'] for result in results], ['Tomato soup', 'Pasta'])
+        self.assertGreater(results[0]['score'], results[1]['score'])
+
+    def test_index_follows_writes(self):
+        recipe = Recipe.objects.create(name='Pasta', note='Plain')
+        self.assertEqual(self.search('pesto'), [])
+        recipe.note = 'With pesto'
+        recipe.save()
+        self.assertEqual(len(self.search('pesto')), 1)
+        Recipe.objects.filter(pk=recipe.pk).update(note='Plain')
+        self.assertEqual(self.search('pesto'), [])
+        recipe.delete()
+        self.assertEqual(self.search('pasta'), [])
+
+    @skipUnless(connection.vendor == 'sqlite', 'FTS5 is specific to SQLite.')
+    def test_prefix_snippet_and_plan(self):
+        Recipe.objects.create(name='Lasagne', note='Layers of <pasta> and béchamel')
+        result = self.search('pasta bech')[0]
+        self.assertEqual(result['name'], 'Lasagne')
+        self.assertIn('&lt;<mark>pasta</mark>&gt;', result['snippet'])
+        self.assertIn('<mark>béchamel</mark>', result['snippet'])
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN SELECT rowid FROM "RecipeSearch" WHERE "RecipeSearch" MATCH %s', ['pasta'])
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('VIRTUAL TABLE INDEX', plan)
+
+    def test_operators_are_ignored(self):
+        Recipe.objects.create(name='Pasta')
+        self.assertEqual(len(self.search('"pasta" -(*')), 1)
+
+    def test_query_is_required(self):
+        self.assertEqual(self.client.get('/recipes/search/').status_code, 400)
+        self.assertEqual(self.client.get('/recipes/search/', {'q': 'a', 'limit': 0}).status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class RecipeTextTests(TestCase):
+    texts = {
+        b'%PDF-1.4 risotto': 'Risotto\fStir the arborio rice with saffron until creamy.',
+        b'%PDF-1.4 pesto': 'Crush basil, pine nuts and parmesan.',
+    }
+
+    def attach(self, recipe, content):
+        attach_file(recipe, recipe.url, ContentFile(content, name='recipe.pdf'))
+        recipe.refresh_from_db()
+
+    def extract(self, recipe_id):
+        def extract_text(path):
+            with open(path, 'rb') as file:
+                return self.texts[file.read()].replace('\f', '\n')
+
+        with mock.patch('recipes.extraction.extract_text', side_effect=extract_text) as extract:
+            changed = index_recipe_text(recipe_id)
+        return changed, extract.call_count
+
+    def search(self, query):
+        return self.client.get('/recipes/search/', {'q': query}).json()['results']
+
+    def test_text_is_extracted_once_per_file(self):
+        first = Recipe.objects.create(name='Dinner', url='https://example.com/dinner')
+        second = Recipe.objects.create(name='Lunch', url='https://example.com/dinner')
+        self.attach(first, b'%PDF-1.4 risotto')
+        self.attach(second, b'%PDF-1.4 risotto')
+        self.assertEqual(pending_recipes(), [first.pk, second.pk])
+
+        self.assertEqual(self.extract(first.pk), (True, 1))
+        self.assertEqual(self.extract(first.pk), (False, 0))
+        # The identical pdf of the second recipe is not extracted again.
+        self.assertEqual(self.extract(second.pk), (True, 0))
+        self.assertEqual(pending_recipes(), [])
+        self.assertLess(len(RecipeText.objects.get(pk=first.pk).content), 100)
+
+    def test_text_is_searchable(self):
+        recipe = Recipe.objects.create(name='Dinner', url='https://example.com/dinner')
+        self.attach(recipe, b'%PDF-1.4 risotto')
+        self.extract(recipe.pk)
+        results = self.search('saffron')
+        self.assertEqual([result['name'] for result in results], ['Dinner'])
+        self.assertIn('<mark>saffron</mark>', results[0]['snippet'])
+
+        self.attach(recipe, b'%PDF-1.4 pesto')
+        self.assertEqual(pending_recipes(), [recipe.pk])
+        self.extract(recipe.pk)
+        self.assertEqual(self.search('saffron'), [])
+        self.assertEqual(len(self.search('basil')), 1)
+
+        recipe.delete()
+        self.assertEqual(self.search('basil'), [])
+
+    def test_concurrent_extractions(self):
+        recipe = Recipe.objects.create(name='Dinner', url='https://example.com/dinner')
+        self.attach(recipe, b'%PDF-1.4 risotto')
+        self.extract(recipe.pk)
+        self.attach(recipe, b'%PDF-1.4 pesto')
+
+        results = []
+
+        def extract_text(path):
+            if not results:
+                # Another extraction of the same pdf finishes first.
+                results.append(None)
+                results[0] = index_recipe_text(recipe.pk)
+            with open(path, 'rb') as file:
+                return self.texts[file.read()]
+
+        with mock.patch('recipes.extraction.extract_text', side_effect=extract_text):
+            self.assertFalse(index_recipe_text(recipe.pk))
+        self.assertEqual(results, [True])
+        self.assertEqual(self.search('saffron'), [])
+        self.assertEqual(len(self.search('basil')), 1)
+
+        recipe.release_file()
+        recipe.save()
+        self.assertEqual(self.extract(recipe.pk), (True, 0))
+        self.assertEqual(self.search('basil'), [])
+
+    def test_text_of_released_file_is_removed(self):
+        recipe = Recipe.objects.create(name='Dinner', url='https://example.com/dinner')
+        self.attach(recipe, b'%PDF-1.4 pesto')
+        self.extract(recipe.pk)
+        recipe.release_file()
+        recipe.save()
+        self.assertEqual(pending_recipes(), [recipe.pk])
+        self.assertEqual(self.extract(recipe.pk), (True, 0))
+        self.assertEqual(self.search('basil'), [])
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    PANTRY_REFRESH_INTERVAL=60
+)
+class RecipePantryTests(TestCase):
+    def setUp(self):
+        pantry_index.reset()
+        self.addCleanup(pantry_index.reset)
+        self.ingredients = {
+            name: Ingredient.objects.create(name=name).pk
+            for name in ['Tomato', 'Basil', 'Pasta', 'Garlic', 'Rice']
+        }
+
+    def create(self, name, *ingredients):
+        recipe = Recipe.objects.create(name=name)
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.ingredients.set([self.ingredients[ingredient] for ingredient in ingredients])
+        return recipe
+
+    def match(self, *ingredients, **params):
+        ids = ','.join(str(self.ingredients[ingredient]) for ingredient in ingredients)
+        response = self.client.get('/recipes/pantry-match/', dict(params, ingredients=ids))
+        self.assertEqual(response.status_code, 200)
+        return [(result['name'], result['covered'], result['missing']) for result in response.json()['results']]
+
+    def test_ranks_by_covered_then_missing(self):
+        self.create('Pasta al pomodoro', 'Pasta', 'Tomato', 'Basil', 'Garlic')
+        self.create('Bruschetta', 'Tomato', 'Basil', 'Garlic')
+        self.create('Tomato rice', 'Tomato', 'Rice')
+        self.create('Garlic rice', 'Garlic', 'Rice')
+        results = self.match('Tomato', 'Basil', 'Garlic')
+        self.assertEqual(results[:2], [('Bruschetta', 3, 0), ('Pasta al pomodoro', 3, 1)])
+        self.assertEqual(sorted(results[2:]), [('Garlic rice', 1, 1), ('Tomato rice', 1, 1)])
+        self.assertEqual(self.match('Tomato', 'Basil', 'Garlic', max_missing=0), [('Bruschetta', 3, 0)])
+        self.assertEqual(self.match('Pasta', limit=1), [('Pasta al pomodoro', 1, 3)])
+
+    def test_matches_the_whole_catalog(self):
+        names = list(self.ingredients)
+        expected = {}
+        for index in range(70):
+            used = [name for bit, name in enumerate(names) if index >> bit & 1]
+            if used:
+                self.create('Recipe {}'.format(index), *used)
+                covered = len(set(used) & {'Tomato', 'Pasta', 'Rice'})
+                if covered:
+                    expected['Recipe {}'.format(index)] = (covered, len(used) - covered)
+        results = self.match('Tomato', 'Pasta', 'Rice', limit=100)
+        self.assertEqual({name: (covered, missing) for name, covered, missing in results}, expected)
+        self.assertEqual(
+            [(covered, missing) for _, covered, missing in results],
+            sorted(expected.values(), key=lambda counts: (-counts[0], counts[1]))
+        )
+
+    def test_index_follows_writes(self):
+        salad = self.create('Salad', 'Tomato')
+        self.assertEqual(self.match('Tomato'), [('Salad', 1, 0)])
+        with self.captureOnCommitCallbacks(execute=True):
+            salad.ingredients.add(self.ingredients['Basil'])
+        self.assertEqual(self.match('Tomato'), [('Salad', 1, 1)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/recipes/tags/', data=json.dumps({
+                'relation': 'ingredients',
+                'action': 'remove',
+                'ids': [self.ingredients['Tomato']],
+                'recipe_ids': [salad.pk],
+            }), content_type='application/json')
+        self.assertEqual(self.match('Tomato'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/recipes/bulk/', data=json.dumps([
+                {'name': 'Risotto', 'ingredient_ids': [self.ingredients['Rice']]},
+            ]), content_type='application/json')
+        self.assertEqual(self.match('Rice'), [('Risotto', 1, 0)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.get(name='Basil').delete()
+            Recipe.objects.get(name='Risotto').delete()
+        self.assertEqual(self.match('Rice'), [])
+        self.assertEqual(pantry_index.ingredients, {})
+
+    def test_slots_of_deleted_recipes_are_reused(self):
+        salad = self.create('Salad', 'Tomato', 'Basil')
+        self.create('Risotto', 'Rice')
+        self.match('Rice')
+        with self.captureOnCommitCallbacks(execute=True):
+            salad.delete()
+        for index in range(3):
+            recipe = self.create('Pasta {}'.format(index), 'Pasta', 'Tomato')
+            self.assertEqual(self.match('Tomato'), [('Pasta {}'.format(index), 1, 1)])
+            with self.captureOnCommitCallbacks(execute=True):
+                recipe.delete()
+        self.assertEqual(len(pantry_index.recipe_ids), 2)
+        self.assertEqual(self.match('Rice', 'Tomato'), [('Risotto', 1, 0)])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/recipes/pantry-match/').status_code, 400)
+        response = self.client.get('/recipes/pantry-match/', {'ingredients': '1,x', 'max_missing': -1, 'limit': 0})
+        self.assertEqual(set(response.json()), {'ingredients', 'max_missing', 'limit'})
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    SIMILARITY_REFRESH_INTERVAL=60
+)
+class RecipeSimilarityTests(TestCase):
+    def setUp(self):
+        similarity_index.reset()
+        self.addCleanup(similarity_index.reset)
+        self.italian = Cuisine.objects.create(name='Italian')
+        self.ingredients = [Ingredient.objects.create(name='Ingredient {}'.format(index)) for index in range(8)]
+
+    def create(self, name, ingredients, cuisines=()):
+        recipe = Recipe.objects.create(name=name)
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.ingredients.set([self.ingredients[index] for index in ingredients])
+            recipe.cuisines.set(cuisines)
+        return recipe
+
+    def similar(self, recipe, **params):
+        response = self.client.get('/recipes/{}/similar/'.format(recipe.pk), params)
+        self.assertEqual(response.status_code, 200)
+        return [(result['name'], result['similarity']) for result in response.json()['results']]
+
+    def test_most_similar_first(self):
+        lasagne = self.create('Lasagne', range(8), [self.italian])
+        self.create('Cannelloni', range(8), [self.italian])
+        self.create('Moussaka', range(7))
+        self.create('Salad', [0, 1])
+        results = self.similar(lasagne)
+        self.assertEqual(results[:2], [('Cannelloni', 1.0), ('Moussaka', 7 / 9)])
+        self.assertNotIn('Lasagne', [name for name, _ in results])
+        self.assertEqual(self.similar(lasagne, k=1), [('Cannelloni', 1.0)])
+
+    def test_index_follows_writes(self):
+        lasagne = self.create('Lasagne', range(6), [self.italian])
+        moussaka = self.create('Moussaka', range(6))
+        self.assertEqual(self.similar(lasagne), [('Moussaka', 6 / 7)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/recipes/tags/', data=json.dumps({
+                'relation': 'cuisines',
+                'action': 'add',
+                'ids': [self.italian.pk],
+                'recipe_ids': [moussaka.pk],
+            }), content_type='application/json')
+        self.assertEqual(self.similar(lasagne), [('Moussaka', 1.0)])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.italian.delete()
+            moussaka.ingredients.remove(self.ingredients[0])
+        self.assertEqual(self.similar(lasagne), [('Moussaka', 5 / 6)])
+        with self.captureOnCommitCallbacks(execute=True):
+            moussaka.delete()
+        self.assertEqual(self.similar(lasagne), [])
+
+    def test_invalid_parameters(self):
+        recipe = self.create('Lasagne', range(2))
+        self.assertEqual(self.client.get('/recipes/999/similar/').status_code, 404)
+        self.assertEqual(self.client.get('/recipes/{}/similar/'.format(recipe.pk), {'k': 0}).status_code, 400)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class RecipeFacetsTests(TestCase):
+    def setUp(self):
+        self.italian = Cuisine.objects.create(name='Italian')
+        self.greek = Cuisine.objects.create(name='Greek')
+        self.vegan = Diet.objects.create(name='Vegan')
+        self.tomato = Ingredient.objects.create(name='Tomato')
+        with self.captureOnCommitCallbacks(execute=True):
+            for name, cuisines, diets in (
+                ('Pasta', [self.italian], [self.vegan]),
+                ('Pizza', [self.italian], []),
+                ('Salad', [self.greek], [self.vegan]),
+            ):
+                recipe = Recipe.objects.create(name=name)
+                recipe.cuisines.set(cuisines)
+                recipe.diets.set(diets)
+                recipe.ingredients.set([self.tomato])
+
+    def facets(self, **params):
+        response = self.client.get('/recipes/facets/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_counts_of_filtered_recipes(self):
+        self.assertEqual(self.facets(), {
+            'cuisines': [
+                {'id': self.italian.pk, 'name': 'Italian', 'count': 2},
+                {'id': self.greek.pk, 'name': 'Greek', 'count': 1},
+            ],
+            'diets': [{'id': self.vegan.pk, 'name': 'Vegan', 'count': 2}],
+            'ingredients': [{'id': self.tomato.pk, 'name': 'Tomato', 'count': 3}],
+            'occasions': [],
+        })
+        facets = self.facets(diets=str(self.vegan.pk))
+        self.assertEqual([facet['count'] for facet in facets['cuisines']], [1, 1])
+        self.assertEqual(facets['ingredients'][0]['count'], 2)
+        self.assertEqual(self.client.get('/recipes/facets/', {'cuisines': 'x'}).status_code, 400)
+
+    def test_cached_per_filters(self):
+        ids = '{},{}'.format(self.italian.pk, self.greek.pk)
+        with self.assertNumQueries(4):
+            first = self.facets(cuisines=ids, limit=5)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.facets(cuisines='{},{}'.format(self.greek.pk, self.italian.pk)), first)
+
+    def test_writes_invalidate(self):
+        self.facets()
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.get(name='Pizza').cuisines.set([self.greek])
+        self.assertEqual([facet['count'] for facet in self.facets()['cuisines']], [2, 1])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tomato.name = 'Tomatoes'
+            self.tomato.save()
+        self.assertEqual(self.facets()['ingredients'][0]['name'], 'Tomatoes')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/recipes/tags/', data=json.dumps({
+                'relation': 'diets',
+                'action': 'remove',
+                'ids': [self.vegan.pk],
+                'recipe_ids': list(Recipe.objects.values_list('pk', flat=True)),
+            }), content_type='application/json')
+        self.assertEqual(self.facets()['diets'], [])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ResponseCacheTests(TransactionTestCase):
+    # Versions are only bumped on commit, which needs real transactions.
+
+    def setUp(self):
+        cache.clear()
+        self.italian = Cuisine.objects.create(name='Italian')
+        self.recipe = Recipe.objects.create(name='Pasta')
+        self.recipe.cuisines.set([self.italian])
+
+    def get(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_repeated_reads_are_hits(self):
+        hits = self.client.get('/cache/').json()['hits']
+        for path in ('/recipes/', '/recipes/{}/'.format(self.recipe.pk), '/cuisines/'):
+            first = self.get(path)
+            self.assertEqual(first['X-Cache'], 'MISS')
+            with self.assertNumQueries(0):
+                second = self.get(path)
+            self.assertEqual(second['X-Cache'], 'HIT')
+            self.assertEqual(second.content, first.content)
+        self.assertEqual(self.get('/recipes/?limit=1')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/recipes/999/').status_code, 404)
+        self.assertEqual(self.client.get('/recipes/999/').status_code, 404)
+
+        statistics = self.client.get('/cache/').json()
+        self.assertEqual(statistics['hits'], hits + 3)
+        self.assertGreaterEqual(statistics['views']['RecipeDetailView']['misses'], 3)
+
+    def test_hits_answer_conditional_requests(self):
+        etag = self.get('/recipes/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/recipes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(self.get('/recipes/')['ETag'], etag)
+
+    def test_writes_invalidate(self):
+        self.get('/recipes/')
+        self.get('/cuisines/')
+        self.italian.name = 'Italiano'
+        self.italian.save()
+        response = self.get('/recipes/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['results'][0]['cuisines'][0]['name'], 'Italiano')
+        self.assertEqual(self.get('/cuisines/')['X-Cache'], 'MISS')
+
+        self.recipe.cuisines.clear()
+        self.assertEqual(self.get('/recipes/').json()['results'][0]['cuisines'], [])
+        self.assertEqual(self.get('/cuisines/')['X-Cache'], 'HIT')
+
+        self.client.post('/recipes/bulk/', data=json.dumps([{'name': 'Pizza'}]), content_type='application/json')
+        self.assertEqual(len(self.get('/recipes/').json()['results']), 2)
+        self.client.post('/cuisines/bulk/', data=json.dumps(['Greek']), content_type='application/json')
+        self.assertEqual(len(self.get('/cuisines/').json()['results']), 2)
+
+
+class RecipeConditionalTests(TestCase):
+    def setUp(self):
+        self.italian = Cuisine.objects.create(name='Italian')
+        self.recipe = Recipe.objects.create(name='Pasta')
+        self.recipe.cuisines.set([self.italian])
+        self.detail = '/recipes/{}/'.format(self.recipe.pk)
+
+    def etag(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_matching_etag_is_not_modified(self):
+        for path in ('/recipes/', self.detail):
+            response = self.client.get(path)
+            self.assertTrue(response.has_header('Last-Modified'))
+            with mock.patch.object(RecipeSerializer, 'to_representation') as to_representation:
+                with self.assertNumQueries(1):
+                    cached = self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(cached.status_code, 304)
+            self.assertEqual(cached['ETag'], response['ETag'])
+            to_representation.assert_not_called()
+
+            cached = self.client.get(path, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+            self.assertEqual(cached.status_code, 304)
+            self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+        self.assertNotEqual(self.etag('/recipes/?limit=1'), self.etag('/recipes/'))
+        self.assertEqual(self.client.get('/recipes/999/').status_code, 404)
+
+    def test_writes_change_the_etag(self):
+        other = Recipe.objects.create(name='Pizza')
+        etags = {self.etag('/recipes/')}
+        detail = self.etag(self.detail)
+        writes = [
+            lambda: Recipe.objects.filter(pk=self.recipe.pk).first().save(),
+            lambda: self.recipe.cuisines.clear(),
+            lambda: self.italian.recipe_set.add(self.recipe),
+            lambda: self.italian.save(),
+            lambda: self.client.post('/recipes/tags/', data=json.dumps({
+                'relation': 'cuisines',
+                'action': 'add',
+                'ids': [self.italian.pk],
+                'recipe_ids': [other.pk],
+            }), content_type='application/json'),
+            lambda: other.delete(),
+        ]
+        for write in writes:
+            write()
+            etag = self.etag('/recipes/')
+            self.assertNotIn(etag, etags)
+            etags.add(etag)
+        # Only the writes to the recipe itself change its ETag.
+        self.assertNotEqual(self.etag(self.detail), detail)
+        self.assertEqual(self.client.get(self.detail, HTTP_IF_NONE_MATCH=self.etag(self.detail)).status_code, 304)
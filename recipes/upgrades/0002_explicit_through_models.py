@@ -0,0 +1,72 @@
+# Upgrades a database created before the link tables of recipes were
+# explicit through models. It is copied to recipes/migrations/ by hand,
+# new databases get the through models from their initial migration.
+from django.db import migrations, models
+import django.db.models.deletion
+
+# The relation, the through model, its field of the related object and the related model.
+RELATIONS = (
+    ('cuisines', 'RecipeCuisine', 'cuisine', 'cuisines.cuisine'),
+    ('diets', 'RecipeDiet', 'diet', 'diets.diet'),
+    ('ingredients', 'RecipeIngredient', 'ingredient', 'ingredients.ingredient'),
+    ('occasions', 'RecipeOccasion', 'occasion', 'occasions.occasion'),
+)
+
+
+def adopt(relation, model, field, target):
+    # The table, its columns and the unique pair exist already, so only
+    # the state changes.
+    return migrations.SeparateDatabaseAndState(state_operations=[
+        migrations.CreateModel(
+            name=model,
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='recipes.recipe')),
+                (field, models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=target)),
+            ],
+            options={
+                'db_table': 'Recipe_{}'.format(relation),
+                'unique_together': {('recipe', field)},
+            },
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name=relation,
+            field=models.ManyToManyField(blank=True, default=[], through='recipes.{}'.format(model), to=target),
+        ),
+    ])
+
+
+def index(relation, model, field, target):
+    # The reversed index replaces the single column indexes.
+    return [
+        migrations.AddIndex(
+            model_name=model.lower(),
+            index=models.Index(fields=[field, 'recipe'], name='Recipe_{}_recipe_idx'.format(field)),
+        ),
+        migrations.AlterField(
+            model_name=model.lower(),
+            name='recipe',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='recipes.recipe'),
+        ),
+        migrations.AlterField(
+            model_name=model.lower(),
+            name=field,
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=target),
+        ),
+    ]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0001_initial'),
+        ('cuisines', '0001_initial'),
+        ('diets', '0001_initial'),
+        ('ingredients', '0001_initial'),
+        ('occasions', '0001_initial'),
+    ]
+
+    operations = [adopt(*relation) for relation in RELATIONS] + [
+        operation for relation in RELATIONS for operation in index(*relation)
+    ]
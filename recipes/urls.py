@@ -1,7 +1,26 @@
 from django.urls import path
-from recipes.views import RecipeListView, RecipeDetailView
+from recipes.views import (
+    RecipeListView,
+    RecipeDetailView,
+    RecipeRenderView,
+    RecipeFileView,
+    RecipeBulkView,
+    RecipeTagView,
+    RecipeSearchView,
+    RecipePantryView,
+    RecipeSimilarView,
+    RecipeFacetsView,
+)
 
 urlpatterns = [
     path('', RecipeListView.as_view()),
+    path('bulk/', RecipeBulkView.as_view()),
+    path('tags/', RecipeTagView.as_view()),
+    path('search/', RecipeSearchView.as_view()),
+    path('facets/', RecipeFacetsView.as_view()),
+    path('pantry-match/', RecipePantryView.as_view()),
     path('<int:pk>/', RecipeDetailView.as_view()),
+    path('<int:pk>/similar/', RecipeSimilarView.as_view()),
+    path('<int:pk>/render/', RecipeRenderView.as_view()),
+    path('<int:pk>/file/', RecipeFileView.as_view(), name='recipe-file'),
 ]
\ No newline at end of file
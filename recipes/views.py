@@ -1,14 +1,86 @@
-from django.http import HttpResponse
+import time
+import hashlib
+from django.http import HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.db import connection
 from django.db.models import QuerySet
-from rest_framework.renderers import JSONRenderer
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework.parsers import JSONParser
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from cuisines.models import Cuisine
+from diets.models import Diet
+from ingredients.models import Ingredient
+from occasions.models import Occasion
 from recipes.models import Recipe
-from recipes.serializers import RecipeSerializer
-from drf_yasg.utils import swagger_auto_schema
+from recipes.serializers import RecipeSerializer, RecipeTagSerializer, RenderJobSerializer
+from recipes.jobs import enqueue_render, wait_for_status
+from recipes.models import RenderJob
+from recipes.downloads import file_response
+from recipes.bulk import bulk_write, parse_ndjson, write_tags
+from recipes.filters import ALL_SUFFIX, RELATIONS, filter_recipes, parse_ids
+from recipes.facets import count_facets
+from recipes.pantry import pantry_index
+from recipes.similarity import similarity_index
+from recipes.search import search_recipes
+from drf_yasg.utils import no_body, swagger_auto_schema
 from drf_yasg import openapi
 from rest_framework.views import APIView
+from rest_framework.settings import api_settings
+from CookbookAPI.pagination import KeysetPagination, paginated_serializer
+from CookbookAPI.conditional import condition
+from CookbookAPI.responsecache import cache_response
+
+# The query parameters of filter_recipes.
+FILTER_PARAMETERS = [
+    openapi.Parameter(
+        name=relation + suffix,
+        in_=openapi.IN_QUERY,
+        description='Comma separated ids of {}, of which a recipe must have {}.'.format(
+            relation,
+            'all' if suffix else 'at least one'
+        ),
+        type=openapi.TYPE_STRING
+    )
+    for relation in RELATIONS
+    for suffix in ('', ALL_SUFFIX)
+] + [
+    openapi.Parameter(
+        name='created_after',
+        in_=openapi.IN_QUERY,
+        description='An ISO 8601 date or date time the recipe was created at or after.',
+        type=openapi.TYPE_STRING
+    ),
+    openapi.Parameter(
+        name='created_before',
+        in_=openapi.IN_QUERY,
+        description='An ISO 8601 date or date time the recipe was created before.',
+        type=openapi.TYPE_STRING
+    ),
+]
+
+
+def recipe_validators(request, pk=None, **kwargs):
+    """
+    Returns the ETag and last modification of the recipe with `pk`, or of
+    the whole catalog for the list, computed from the updated fields and
+    the table versions in a single query.
+    """
+    recipes = Recipe.objects.all() if pk is None else Recipe.objects.filter(pk=pk)
+    versions = recipes.versions()
+    if versions is None or versions[0] is None:
+        # There is nothing to compare, a missing recipe is not cached.
+        return None
+    latest, version, changed = versions
+    identity = ' '.join(str(part) for part in (
+        request.get_full_path(),
+        request.accepted_renderer.format,
+        latest.isoformat(),
+        version,
+        changed.isoformat() if changed else None,
+    ))
+    etag = hashlib.sha256(identity.encode('utf-8')).hexdigest()
+    return etag, max(latest, changed) if changed else latest
 
 
 class JSONResponse(HttpResponse):
@@ -18,19 +90,114 @@ class JSONResponse(HttpResponse):
         super(JSONResponse, self).__init__(content, **kwargs)
 
 
+class StreamingJSONResponse(StreamingHttpResponse):
+    """
+    Streams the serialized objects of consecutive pages either as a single
+    JSON array or as newline delimited JSON, so only one page at a time
+    is held in memory.
+    """
+    def __init__(self, pages, serializer_class, ndjson=False, **kwargs):
+        if ndjson:
+            content = self.render_lines(pages, serializer_class)
+            kwargs['content_type'] = 'application/x-ndjson'
+        else:
+            content = self.render_array(pages, serializer_class)
+            kwargs['content_type'] = 'application/json'
+        super(StreamingJSONResponse, self).__init__(content, **kwargs)
+
+    @staticmethod
+    def render_array(pages, serializer_class):
+        renderer = JSONRenderer()
+        separator = b''
+        yield b'['
+        for page in pages:
+            # Strip the surrounding brackets to join the pages into one array.
+            yield separator + renderer.render(serializer_class(page, many=True).data)[1:-1]
+            separator = b','
+        yield b']'
+
+    @staticmethod
+    def render_lines(pages, serializer_class):
+        renderer = JSONRenderer()
+        for page in pages:
+            yield b''.join(
+                renderer.render(item) + b'\n'
+                for item in serializer_class(page, many=True).data
+            )
+
+
+class NDJSONRenderer(JSONRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+class EventStreamRenderer(BaseRenderer):
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
+
+
 class RecipeListView(APIView):
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [NDJSONRenderer]
+    paginator = KeysetPagination()
+    stream_chunk_size = 500
+
     @csrf_exempt
     @swagger_auto_schema(
-        operation_description="Gets a list of Recipe objects.",
+        operation_description="""
+                              Gets a page of Recipe objects ordered by name. The whole
+                              catalog can be streamed with the stream parameter or by
+                              accepting application/x-ndjson. All filters are combined.
+                              """,
+        manual_parameters=[
+            openapi.Parameter(
+                name='stream',
+                in_=openapi.IN_QUERY,
+                description="""
+                            Set to 1 to stream all recipes as one JSON array
+                            instead of returning a single page.
+                            """,
+                type=openapi.TYPE_INTEGER
+            ),
+        ] + FILTER_PARAMETERS,
         responses={
-            200: RecipeSerializer(many=True)
+            200: paginated_serializer(RecipeSerializer),
+            400: """
+                The limit, cursor or a filter parameter is invalid.
+                """,
         },
         tags=['Recipe'],
     )
+    @cache_response(Recipe, Cuisine, Diet, Ingredient, Occasion)
+    @condition(recipe_validators)
     def get(self, request, *args, **kwargs):
-        objects: QuerySet[Recipe] = Recipe.objects.all()
-        serializer = RecipeSerializer(objects, many=True)
-        return JSONResponse(serializer.data)
+        try:
+            objects: QuerySet[Recipe] = filter_recipes(Recipe.objects.with_relations(), request.GET)
+        except ValidationError as error:
+            return JSONResponse(
+                error.detail,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        ndjson = request.accepted_renderer.format == NDJSONRenderer.format
+        if ndjson or request.GET.get('stream') in ('1', 'true'):
+            return StreamingJSONResponse(
+                self.paginator.iterate_queryset(objects, self.stream_chunk_size),
+                RecipeSerializer,
+                ndjson=ndjson
+            )
+        try:
+            page, next_cursor = self.paginator.paginate_queryset(objects, request)
+        except ValidationError as error:
+            return JSONResponse(
+                error.detail,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        serializer = RecipeSerializer(page, many=True)
+        return JSONResponse(
+            self.paginator.get_paginated_data(serializer.data, next_cursor)
+        )
 
     @csrf_exempt
     @swagger_auto_schema(
@@ -92,6 +259,38 @@ class RecipeListView(APIView):
                     type=openapi.TYPE_ARRAY,
                     items=openapi.Items(type=openapi.TYPE_INTEGER),
                 ),
+                'cuisine_names': openapi.Schema(
+                    description="""
+                                A list of cuisine names in order to link a cuisine
+                                to the recipe, which is created if it doesn't exist yet.
+                                """,
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Items(type=openapi.TYPE_STRING),
+                ),
+                'diet_names': openapi.Schema(
+                    description="""
+                                A list of diet names in order to link a diet
+                                to the recipe, which is created if it doesn't exist yet.
+                                """,
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Items(type=openapi.TYPE_STRING),
+                ),
+                'ingredient_names': openapi.Schema(
+                    description="""
+                                A list of ingredient names in order to link an ingredient
+                                to the recipe, which is created if it doesn't exist yet.
+                                """,
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Items(type=openapi.TYPE_STRING),
+                ),
+                'occasion_names': openapi.Schema(
+                    description="""
+                                A list of occasion names in order to link an occasion
+                                to the recipe, which is created if it doesn't exist yet.
+                                """,
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Items(type=openapi.TYPE_STRING),
+                ),
             },
         ),
         responses={
@@ -130,9 +329,11 @@ class RecipeDetailView(APIView):
         },
         tags=['Recipe'],
     )
+    @cache_response(Recipe, Cuisine, Diet, Ingredient, Occasion)
+    @condition(recipe_validators)
     def get(self, request, pk):
         try:
-            data = Recipe.objects.get(pk=pk)
+            data = Recipe.objects.with_relations().get(pk=pk)
         except Recipe.DoesNotExist:
             return HttpResponse(
                 status=status.HTTP_404_NOT_FOUND
@@ -200,6 +401,38 @@ class RecipeDetailView(APIView):
                     type=openapi.TYPE_ARRAY,
                     items=openapi.Items(type=openapi.TYPE_INTEGER),
                 ),
+                'cuisine_names': openapi.Schema(
+                    description="""
+                                A list of cuisine names in order to link a cuisine
+                                to the recipe, which is created if it doesn't exist yet.
+                                """,
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Items(type=openapi.TYPE_STRING),
+                ),
+                'diet_names': openapi.Schema(
+                    description="""
+                                A list of diet names in order to link a diet
+                                to the recipe, which is created if it doesn't exist yet.
+                                """,
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Items(type=openapi.TYPE_STRING),
+                ),
+                'ingredient_names': openapi.Schema(
+                    description="""
+                                A list of ingredient names in order to link an ingredient
+                                to the recipe, which is created if it doesn't exist yet.
+                                """,
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Items(type=openapi.TYPE_STRING),
+                ),
+                'occasion_names': openapi.Schema(
+                    description="""
+                                A list of occasion names in order to link an occasion
+                                to the recipe, which is created if it doesn't exist yet.
+                                """,
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Items(type=openapi.TYPE_STRING),
+                ),
             },
         ),
         responses={
@@ -295,6 +528,38 @@ class RecipeDetailView(APIView):
                     type=openapi.TYPE_ARRAY,
                     items=openapi.Items(type=openapi.TYPE_INTEGER),
                 ),
+                'cuisine_names': openapi.Schema(
+                    description="""
+                                A list of cuisine names in order to link a cuisine
+                                to the recipe, which is created if it doesn't exist yet.
+                                """,
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Items(type=openapi.TYPE_STRING),
+                ),
+                'diet_names': openapi.Schema(
+                    description="""
+                                A list of diet names in order to link a diet
+                                to the recipe, which is created if it doesn't exist yet.
+                                """,
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Items(type=openapi.TYPE_STRING),
+                ),
+                'ingredient_names': openapi.Schema(
+                    description="""
+                                A list of ingredient names in order to link an ingredient
+                                to the recipe, which is created if it doesn't exist yet.
+                                """,
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Items(type=openapi.TYPE_STRING),
+                ),
+                'occasion_names': openapi.Schema(
+                    description="""
+                                A list of occasion names in order to link an occasion
+                                to the recipe, which is created if it doesn't exist yet.
+                                """,
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Items(type=openapi.TYPE_STRING),
+                ),
             },
         ),
         responses={
@@ -351,3 +616,605 @@ class RecipeDetailView(APIView):
 
         data.delete()
         return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+
+
+class RecipeRenderView(APIView):
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [EventStreamRenderer]
+    # Limits how long a single request may wait for a status change.
+    max_wait = 60
+    max_event_stream = 15 * 60
+    event_stream_heartbeat = 15
+
+    @csrf_exempt
+    @swagger_auto_schema(
+        operation_description="""
+                              Gets the latest render job of a recipe. Pass the version of
+                              a previous response as since and a number of seconds as wait
+                              to wait until the job changes. Clients accepting
+                              text/event-stream receive every change as a server-sent event.
+                              """,
+        manual_parameters=[
+            openapi.Parameter(
+                name='since',
+                in_=openapi.IN_QUERY,
+                description='The version of the status the client already knows.',
+                type=openapi.TYPE_STRING
+            ),
+            openapi.Parameter(
+                name='wait',
+                in_=openapi.IN_QUERY,
+                description='Seconds to wait for a newer version, at most 60.',
+                type=openapi.TYPE_NUMBER
+            ),
+        ],
+        responses={
+            200: openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'version': openapi.Schema(type=openapi.TYPE_STRING),
+                    'job': openapi.Schema(
+                        description='The latest render job or null if the recipe was never rendered.',
+                        type=openapi.TYPE_OBJECT,
+                    ),
+                },
+            ),
+            400: """
+                The wait parameter is invalid.
+                """,
+            404: """
+                The object could not be retrieved, since it doesn't exist.
+                """,
+        },
+        tags=['Recipe'],
+    )
+    def get(self, request, pk):
+        if not Recipe.objects.filter(pk=pk).exists():
+            return HttpResponse(
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        if request.accepted_renderer.format == EventStreamRenderer.format:
+            response = StreamingHttpResponse(
+                self.render_events(pk),
+                content_type='text/event-stream'
+            )
+            response['Cache-Control'] = 'no-cache'
+            return response
+
+        try:
+            wait = min(float(request.GET.get('wait', 0)), self.max_wait)
+        except ValueError:
+            return JSONResponse(
+                {'wait': ['A valid number is required.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return JSONResponse(self.wait_for_change(pk, request.GET.get('since'), wait))
+
+    def get_status(self, pk):
+        job = RenderJob.objects.filter(recipe_id=pk).order_by('-created', '-id').first()
+        job = RenderJobSerializer(job).data if job is not None else None
+        # The status version is shared with other recipes, the version of a
+        # response only changes with the job of this recipe.
+        version = hashlib.sha256(JSONRenderer().render(job)).hexdigest()[:32]
+        return {
+            'version': version,
+            'job': job,
+        }
+
+    def wait_for_change(self, pk, since, timeout):
+        """
+        Returns the status once its version differs from `since` or after
+        `timeout` seconds. Changes of other recipes with the same status
+        version are waited out.
+        """
+        deadline = time.monotonic() + timeout
+        shared = None
+        while True:
+            shared = wait_for_status(pk, shared, max(deadline - time.monotonic(), 0))
+            data = self.get_status(pk)
+            if data['version'] != since or time.monotonic() >= deadline:
+                return data
+
+    def render_events(self, pk):
+        renderer = JSONRenderer()
+        deadline = time.monotonic() + self.max_event_stream
+        shared = None
+        version = None
+        while time.monotonic() < deadline:
+            latest = wait_for_status(pk, shared, self.event_stream_heartbeat)
+            if latest == shared:
+                # Keeps proxies from closing an idle connection.
+                yield b': heartbeat\n\n'
+                continue
+            shared = latest
+            data = self.get_status(pk)
+            # Only send actual changes of this recipe.
+            if data['version'] == version:
+                continue
+            version = data['version']
+            yield b'event: status\ndata: ' + renderer.render(data) + b'\n\n'
+            if data['job'] is not None and data['job']['status'] in RenderJob.FINAL_STATES:
+                return
+
+    @csrf_exempt
+    @swagger_auto_schema(
+        operation_description="""
+                              Queues a new pdf export of the recipes url, even if the
+                              stored file already matches the current url.
+                              """,
+        request_body=no_body,
+        responses={
+            202: RenderJobSerializer(many=False),
+            400: """
+                The recipe has no url which could be rendered.
+                """,
+            404: """
+                The object could not be rendered, since it doesn't exist.
+                """,
+        },
+        tags=['Recipe'],
+    )
+    def post(self, request, pk):
+        try:
+            data = Recipe.objects.get(pk=pk)
+        except Recipe.DoesNotExist:
+            return HttpResponse(
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        job = enqueue_render(data, force=True)
+        if job is None:
+            return JSONResponse(
+                {'url': ['The recipe has no url to render.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        serializer = RenderJobSerializer(job)
+        return JSONResponse(
+            serializer.data,
+            status=status.HTTP_202_ACCEPTED
+        )
+
+
+class RecipeFileView(APIView):
+    @csrf_exempt
+    @swagger_auto_schema(
+        operation_description="""
+                              Downloads the pdf export of a recipe. Supports Range and
+                              If-Range for partial downloads and If-None-Match against
+                              the ETag, which is the SHA-256 of the file.
+                              """,
+        responses={
+            200: 'The pdf export.',
+            206: 'The requested range of the pdf export.',
+            304: 'The file did not change.',
+            404: """
+                The recipe doesn't exist or has no pdf export yet.
+                """,
+            416: 'The requested range is not satisfiable.',
+        },
+        produces=['application/pdf'],
+        tags=['Recipe'],
+    )
+    def get(self, request, pk):
+        try:
+            data = Recipe.objects.get(pk=pk)
+        except Recipe.DoesNotExist:
+            return HttpResponse(
+                status=status.HTTP_404_NOT_FOUND
+            )
+        if not data.has_file:
+            return HttpResponse(
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        response = file_response(request, data.file)
+        response['Content-Disposition'] = 'inline; filename="recipe-{}.pdf"'.format(data.pk)
+        return response
+
+
+class RecipeBulkView(APIView):
+    @csrf_exempt
+    @swagger_auto_schema(
+        operation_description="""
+                              Creates or updates many recipes at once. Accepts a JSON array
+                              or newline delimited JSON (application/x-ndjson) of objects in
+                              the same shape as a single recipe. Recipes are matched by name,
+                              so existing recipes are updated. Invalid items are skipped and
+                              reported, all valid items are written together.
+                              """,
+        request_body=openapi.Schema(
+            type=openapi.TYPE_ARRAY,
+            items=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                required=['name'],
+                properties={
+                    'name': openapi.Schema(type=openapi.TYPE_STRING),
+                    'url': openapi.Schema(type=openapi.TYPE_STRING),
+                    'note': openapi.Schema(type=openapi.TYPE_STRING),
+                    'cuisine_ids': openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Items(type=openapi.TYPE_INTEGER),
+                    ),
+                    'diet_ids': openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Items(type=openapi.TYPE_INTEGER),
+                    ),
+                    'ingredient_ids': openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Items(type=openapi.TYPE_INTEGER),
+                    ),
+                    'occasion_ids': openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Items(type=openapi.TYPE_INTEGER),
+                    ),
+                    'cuisine_names': openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Items(type=openapi.TYPE_STRING),
+                    ),
+                    'diet_names': openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Items(type=openapi.TYPE_STRING),
+                    ),
+                    'ingredient_names': openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Items(type=openapi.TYPE_STRING),
+                    ),
+                    'occasion_names': openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Items(type=openapi.TYPE_STRING),
+                    ),
+                },
+            ),
+        ),
+        responses={
+            200: openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'results': openapi.Schema(
+                        description="""
+                                    One result per item in the order of the request, with
+                                    the status created, updated or invalid and either the
+                                    id of the recipe or the validation errors.
+                                    """,
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Schema(type=openapi.TYPE_OBJECT),
+                    ),
+                },
+            ),
+            400: """
+                The request body is not a list of recipes.
+                """,
+        },
+        tags=['Recipe'],
+    )
+    def post(self, request):
+        if request.content_type.split(';')[0].strip() == NDJSONRenderer.media_type:
+            payloads = parse_ndjson(request.stream or [])
+        else:
+            payloads = JSONParser().parse(request)
+            if not isinstance(payloads, list):
+                return JSONResponse(
+                    {'non_field_errors': ['Expected a list of recipes.']},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        return JSONResponse({'results': bulk_write(payloads)})
+
+
+class RecipeTagView(APIView):
+    @csrf_exempt
+    @swagger_auto_schema(
+        operation_description="""
+                              Adds cuisines, diets, ingredients or occasions to many recipes
+                              or removes them, without touching the recipes themselves. The
+                              recipes are given by id or selected by a filter, which maps
+                              relations to ids and matches recipes linked to any of them.
+                              """,
+        request_body=RecipeTagSerializer,
+        responses={
+            200: openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'recipes': openapi.Schema(
+                        description='The number of recipes the entries were added to.',
+                        type=openapi.TYPE_INTEGER,
+                    ),
+                    'removed': openapi.Schema(
+                        description='The number of links which were removed.',
+                        type=openapi.TYPE_INTEGER,
+                    ),
+                },
+            ),
+            400: """
+                The required request parameters are not met or an expected 
+                object could not be retrieved from the data store.
+                """,
+        },
+        tags=['Recipe'],
+    )
+    def post(self, request):
+        data = JSONParser().parse(request)
+        serializer = RecipeTagSerializer(data=data)
+        if serializer.is_valid():
+            return JSONResponse(write_tags(serializer.validated_data))
+        return JSONResponse(
+            serializer.errors,
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+
+class RecipeSearchView(APIView):
+    default_limit = 20
+    max_limit = 100
+
+    @csrf_exempt
+    @swagger_auto_schema(
+        operation_description="""
+                              Searches the name and note of all recipes. Every word of the
+                              query must match, the last one may be the beginning of a word.
+                              The best matches come first, each with a snippet in which the
+                              matching words are marked.
+                              """,
+        manual_parameters=[
+            openapi.Parameter(
+                name='q',
+                in_=openapi.IN_QUERY,
+                description='The words to search for.',
+                type=openapi.TYPE_STRING,
+                required=True
+            ),
+            openapi.Parameter(
+                name='limit',
+                in_=openapi.IN_QUERY,
+                description='The maximum number of results, at most 100.',
+                type=openapi.TYPE_INTEGER
+            ),
+        ],
+        responses={
+            200: openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'results': openapi.Schema(
+                        description="""
+                                    The matching recipes with their score and an HTML
+                                    snippet, in which matches are wrapped in mark tags.
+                                    """,
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Schema(type=openapi.TYPE_OBJECT),
+                    ),
+                },
+            ),
+            400: """
+                The query or limit parameter is invalid.
+                """,
+        },
+        tags=['Recipe'],
+    )
+    def get(self, request):
+        query = request.GET.get('q', '').strip()
+        if not query:
+            return JSONResponse(
+                {'q': ['This parameter is required.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            limit = int(request.GET.get('limit', self.default_limit))
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= self.max_limit:
+            return JSONResponse(
+                {'limit': ['Ensure this value is between 1 and {}.'.format(self.max_limit)]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        matches = search_recipes(connection, query, limit)
+        recipes = Recipe.objects.with_relations().in_bulk([pk for pk, _, _ in matches])
+        results = []
+        for pk, score, snippet in matches:
+            if pk not in recipes:
+                continue
+            data = RecipeSerializer(recipes[pk]).data
+            data['score'] = score
+            data['snippet'] = snippet
+            results.append(data)
+        return JSONResponse({'results': results})
+
+
+class RecipePantryView(APIView):
+    default_limit = 20
+    max_limit = 100
+
+    @csrf_exempt
+    @swagger_auto_schema(
+        operation_description="""
+                              Finds the recipes which can be cooked with the given ingredients.
+                              Recipes covering most of the ingredients come first, then those
+                              missing fewest of their own ingredients.
+                              """,
+        manual_parameters=[
+            openapi.Parameter(
+                name='ingredients',
+                in_=openapi.IN_QUERY,
+                description='A comma separated list of the ids of the available ingredients.',
+                type=openapi.TYPE_STRING,
+                required=True
+            ),
+            openapi.Parameter(
+                name='max_missing',
+                in_=openapi.IN_QUERY,
+                description='Only recipes missing at most this number of ingredients.',
+                type=openapi.TYPE_INTEGER
+            ),
+            openapi.Parameter(
+                name='limit',
+                in_=openapi.IN_QUERY,
+                description='The maximum number of results, at most 100.',
+                type=openapi.TYPE_INTEGER
+            ),
+        ],
+        responses={
+            200: openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'results': openapi.Schema(
+                        description="""
+                                    The matching recipes with the number of covered
+                                    and missing ingredients.
+                                    """,
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Schema(type=openapi.TYPE_OBJECT),
+                    ),
+                },
+            ),
+            400: """
+                The ingredients, max_missing or limit parameter is invalid.
+                """,
+        },
+        tags=['Recipe'],
+    )
+    def get(self, request):
+        errors = {}
+        try:
+            ingredient_ids = parse_ids(request.GET.get('ingredients', ''))
+        except ValueError:
+            errors['ingredients'] = ['A comma separated list of ids is required.']
+        try:
+            limit = int(request.GET.get('limit', self.default_limit))
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= self.max_limit:
+            errors['limit'] = ['Ensure this value is between 1 and {}.'.format(self.max_limit)]
+        max_missing = request.GET.get('max_missing', None)
+        try:
+            max_missing = int(max_missing) if max_missing is not None else None
+        except ValueError:
+            max_missing = -1
+        if max_missing is not None and max_missing < 0:
+            errors['max_missing'] = ['A non-negative integer is required.']
+        if errors:
+            return JSONResponse(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        matches = pantry_index.match(ingredient_ids, limit, max_missing)
+        recipes = Recipe.objects.with_relations().in_bulk([pk for pk, _, _ in matches])
+        results = []
+        for pk, covered, missing in matches:
+            if pk not in recipes:
+                continue
+            data = RecipeSerializer(recipes[pk]).data
+            data['covered'] = covered
+            data['missing'] = missing
+            results.append(data)
+        return JSONResponse({'results': results})
+
+
+class RecipeSimilarView(APIView):
+    default_k = 10
+    max_k = 50
+
+    @csrf_exempt
+    @swagger_auto_schema(
+        operation_description="""
+                              Finds the recipes with the most similar cuisines, diets, ingredients
+                              and occasions, the most similar first. Recipes sharing less than
+                              about half of them are rarely found.
+                              """,
+        manual_parameters=[
+            openapi.Parameter(
+                name='k',
+                in_=openapi.IN_QUERY,
+                description='The maximum number of results, at most 50.',
+                type=openapi.TYPE_INTEGER
+            ),
+        ],
+        responses={
+            200: openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'results': openapi.Schema(
+                        description="""
+                                    The similar recipes with their Jaccard similarity
+                                    between 0 and 1.
+                                    """,
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Schema(type=openapi.TYPE_OBJECT),
+                    ),
+                },
+            ),
+            400: """
+                The k parameter is invalid.
+                """,
+            404: """
+                The object could not be retrieved, since it doesn't exist.
+                """,
+        },
+        tags=['Recipe'],
+    )
+    def get(self, request, pk):
+        if not Recipe.objects.filter(pk=pk).exists():
+            return HttpResponse(
+                status=status.HTTP_404_NOT_FOUND
+            )
+        try:
+            k = int(request.GET.get('k', self.default_k))
+        except ValueError:
+            k = 0
+        if not 0 < k <= self.max_k:
+            return JSONResponse(
+                {'k': ['Ensure this value is between 1 and {}.'.format(self.max_k)]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        matches = similarity_index.similar(pk, k)
+        recipes = Recipe.objects.with_relations().in_bulk([pk for pk, _ in matches])
+        results = []
+        for pk, similarity in matches:
+            if pk not in recipes:
+                continue
+            data = RecipeSerializer(recipes[pk]).data
+            data['similarity'] = similarity
+            results.append(data)
+        return JSONResponse({'results': results})
+
+
+class RecipeFacetsView(APIView):
+    @csrf_exempt
+    @swagger_auto_schema(
+        operation_description="""
+                              Counts the recipes matching the filters for every cuisine, diet,
+                              ingredient and occasion, the most frequent first. Takes the same
+                              filters as the list of recipes.
+                              """,
+        manual_parameters=FILTER_PARAMETERS,
+        responses={
+            200: openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    relation: openapi.Schema(
+                        description='The {} of the matching recipes with their number of recipes.'.format(relation),
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Schema(
+                            type=openapi.TYPE_OBJECT,
+                            properties={
+                                'id': openapi.Schema(type=openapi.TYPE_INTEGER),
+                                'name': openapi.Schema(type=openapi.TYPE_STRING),
+                                'count': openapi.Schema(type=openapi.TYPE_INTEGER),
+                            },
+                        ),
+                    )
+                    for relation in RELATIONS
+                },
+            ),
+            400: """
+                A filter parameter is invalid.
+                """,
+        },
+        tags=['Recipe'],
+    )
+    def get(self, request):
+        try:
+            facets = count_facets(request.GET)
+        except ValidationError as error:
+            return JSONResponse(
+                error.detail,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return JSONResponse(facets)
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from sync.models import Change
+from sync.signals import MODELS
+
+# The number of ids read per query.
+BATCH_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = 'Records an upsert of every existing object, so a full sync of a database created before the change log is complete.'
+
+    def handle(self, *args, **options):
+        for model in MODELS:
+            count = 0
+            last = 0
+            while True:
+                ids = list(
+                    model.objects.filter(pk__gt=last).order_by('pk').values_list('pk', flat=True)[:BATCH_SIZE]
+                )
+                if not ids:
+                    break
+                with transaction.atomic():
+                    Change.objects.record(model, ids)
+                count += len(ids)
+                last = ids[-1]
+            self.stdout.write('Recorded {} {}.'.format(count, model._meta.verbose_name_plural))
@@ -0,0 +1,83 @@
+from django.db import connection, models, transaction
+
+# The number of changes inserted per statement.
+BATCH_SIZE = 500
+
+
+class ChangeManager(models.Manager):
+    """
+    Sequence numbers are taken in the order of the inserts, not of the
+    commits. On PostgreSQL a client must not read past a change which is
+    still in flight, or it would skip that change once it commits. Every
+    recording transaction therefore holds a shared advisory lock keyed by
+    the last sequence number taken before its own, and readers stop below
+    the lowest of these keys. SQLite serializes write transactions, which
+    makes both orders equal.
+    """
+    def sequence(self):
+        return "pg_get_serial_sequence('\"{}\"', 'seq')::regclass".format(self.model._meta.db_table)
+
+    def record(self, model, ids, deleted=False):
+        """
+        Appends an upsert, or a tombstone if `deleted`, of the objects of
+        `model` with `ids` to the log within the current transaction.
+        """
+        ids = list(ids)
+        if not ids:
+            return
+        name = model._meta.model_name
+        # Its own transaction in autocommit mode, without a savepoint otherwise.
+        with transaction.atomic(savepoint=False):
+            if connection.vendor == 'postgresql':
+                # Once per transaction, later changes get higher numbers.
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        'SELECT pg_advisory_xact_lock_shared(COALESCE(pg_sequence_last_value({}), 0)) '
+                        'WHERE NOT EXISTS (SELECT 1 FROM pg_locks WHERE pid = pg_backend_pid() '
+                        "AND locktype = 'advisory' AND objsubid = 1)".format(self.sequence())
+                    )
+            self.bulk_create(
+                [self.model(model=name, object_id=pk, deleted=deleted) for pk in ids],
+                batch_size=BATCH_SIZE
+            )
+
+    def committed(self):
+        """
+        Returns the changes which can be read without skipping a change
+        that commits later.
+        """
+        changes = self.get_queryset()
+        if connection.vendor != 'postgresql':
+            return changes
+        with connection.cursor() as cursor:
+            # The sequence is read first. A writer which took a number up
+            # to that value held its lock before, and still holds it below
+            # if it hasn't committed.
+            cursor.execute('SELECT COALESCE(pg_sequence_last_value({}), 0)'.format(self.sequence()))
+            watermark = cursor.fetchone()[0]
+            cursor.execute(
+                'SELECT MIN((classid::bigint << 32) | objid::bigint) FROM pg_locks '
+                "WHERE locktype = 'advisory' AND objsubid = 1"
+            )
+            in_flight = cursor.fetchone()[0]
+        if in_flight is not None:
+            watermark = min(watermark, in_flight)
+        return changes.filter(seq__lte=watermark)
+
+
+class Change(models.Model):
+    """
+    An entry of the append-only log of changed recipes, cuisines, diets,
+    ingredients and occasions. Clients sync by reading the entries after
+    the last sequence number they have seen.
+    """
+    seq = models.BigAutoField(primary_key=True)
+    model = models.CharField(max_length=32)
+    object_id = models.IntegerField()
+    deleted = models.BooleanField(default=False)
+    created = models.DateTimeField(auto_now_add=True)
+
+    objects = ChangeManager()
+
+    class Meta:
+        db_table = 'Change'
@@ -0,0 +1,34 @@
+from rest_framework import serializers
+from recipes.models import Recipe
+
+
+class RecipeChangeSerializer(serializers.ModelSerializer):
+    """
+    A recipe as it is synced. Related objects are referred to by their ids
+    and synced on their own, so renaming one doesn't change its recipes.
+    """
+    id = serializers.ReadOnlyField()
+    created = serializers.ReadOnlyField()
+    updated = serializers.ReadOnlyField()
+    file_url = serializers.ReadOnlyField()
+
+    cuisines = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    diets = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    ingredients = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    occasions = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+
+    class Meta:
+        model = Recipe
+        fields = (
+            'id',
+            'created',
+            'updated',
+            'name',
+            'url',
+            'note',
+            'cuisines',
+            'diets',
+            'ingredients',
+            'occasions',
+            'file_url',
+        )
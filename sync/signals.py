@@ -0,0 +1,24 @@
+from django.db.models.signals import post_delete, post_save
+from cuisines.models import Cuisine
+from diets.models import Diet
+from ingredients.models import Ingredient
+from occasions.models import Occasion
+from recipes.models import Recipe
+from sync.models import Change
+
+# Changed relations of recipes are recorded with the updated time of the
+# recipes by recipes.signals and recipes.bulk, bulk writes by their callers.
+MODELS = (Recipe, Cuisine, Diet, Ingredient, Occasion)
+
+
+def record_save(sender, instance, **kwargs):
+    Change.objects.record(sender, [instance.pk])
+
+
+def record_delete(sender, instance, **kwargs):
+    Change.objects.record(sender, [instance.pk], deleted=True)
+
+
+for model in MODELS:
+    post_save.connect(record_save, sender=model)
+    post_delete.connect(record_delete, sender=model)
@@ -0,0 +1,130 @@
+import json
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase
+from cuisines.models import Cuisine
+from ingredients.models import Ingredient
+from recipes.models import Recipe
+from sync.models import Change
+
+
+class SyncTests(TestCase):
+    def setUp(self):
+        self.italian = Cuisine.objects.create(name='Italian')
+        self.tomato = Ingredient.objects.create(name='Tomato')
+        self.recipe = Recipe.objects.create(name='Pasta')
+        self.recipe.cuisines.set([self.italian])
+        self.recipe.ingredients.set([self.tomato])
+
+    def sync(self, since=0, **params):
+        response = self.client.get('/sync/', {'since': since, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def changed(self, data):
+        return [(result['type'], result['id'], result['deleted']) for result in data['results']]
+
+    def test_full_sync(self):
+        data = self.sync()
+        self.assertFalse(data['more'])
+        self.assertEqual(self.changed(data), [
+            ('cuisine', self.italian.pk, False),
+            ('ingredient', self.tomato.pk, False),
+            ('recipe', self.recipe.pk, False),
+        ])
+        recipe = data['results'][-1]['data']
+        self.assertEqual(recipe['name'], 'Pasta')
+        self.assertEqual(recipe['cuisines'], [self.italian.pk])
+        self.assertEqual(recipe['ingredients'], [self.tomato.pk])
+        self.assertEqual(data['results'][0]['data'], {'id': self.italian.pk, 'name': 'Italian'})
+        self.assertEqual(self.sync(data['cursor']), {'results': [], 'cursor': data['cursor'], 'more': False})
+
+    def test_only_changes_since_the_cursor(self):
+        cursor = self.sync()['cursor']
+        other = Recipe.objects.create(name='Pizza')
+        self.italian.name = 'Italiano'
+        self.italian.save()
+        self.tomato.recipe_set.add(other)
+        pk = self.recipe.pk
+        self.recipe.delete()
+
+        data = self.sync(cursor)
+        self.assertEqual(self.changed(data), [
+            ('cuisine', self.italian.pk, False),
+            ('recipe', other.pk, False),
+            ('recipe', pk, True),
+        ])
+        self.assertEqual(data['results'][1]['data']['ingredients'], [self.tomato.pk])
+        self.assertNotIn('data', data['results'][2])
+
+        pk = self.tomato.pk
+        self.tomato.delete()
+        self.assertEqual(self.changed(self.sync(data['cursor'])), [('ingredient', pk, True)])
+
+    def test_pages(self):
+        pages = []
+        cursor = 0
+        while True:
+            data = self.sync(cursor, limit=2)
+            pages.append(self.changed(data))
+            cursor = data['cursor']
+            if not data['more']:
+                break
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(set(sum(pages, [])), set(self.changed(self.sync())))
+
+    def test_upserts_of_deleted_objects_are_tombstones(self):
+        pk = self.recipe.pk
+        self.assertEqual(self.changed(self.sync(limit=3))[-1], ('recipe', pk, False))
+        self.recipe.delete()
+        self.assertEqual(self.changed(self.sync(limit=3))[-1], ('recipe', pk, True))
+
+    def test_bulk_writes_are_recorded(self):
+        cursor = self.sync()['cursor']
+        self.client.post('/cuisines/bulk/', data=json.dumps(['Greek']), content_type='application/json')
+        self.client.post('/recipes/bulk/', data=json.dumps([
+            {'name': 'Pasta', 'note': 'Al dente'},
+            {'name': 'Salad'},
+        ]), content_type='application/json')
+        salad = Recipe.objects.get(name='Salad')
+        data = self.sync(cursor)
+        self.assertEqual(self.changed(data), [
+            ('cuisine', Cuisine.objects.get(name='Greek').pk, False),
+            ('recipe', salad.pk, False),
+            ('recipe', self.recipe.pk, False),
+        ])
+
+        self.client.post('/recipes/tags/', data=json.dumps({
+            'relation': 'ingredients',
+            'action': 'remove',
+            'ids': [self.tomato.pk],
+            'recipe_ids': [self.recipe.pk],
+        }), content_type='application/json')
+        data = self.sync(data['cursor'])
+        self.assertEqual(self.changed(data), [('recipe', self.recipe.pk, False)])
+        self.assertEqual(data['results'][0]['data']['ingredients'], [])
+
+    def test_query_count_is_constant(self):
+        cursor = self.sync()['cursor']
+        for index in range(20):
+            recipe = Recipe.objects.create(name='Recipe {}'.format(index))
+            recipe.cuisines.set([self.italian])
+        Cuisine.objects.create(name='Greek')
+        # The changes, the recipes with one query per relation and the cuisines.
+        with self.assertNumQueries(7):
+            self.assertEqual(len(self.sync(cursor)['results']), 21)
+
+    def test_invalid_parameters(self):
+        response = self.client.get('/sync/', {'since': -1, 'limit': 'a'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'since', 'limit'})
+        self.assertEqual(self.client.get('/sync/', {'limit': 1001}).status_code, 400)
+
+    def test_backfill(self):
+        Change.objects.all().delete()
+        call_command('backfillchanges', stdout=StringIO())
+        self.assertEqual(self.changed(self.sync()), [
+            ('recipe', self.recipe.pk, False),
+            ('cuisine', self.italian.pk, False),
+            ('ingredient', self.tomato.pk, False),
+        ])
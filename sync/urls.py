@@ -0,0 +1,6 @@
+from django.urls import path
+from sync.views import SyncView
+
+urlpatterns = [
+    path('', SyncView.as_view()),
+]
@@ -0,0 +1,150 @@
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.renderers import JSONRenderer
+from rest_framework import status
+from drf_yasg.utils import swagger_auto_schema
+from drf_yasg import openapi
+from rest_framework.views import APIView
+from cuisines.serializers import CuisineSerializer
+from diets.serializers import DietSerializer
+from ingredients.serializers import IngredientSerializer
+from occasions.serializers import OccasionSerializer
+from recipes.filters import RELATIONS
+from sync.models import Change
+from sync.serializers import RecipeChangeSerializer
+
+# The serializer of every model in the log and the relations it prefetches.
+SERIALIZERS = {
+    serializer.Meta.model._meta.model_name: (serializer, prefetch)
+    for serializer, prefetch in (
+        (RecipeChangeSerializer, RELATIONS),
+        (CuisineSerializer, ()),
+        (DietSerializer, ()),
+        (IngredientSerializer, ()),
+        (OccasionSerializer, ()),
+    )
+}
+
+
+class JSONResponse(HttpResponse):
+    def __init__(self, data, **kwargs):
+        content = JSONRenderer().render(data)
+        kwargs['content_type'] = 'application/json'
+        super(JSONResponse, self).__init__(content, **kwargs)
+
+
+def parse_int(value, default, minimum, maximum=None):
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        return None
+    if value < minimum or (maximum is not None and value > maximum):
+        return None
+    return value
+
+
+class SyncView(APIView):
+    default_limit = 500
+    max_limit = 1000
+
+    @csrf_exempt
+    @swagger_auto_schema(
+        operation_description="""
+                              Gets the recipes, cuisines, diets, ingredients and occasions which
+                              changed after the sequence number `since`, in the order of their
+                              changes. Every object is returned once per page with its current
+                              state, or as deleted. Pass the returned cursor as `since` to get
+                              the next page, until `more` is false.
+                              """,
+        manual_parameters=[
+            openapi.Parameter(
+                name='since',
+                in_=openapi.IN_QUERY,
+                description='The cursor of the last sync, 0 or omitted for a full sync.',
+                type=openapi.TYPE_INTEGER
+            ),
+            openapi.Parameter(
+                name='limit',
+                in_=openapi.IN_QUERY,
+                description='The number of changes read at most, up to 1000.',
+                type=openapi.TYPE_INTEGER
+            ),
+        ],
+        responses={
+            200: openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'results': openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Schema(
+                            type=openapi.TYPE_OBJECT,
+                            properties={
+                                'seq': openapi.Schema(type=openapi.TYPE_INTEGER),
+                                'type': openapi.Schema(type=openapi.TYPE_STRING, enum=list(SERIALIZERS)),
+                                'id': openapi.Schema(type=openapi.TYPE_INTEGER),
+                                'deleted': openapi.Schema(type=openapi.TYPE_BOOLEAN),
+                                'data': openapi.Schema(
+                                    description='The object, recipes refer to related objects by id. Missing if deleted.',
+                                    type=openapi.TYPE_OBJECT
+                                ),
+                            },
+                        ),
+                    ),
+                    'cursor': openapi.Schema(type=openapi.TYPE_INTEGER),
+                    'more': openapi.Schema(type=openapi.TYPE_BOOLEAN),
+                },
+            ),
+            400: """
+                The since or limit parameter is invalid.
+                """,
+        },
+        tags=['Sync'],
+    )
+    def get(self, request):
+        since = parse_int(request.GET.get('since'), 0, 0)
+        limit = parse_int(request.GET.get('limit'), self.default_limit, 1, self.max_limit)
+        errors = {}
+        if since is None:
+            errors['since'] = ['Ensure this value is an integer greater than or equal to 0.']
+        if limit is None:
+            errors['limit'] = ['Ensure this value is between 1 and {}.'.format(self.max_limit)]
+        if errors:
+            return JSONResponse(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        changes = list(Change.objects.committed().filter(seq__gt=since).order_by('seq')[:limit + 1])
+        more = len(changes) > limit
+        changes = changes[:limit]
+        # Only the last change of an object matters, its current state is
+        # read anyway.
+        latest = {}
+        for change in changes:
+            latest.pop((change.model, change.object_id), None)
+            latest[(change.model, change.object_id)] = change
+
+        ids = {}
+        for change in latest.values():
+            if not change.deleted and change.model in SERIALIZERS:
+                ids.setdefault(change.model, []).append(change.object_id)
+        objects = {}
+        for name, pks in ids.items():
+            serializer, prefetch = SERIALIZERS[name]
+            objects[name] = serializer.Meta.model.objects.prefetch_related(*prefetch).in_bulk(pks)
+
+        results = []
+        for change in latest.values():
+            instance = objects.get(change.model, {}).get(change.object_id)
+            result = {'seq': change.seq, 'type': change.model, 'id': change.object_id}
+            if instance is None:
+                # Deleted by now, even if the change was an upsert.
+                result['deleted'] = True
+            else:
+                result['deleted'] = False
+                result['data'] = SERIALIZERS[change.model][0](instance).data
+            results.append(result)
+        return JSONResponse({
+            'results': results,
+            'cursor': changes[-1].seq if changes else since,
+            'more': more,
+        })